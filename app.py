@@ -1,8 +1,8 @@
-from flask import Flask, request, jsonify, make_response, render_template
+from flask import Flask, Response, g, request, make_response, render_template, send_from_directory, abort
 import psycopg2
 import datetime
 from functools import wraps
-from jsonschema import validate, ValidationError, SchemaError
+from jsonschema import ValidationError, SchemaError
 import json
 import logging
 import logging.handlers
@@ -15,12 +15,115 @@ from threading import Thread
 from flask_cors import CORS
 
 import os
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
+from db import get_conexao, devolve_conexao, get_pool
+from carregadores import carrega_jogadores, carrega_sets, carrega_set, monta_jogadores, monta_partidas
+from placar import placar_set, pontuacao_set
+from jogadas import grava_jogadas
+from jogadores import grava_jogadores, tupla_jogador, monta_jogador_gravado
+from estatisticas import bloco_estatisticas_jogador, monta_estatisticas
+from paralelo import consultas_paralelas
+from commit_em_grupo import GravadorEmGrupo, JogadaNaoGravada, GravacaoIncerta
+from paginacao import codifica_cursor, decodifica_cursor, le_limite, le_lista_ids
+from respostas import jsonify, codifica, resposta_json, quer_ndjson, resposta_ndjson
+from referencias import referencias
+from cache_relatorios import relatorios
+from condicional import estado_partida, nao_modificada, resposta_nao_modificada, com_validadores, IDADE_IMUTAVEL
+from validacao import valida, validador_jogador, validador_jogadores, validador_partida, validador_jogada, validador_jogadas, validador_config
+from relatorio import bloco_relatorio_v4, agrupa_v4, carrega_relatorio, monta_relatorio, monta_relatorio_colunar, le_formato
+from instrumentacao import Medicao, server_timing, registra, log_consultas_lentas, configura_consultas_lentas
+from metricas import GaugesPorTipo, exposicao
+from midia import armazenamento, RequisicaoComUpload
+import db
+
 
 app = Flask(__name__)
+app.request_class = RequisicaoComUpload
 CORS(app)
 
+# Estado do pool e do cache de relatórios de cada worker, somado entre os workers em /metrics
+gauges_pool = GaugesPorTipo('badminton_pool_conexoes', 'Estado dos pools de conexões')
+gauges_cache_relatorios = GaugesPorTipo('badminton_cache_relatorios', 'Estado dos caches de relatórios')
+
+
+# Registrada antes de devolve_conexao: o Flask executa as funções de teardown em ordem inversa,
+# e os gauges do pool são atualizados depois de a conexão da requisição voltar ao pool
+@app.teardown_appcontext
+def atualiza_gauges(exception=None):
+    """ Registra o estado do pool e do cache de relatórios do worker nos gauges exportados em /metrics """
+
+    gauges_pool.atualiza(get_pool().estatisticas())
+    gauges_cache_relatorios.atualiza(relatorios.estatisticas())
+
+
+app.teardown_appcontext(devolve_conexao)
+
+# Gravação de jogadas com commit em grupo (opcional, configurado em apibadminton.json)
+gravador_jogadas = None
+
+
+@app.before_first_request
+def carrega_referencias():
+    """ Carrega o cache de golpes, tipos de erro e quadrantes na inicialização do worker """
+
+    # No gunicorn o cache é carregado ao iniciar o worker (post_worker_init em gunicorn.conf.py);
+    # antes da primeira requisição apenas no servidor de desenvolvimento ou se aquela carga falhou
+    if referencias.carregado():
+        return
+    try:
+        referencias.carrega()
+    except (Exception, psycopg2.Error) as error:
+        logging.warning('Não foi possível carregar o cache de referências: ' + str(error).rstrip())
+
+
+@app.before_request
+def inicia_medicao():
+    """ Inicia a contagem de comandos SQL e tempos da requisição """
+
+    g.medicao = Medicao(request.url_rule.rule if request.url_rule else 'desconhecida')
+
+
+@app.after_request
+def finaliza_medicao(response):
+    """ Devolve os tempos da requisição no cabeçalho Server-Timing e os registra nos histogramas da rota """
+
+    medicao = g.get('medicao')
+    if medicao is None:
+        return response
+
+    # Corpo gerado durante o envio (NDJSON): os lotes do cursor e as consultas de cada lote ainda não
+    # foram executados. A medição é registrada ao fim do envio e a resposta segue sem Server-Timing,
+    # já que os cabeçalhos partem antes do corpo
+    if response.is_streamed and not response.direct_passthrough:
+        response.call_on_close(lambda: registra(medicao.rota, medicao))
+        return response
+
+    response.headers['Server-Timing'] = server_timing(medicao)
+    registra(medicao.rota, medicao)
+    return response
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """ Devolve o estado do servidor e as estatísticas do pool de conexões do worker """
+
+    estado = {'status': 'ok', 'pid': os.getpid(), 'pool': get_pool().estatisticas()}
+    estado['cache_relatorios'] = relatorios.estatisticas()
+    if gravador_jogadas:
+        estado['commit_em_grupo'] = gravador_jogadas.estatisticas()
+    return jsonify(estado)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """ Devolve as métricas de todos os workers (histogramas por rota, pool e cache) no formato do Prometheus """
+
+    atualiza_gauges()
+    corpo, content_type = exposicao()
+    return Response(corpo, content_type=content_type)
+
 
 @app.route('/post_jogador', methods=['POST'])
 def post_jogador():
@@ -31,64 +134,21 @@ def post_jogador():
     if not data:
         return jsonify({'erro' : 'JSON inválido.'})
 
-    schema = {
-        "type": "object",
-        "required": [ "nome", "data_nascimento", "telefone", "email", "lateralidade", "foto"],
-        "properties": {
-            "nome": {
-                "type": "string",
-                "minLength": 1,
-                "maxLength": 200
-            },
-            "data_nascimento": {
-                "type": "string",
-                "format": "date"
-            },
-            "telefone": {
-                "type": "string",
-                "minLength": 0,
-                "maxLength": 12
-            },
-            "email": {
-                "type": "string",
-                "minLength": 0,
-                "maxLength": 100
-            },
-            "lateralidade": {
-                "type": "string",
-                "enum": ["naoinformado", "destro", "canhoto", "ambidestro"]
-            },
-
-            "foto": {
-                "type": "string",
-                "minLength": 0,
-            }
-          }
-        }
-
     #Verifica se Json é valido (conforme Json-schema).
     try:
-        validate(data, schema)
+        valida(validador_jogador, data)
 
     except ValidationError as e:
         mensagem = 'JSON inválido.' + ' - Path: ' + str(e.path)  + ' - Message: ' + str(e.message)
         return jsonify({'erro' : mensagem})
 
-    # verifica se nome já está cadastrado
-    nome = data["nome"]
-
-    bloco = " select jogador.id, jogador.nome_jogador from jogador where jogador.nome_jogador = %s"
-    sqlvar = (nome,)
-                
+    # Insert no banco de dados: um nome já cadastrado não insere nenhuma linha (ON CONFLICT DO NOTHING)
+    datetimenow = datetime.datetime.now()
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
-        cursor.execute(bloco, sqlvar)
-        jogador_data = cursor.fetchone()
-
-        if jogador_data:
-            return jsonify({'mensagem' : 'Jogador já cadastrado'})
-
+        jogadores_data = grava_jogadores(cursor, [tupla_jogador(data, datetimenow)])
+        connection.commit()
 
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
@@ -98,28 +158,40 @@ def post_jogador():
     finally:
         if (connection):
             cursor.close()
-            connection.close()
-
-    # variáveis com os dados a serem salvos
-    data_nascimento = data["data_nascimento"]
-    telefone = data["telefone"]
-    email = data["email"]
-    lateralidade = data["lateralidade"]
-    foto = 'jogador/' + data["foto"]  # ainda não implementado
+
+    if not jogadores_data:
+        return jsonify({'mensagem' : 'Jogador já cadastrado'})
+
+    # Dados a serem retornados após salvamento do registro
+    return jsonify({'Jogador' : monta_jogador_gravado(jogadores_data[0])})
+
+
+@app.route('/post_jogadores', methods=['POST'])
+def post_jogadores():
+    """ Cria em lote registros de jogadores (ex.: elenco de um clube importado antes de um torneio) """
+
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'erro' : 'JSON inválido.'})
+
+    #Verifica se Json é valido (conforme Json-schema): todos os jogadores são validados de uma vez.
+    try:
+        valida(validador_jogadores, data)
+
+    except ValidationError as e:
+        mensagem = 'JSON inválido.' + ' - Path: ' + str(e.path)  + ' - Message: ' + str(e.message)
+        return jsonify({'erro' : mensagem})
+
+    # Insere todos os jogadores em um único comando e uma única transação
     datetimenow = datetime.datetime.now()
-    
-    # Insert no banco de dados
-    tupla = (nome, data_nascimento, telefone, email, lateralidade, foto, datetimenow, datetimenow)
-    bloco = ("insert into jogador (nome_jogador, data_nascimento, telefone, \
-                email, lateralidade, foto, criado_em, atualizado_em) \
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s) \
-                returning id, nome_jogador, data_nascimento, telefone, \
-                email, lateralidade, foto ")
+    tuplas = [tupla_jogador(jogador, datetimenow) for jogador in data]
+
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
-        cursor.execute(bloco, tupla)
-        data_jogador = cursor.fetchone()
+        jogadores_data = grava_jogadores(cursor, tuplas)
+        connection.commit()
 
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
@@ -128,22 +200,21 @@ def post_jogador():
 
     finally:
         if (connection):
-            connection.commit()
             cursor.close()
-            connection.close()
-    
-    # Dados a serem retornados após salvamento do registro
-    jogador= {}
-    if data_jogador:
-        jogador['id'] = data_jogador[0]
-        jogador['nome'] = data_jogador[1]
-        jogador['data_nascimento'] = data_jogador[2].strftime('%d-%m-%Y')
-        jogador['telefone'] = data_jogador[3]
-        jogador['email'] = data_jogador[4]
-        jogador['lateralidade'] = data_jogador[5]
-        jogador['foto'] = data_jogador[6]
-    
-    return jsonify({'Jogador' : jogador})
+
+    # Devolve os jogadores gravados na ordem recebida e os nomes ignorados por já estarem cadastrados
+    gravados = {line[1]: line for line in jogadores_data}
+    output_jogadores = []
+    ja_cadastrados = []
+    for jogador in data:
+        line = gravados.pop(jogador['nome'], None)
+        if line:
+            output_jogadores.append(monta_jogador_gravado(line))
+        else:
+            ja_cadastrados.append(jogador['nome'])
+
+    return jsonify({'jogadores_gravados': len(output_jogadores), 'jogadores': output_jogadores,
+                    'ja_cadastrados': ja_cadastrados})
 
 
 @app.route('/get_jogador', methods=['GET'])
@@ -169,7 +240,7 @@ def get_jogador():
     sqlvar = (id_jogador,)
                 
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
         cursor.execute(bloco, sqlvar)
         jogadore_data = cursor.fetchone()
@@ -182,22 +253,17 @@ def get_jogador():
     finally:
         if (connection):
             cursor.close()
-            connection.close()
     
     # Devolve dados do jogador pesquisado
     lineout_jogador = {}
     if jogadore_data:    
         lineout_jogador['id'] = jogadore_data[0]
         lineout_jogador['nome'] = jogadore_data[1]
-        lineout_jogador['data_nascimento'] = jogadore_data[2].strftime('%d-%m-%Y')
+        lineout_jogador['data_nascimento'] = jogadore_data[2]
         lineout_jogador['telefone'] = jogadore_data[3]
         lineout_jogador['email'] = jogadore_data[4]
         lineout_jogador['lateralidade'] = jogadore_data[5]
-        foto = jogadore_data[6]
-        if foto:
-            lineout_jogador['foto'] = ''
-        else:
-            lineout_jogador['foto'] = ''
+        lineout_jogador['foto'], lineout_jogador['miniaturas'] = armazenamento.urls_foto(jogadore_data[6])
 
     return jsonify({'badminton' : lineout_jogador})
 
@@ -205,47 +271,74 @@ def get_jogador():
 @app.route('/get_jogadores', methods=['GET'])
 def get_jogadores():
     """ Devolve dados do(s) jogadore(s) conforme id(s) informado(s) 
-        ou devolve todos os jogadores caso parametro esteja vazio"""
+        ou devolve todos os jogadores caso parametro esteja vazio.
+        Com 'limit' a lista é paginada; o cursor 'proximo' deve ser enviado em 'after' """
 
-    # verifica parâmetro recebido
-    lista_id_jogador = None
-    
-    if request.args.get('lista_id_jogador'):
-        lista_id_jogador = (request.args.get('lista_id_jogador')).replace(" ", "").split(',')
-        
-        for jogador in lista_id_jogador:
-            if not jogador.isdigit():
-                return jsonify({'erro' : 'request.args[lista_id_jogador] deve ser numerico'})
+    # verifica parâmetros recebidos
+    try:
+        lista_id_jogador = le_lista_ids(request.args, 'lista_id_jogador')
+        limite = le_limite(request.args)
+        apos = None
+        if request.args.get('after'):
+            apos = decodifica_cursor(request.args.get('after'), 2)
 
-    if not lista_id_jogador:
-        lista_id_jogador = '0'
+    except ValueError as e:
+        return jsonify({'erro' : str(e)})
 
-    # Pesquisa jogadores conforme ids informados no parâmetro
-    posicao = 0
-    blocoi = " select jogador.id, jogador.nome_jogador, jogador.data_nascimento, jogador.telefone, \
+    # Pesquisa jogadores conforme ids informados no parâmetro, ordenados por nome (e id, para desempate)
+    bloco = " select jogador.id, jogador.nome_jogador, jogador.data_nascimento, jogador.telefone, \
                 jogador.email, jogador.lateralidade, jogador.foto \
                 from jogador "
-    blocof = ""
+    condicoes = []
     tupla = ()
- 
-    if lista_id_jogador != '0':
-        for jogador_id in lista_id_jogador:
-            if posicao == 0:
-                blocof = " where jogador.id = %s "
-                tupla = (jogador_id,)
-                posicao += 1
-            else:
-                blocof = blocof + " or jogador.id = %s "
-                tupla = (tupla) + (jogador_id,)
-    
-    bloco = blocoi + blocof + " order by jogador.nome_jogador "
+
+    if lista_id_jogador:
+        condicoes.append(" jogador.id = any(%s) ")
+        tupla = tupla + (lista_id_jogador,)
+
+    # Paginação: continua a partir do último jogador da página anterior
+    if apos:
+        condicoes.append(" (jogador.nome_jogador, jogador.id) > (%s, %s) ")
+        tupla = tupla + tuple(apos)
+
+    if condicoes:
+        bloco = bloco + " where " + " and ".join(condicoes)
+
+    bloco = bloco + " order by jogador.nome_jogador, jogador.id "
+
+    # Em NDJSON os jogadores são enviados à medida que são lidos do banco, sem paginação por cursor
+    if quer_ndjson():
+        if limite:
+            bloco = bloco + " limit %s "
+            tupla = tupla + (limite,)
+
+        try:
+            return resposta_ndjson(bloco, tupla, monta_jogadores)
+
+        except (Exception, psycopg2.Error) as error:
+            erro = str(error).rstrip()
+            erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
+            return jsonify({'erro' : erro_banco})
+
+    # Pesquisa um registro a mais para saber se existe próxima página
+    if limite:
+        bloco = bloco + " limit %s "
+        tupla = tupla + (limite + 1,)
     
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
         cursor.execute(bloco, tupla)
         jogadores_data = cursor.fetchall()
 
+        proximo = None
+        if limite and len(jogadores_data) > limite:
+            jogadores_data = jogadores_data[:limite]
+            proximo = codifica_cursor([jogadores_data[-1][1], jogadores_data[-1][0]])
+
+        # Devolve dados dos jogadores pesquisado
+        output_jogadores = monta_jogadores(cursor, jogadores_data)
+
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
         erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
@@ -254,28 +347,48 @@ def get_jogadores():
     finally:
         if (connection):
             cursor.close()
-            connection.close()
 
-    # Devolve dados dos jogadores pesquisado
-    output_jogadores = []
-    if jogadores_data:
-        for line in jogadores_data:
-            lineout_jogador = {}
-            lineout_jogador['id'] = line[0]
-            lineout_jogador['nome'] = line[1]
-            lineout_jogador['data_nascimento'] = line[2].strftime('%d-%m-%Y')
-            lineout_jogador['telefone'] = line[3]
-            lineout_jogador['email'] = line[4]
-            lineout_jogador['lateralidade'] = line[5]
-            foto = line[6]
-            if foto:
-                lineout_jogador['foto'] = ''
-            else:
-                lineout_jogador['foto'] = ''
-
-            output_jogadores.append(lineout_jogador)
-
-    return jsonify({'jogadores_badminton' : output_jogadores})
+    resposta = {'jogadores_badminton' : output_jogadores}
+    if limite:
+        resposta['proximo'] = proximo
+
+    return jsonify(resposta)
+
+
+@app.route('/get_jogador_estatisticas', methods=['GET'])
+def get_jogador_estatisticas():
+    """ Devolve as estatísticas de carreira do jogador: totais e percentuais de acertos e erros
+        por golpe e por quadrante e quantidade de erros por tipo, em todas as partidas """
+
+    # verifica parâmetro recebido
+    id_jogador = None
+
+    if request.args.get('id_jogador'):
+        id_jogador = request.args.get('id_jogador')
+
+    if not id_jogador:
+        id_jogador = '0'
+
+    if not id_jogador.isdigit():
+        return jsonify({'erro' : 'request.args[id_jogador] deve ser numerico'})
+
+    # Uma única consulta na tabela de estatísticas, atualizada a cada jogada gravada
+    try:
+        connection = get_conexao()
+        cursor = connection.cursor()
+        cursor.execute(bloco_estatisticas_jogador, (id_jogador,))
+        estatisticas_data = cursor.fetchall()
+
+    except (Exception, psycopg2.Error) as error:
+        erro = str(error).rstrip()
+        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
+        return jsonify({'erro' : erro_banco})
+
+    finally:
+        if (connection):
+            cursor.close()
+
+    return jsonify({'estatisticas_jogador' : monta_estatisticas(estatisticas_data)})
 
 
 @app.route('/upload_file', methods=['POST'])
@@ -283,8 +396,12 @@ def upload_file():
     """ Faz upload de arquivo para repositório """
 
     # Verifica se arquivo foi carregado
-    if 'file' not in request.files:
-        return jsonify({'erro' : 'Arquivo não carregado'})
+    try:
+        if 'file' not in request.files:
+            return jsonify({'erro' : 'Arquivo não carregado'})
+    except RequestEntityTooLarge:
+        errormessage = 'Arquivo maior que o limite de ' + str(armazenamento.tamanho_maximo // (1024 * 1024)) + ' MB'
+        return jsonify({'erro' : errormessage})
     
     file = request.files['file']
     
@@ -292,11 +409,10 @@ def upload_file():
         return jsonify({'erro' : 'Arquivo não carregado'})
 
     if file:
-        unique_name = str(uuid.uuid4().hex) + file.filename  # Atribui um nome único ao arquivo
-        filename = secure_filename(unique_name)  # Verifica a segurança do nome do arquivo
-        file.save(os.path.join(config['UPLOAD_PATH'], filename))  # Salva arquivo em repositório remoto
-
-        url_file_uploaded = config['UPLOAD_URL'] + '/' + filename
+        # O arquivo já foi gravado em blocos, com o hash calculado, enquanto o multipart era lido (midia.py)
+        filename, novo = armazenamento.guarda(file.stream, file.filename)
+        if novo:
+            armazenamento.agenda_miniaturas(filename)
 
         # Devolve o nome do arquivo para ser salvo no banco de dados
         lineout = {}
@@ -304,143 +420,103 @@ def upload_file():
         return jsonify({'mensagem' : lineout})
 
 
+@app.route('/media/jogador/<nome>', methods=['GET'])
+def get_media_jogador(nome):
+    """ Devolve a foto de um jogador ou, com 'tamanho', uma das suas miniaturas """
+
+    # Só nomes gravados pelo upload: nunca os temporários (iniciados por '.') nem caminhos
+    if nome.startswith('.') or nome != secure_filename(nome):
+        abort(404)
+
+    # Arquivos nomeados pelo hash do conteúdo (e as suas miniaturas) nunca mudam
+    imutavel = armazenamento.nome_por_conteudo(nome)
+
+    tamanho = request.args.get('tamanho')
+    if tamanho:
+        if not tamanho.isdigit() or int(tamanho) not in armazenamento.miniaturas:
+            tamanhos = ', '.join(str(lado) for lado in armazenamento.miniaturas)
+            return jsonify({'erro' : 'request.args[tamanho] deve ser um dos tamanhos: ' + tamanhos})
+
+        miniatura = armazenamento.nome_miniatura(nome, int(tamanho))
+        if os.path.exists(os.path.join(armazenamento.diretorio, miniatura)):
+            nome = miniatura
+        elif os.path.exists(os.path.join(armazenamento.diretorio, nome)):
+            # Miniatura ainda não gerada (ou foto anterior às miniaturas): devolve a original, sem cache
+            armazenamento.agenda_miniaturas(nome)
+            imutavel = False
+
+    # send_file responde a Range e a If-None-Match / If-Modified-Since; o corpo é enviado pelo
+    # wsgi.file_wrapper do servidor (sendfile no gunicorn)
+    if imutavel:
+        resposta = send_from_directory(armazenamento.diretorio, nome, etag=os.path.splitext(nome)[0])
+        resposta.headers['Cache-Control'] = 'public, max-age=' + str(IDADE_IMUTAVEL) + ', immutable'
+    else:
+        resposta = send_from_directory(armazenamento.diretorio, nome, etag=True)
+        resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+
 @app.route('/get_golpes', methods=['GET'])
 def get_golpes():
     """ Devolve lista de golpes de badminton """
     
-    # Pesquisa todos os golpes de badminton cadastrados
-    bloco = " select golpe.id, golpe.descricao_golpe from golpe "
-                
-    try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-        cursor = connection.cursor()
-        cursor.execute(bloco)
-        golpe_data = cursor.fetchall()
-
-    except (Exception, psycopg2.Error) as error:
-        erro = str(error).rstrip()
-        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-        return jsonify({'erro' : erro_banco})
+    # Golpes e tipos de erros de golpe são servidos do cache de referências
+    def monta():
+        output = {}
+        output['golpes'] = referencias.golpes()
+        output['tipo_erros'] = referencias.tipos_erro()
+        return {'golpes_badminton' : output}
 
-    finally:
-        if (connection):
-            cursor.close()
-            connection.close()
-    # Devolve lista com dados dos golpes de badminton
-    output = {}
-    output_golpe = []
-    if golpe_data:
-        for line in golpe_data:
-            lineout_golpe = {}
-            lineout_golpe['id'] = line[0]
-            lineout_golpe['descricao'] = line[1]
-        
-            output_golpe.append(lineout_golpe)
-
-    output['golpes'] = output_golpe
-    # Pesquisa tipos de erros de golpe
-    bloco = " select tipoerro.id, tipoerro.descricao_erro from tipoerro "
-                
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-        cursor = connection.cursor()
-        cursor.execute(bloco)
-        erro_data = cursor.fetchall()
+        corpo = referencias.codificada('get_golpes', monta)
 
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
         erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
         return jsonify({'erro' : erro_banco})
 
-    finally:
-        if (connection):
-            cursor.close()
-            connection.close()
-
-    # Devolve lista com tipos de erros de golpe
-    output_erro = []
-    if erro_data:
-        for line in erro_data:
-            lineout_erro = {}
-            lineout_erro['id_erro'] = line[0]
-            lineout_erro['descricao'] = line[1]
-        
-            output_erro.append(lineout_erro)
-    output['tipo_erros'] = output_erro
-    return jsonify({'golpes_badminton' : output})
+    return resposta_json(corpo)
 
 
 @app.route('/get_tipoerro', methods=['GET'])
 def get_tipoerro():
     """ Devolve lista de erros de golpe """
     
-    # Pesquisa tipos de erros de golpe
-    bloco = " select tipoerro.id, tipoerro.descricao_erro from tipoerro "
-                
+    # Tipos de erros de golpe são servidos do cache de referências
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-        cursor = connection.cursor()
-        cursor.execute(bloco)
-        erro_data = cursor.fetchall()
+        corpo = referencias.codificada('get_tipoerro', lambda: {'tipo_erros' : referencias.tipos_erro()})
 
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
         erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
         return jsonify({'erro' : erro_banco})
 
-    finally:
-        if (connection):
-            cursor.close()
-            connection.close()
-
-    # Devolve lista com tipos de erros de golpe
-    output_erro = []
-    if erro_data:
-        for line in erro_data:
-            lineout_erro = {}
-            lineout_erro['id_erro'] = line[0]
-            lineout_erro['descricao'] = line[1]
-        
-            output_erro.append(lineout_erro)
-    return jsonify({'tipo_erros' : output_erro})
+    return resposta_json(corpo)
 
 
 @app.route('/get_quadrantes', methods=['GET'])
 def get_quadrantes():
     """ Devolve lista de quadrantes """
     
-    # Pesquisa tods os quadrantes cadastrados
-    bloco = " select quadrante.id, quadrante.descricao_quadrante, quadrante.lado \
-                 from quadrante "
-                
+    # Quadrantes são servidos do cache de referências
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-        cursor = connection.cursor()
-        cursor.execute(bloco)
-        quadrante_data = cursor.fetchall()
+        corpo = referencias.codificada('get_quadrantes', lambda: {'quadrantes' : referencias.quadrantes()})
 
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
         erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
         return jsonify({'erro' : erro_banco})
-
-    finally:
-        if (connection):
-            cursor.close()
-            connection.close()
-
-    # Devolve lista com dados dos quadrantes
-    output_quadrante = []
-    if quadrante_data:
-        for line in quadrante_data:
-            lineout_quadrante = {}
-            lineout_quadrante['id'] = line[0]
-            lineout_quadrante['descricao'] = line[1]
-            lineout_quadrante['lado'] = line[2]
-        
-            output_quadrante.append(lineout_quadrante)
     
-    return jsonify({'quadrantes' : output_quadrante})
+    return resposta_json(corpo)
+
+
+@app.route('/invalida_cache_referencias', methods=['POST'])
+def invalida_cache_referencias():
+    """ Descarta o cache de golpes, tipos de erro e quadrantes deste worker, forçando nova leitura do banco.
+        Os demais workers mantêm os seus caches até o fim do TTL (CACHE_REFERENCIAS_TTL) """
+
+    referencias.invalida()
+    return jsonify({'mensagem' : 'Cache de referências invalidado'})
 
 
 @app.route('/post_partida', methods=['POST'])
@@ -456,49 +532,9 @@ def post_partida():
     data['jogador_adversario_2'] = 0
    
             
-    schema = {
-        "type": "object",
-        "required": ["nome", "data", "tipo_jogo", "modalidade", "jogador_1", "jogador_2", "jogador_adversario_1",  "jogador_adversario_2"],
-        "properties": {
-            "nome": {
-                "type": "string",
-                "minLength": 1,
-                "maxLength": 200
-            },
-            "data": {
-                "type": "string",
-                "format": "date"
-            },
-            "tipo_jogo": {
-                "type": "string",
-                "enum": ["simples", "dupla"]
-            },
-            "modalidade": {
-                "type": "string",
-                "enum": ["misto", "feminino", "masculino"]
-            },
-            "jogador_1": {
-                "type": "integer",
-                "minimum": 1,
-                "exclusiveMaximum": 999999999
-            },
-            "jogador_2": {
-                "type": "integer",
-            },
-            "jogador_adversario_1": {
-                "type": "integer",
-                "minimum": 1,
-                "exclusiveMaximum": 999999999
-            },
-            "jogador_adversario_2": {
-                "type": "integer",
-            }
-        }
-    }
-
     #Verifica se Json é valido (conforme Json-schema).
     try:
-        validate(data, schema)
+        valida(validador_partida, data)
 
     except ValidationError as e:
         mensagem = 'JSON inválido.' + ' - Path: ' + str(e.path)  + ' - Message: ' + str(e.message)
@@ -535,7 +571,7 @@ def post_partida():
                  jogador_adversario_1_id, jogador_adversario_2_id")
 
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
         cursor.execute(bloco, sqlvar)
         data_partida = cursor.fetchone()
@@ -549,14 +585,13 @@ def post_partida():
         if (connection):
             connection.commit()
             cursor.close()
-            connection.close()
 
     # Dados a serem retornados após salvamento do registro
     partida = {}
     if data_partida:
         partida['partida_id'] = data_partida[0]
         partida['nome'] = data_partida[1]
-        partida['data'] = (data_partida[2]).strftime('%d-%m-%Y')
+        partida['data'] = data_partida[2]
         partida['tipo_jogo'] = data_partida[3]
         partida['modalidade'] = data_partida[4]
         partida['jogador_1_id'] = data_partida[5]
@@ -590,13 +625,27 @@ def get_partida():
                 from partida where partida.id = %s"
 
     sqlvar = (id_partida,)
-                
+
+    # Consultas por requisição: 3 (partida, jogadores e sets com a pontuação de cada um),
+    # precedidas da consulta ao estado da partida, que basta para responder 304
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
+        estado = estado_partida(cursor, id_partida=int(id_partida))
+        if nao_modificada(estado):
+            return resposta_nao_modificada(estado)
+
         cursor.execute(bloco, sqlvar)
         partida_data = cursor.fetchone()
 
+        jogadores = {}
+        sets_partida = {}
+        if partida_data:
+            # Jogadores e sets são independentes: pesquisados ao mesmo tempo
+            jogadores, sets_partida = consultas_paralelas(cursor,
+                                                          lambda cursor: carrega_jogadores(cursor, partida_data[5:9]),
+                                                          lambda cursor: carrega_sets(cursor, [partida_data[0]]))
+
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
         erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
@@ -605,317 +654,149 @@ def get_partida():
     finally:
         if (connection):
             cursor.close()
-            connection.close()
     
     
     # Devolve dados da partida pesquisada
     lineout_partida = {}
     
-    if partida_data:  
-        if partida_data:
-            id_partida = partida_data[0] 
-            lineout_partida['id'] = partida_data[0]
-            lineout_partida['data'] = partida_data[1].strftime('%d-%m-%Y')
-            lineout_partida['tipo_jogo'] = partida_data[2]
-            lineout_partida['modalidade'] = partida_data[3]
-            lineout_partida['nome'] = partida_data[4]
-            
-            # Insere dados do jogador: uma partida pode ter dois ou quatro jogadores
-
-            # Pesquisa dados do jogador 1
-            jogador_1 = partida_data[5]
-            if jogador_1:
-                
-                bloco_jogador_1 = " select jogador.nome_jogador, jogador.id from jogador where id = %s " 
-                            
-                tupla_1 = (jogador_1,)
-                try:
-                    connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                    cursor = connection.cursor()
-                    cursor.execute(bloco_jogador_1, tupla_1)
-                    jogador_1_data = cursor.fetchone()
-
-                except (Exception, psycopg2.Error) as error:
-                    erro = str(error).rstrip()
-                    erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                    return jsonify({'erro' : erro_banco})
-
-                finally:
-                    if (connection):
-                        cursor.close()
-                        connection.close()
-
-                lineout_partida['jogador_1'] = {
-                    'nome': jogador_1_data[0],
-                    'id': jogador_1_data[1],
-                }
-            else:
-                lineout_partida['jogador_1'] = {}
-
-            # Pesquisa dados do jogador 2
-            jogador_2 = partida_data[6]
-            if jogador_2:
-            
-                bloco_jogador_2 = " select jogador.nome_jogador, jogador.id from jogador where id = %s " 
-                            
-                tupla_2 = (jogador_2,)
-                try:
-                    connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                    cursor = connection.cursor()
-                    cursor.execute(bloco_jogador_2, tupla_2)
-                    jogador_2_data = cursor.fetchone()
-
-                except (Exception, psycopg2.Error) as error:
-                    erro = str(error).rstrip()
-                    erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                    return jsonify({'erro' : erro_banco})
-
-                finally:
-                    if (connection):
-                        cursor.close()
-                        connection.close()
-
-                lineout_partida['jogador_2'] = {
-                    'nome': jogador_2_data[0],
-                    'id': jogador_2_data[1],
-                }
-            else:
-                lineout_partida['jogador_2'] = {}
-
-
-            # Pesquisa dados do jogador adversario 1
-            jogador_3 = partida_data[7]
-            if jogador_3:
-                bloco_jogador_3 = " select jogador.nome_jogador, jogador.id from jogador where id = %s " 
-                            
-                tupla_3 = (jogador_3,)
-                try:
-                    connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                    cursor = connection.cursor()
-                    cursor.execute(bloco_jogador_3, tupla_3)
-                    jogador_3_data = cursor.fetchone()
-
-                except (Exception, psycopg2.Error) as error:
-                    erro = str(error).rstrip()
-                    erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                    return jsonify({'erro' : erro_banco})
-
-                finally:
-                    if (connection):
-                        cursor.close()
-                        connection.close()
-
-                lineout_partida['jogador_adversario_1'] = {
-                    'nome': jogador_3_data[0],
-                    'id': jogador_3_data[1],
-                }
-
-            else:
-                lineout_partida['jogador_adversario_1'] = {}
-            
-            # Pesquisa dados do jogador adversario 2
-            jogador_4 = partida_data[8]
-            if jogador_4:
-            
-                bloco_jogador_4 = " select jogador.nome_jogador, jogador.id from jogador where id = %s " 
-                            
-                tupla_4 = (jogador_4,)
-                try:
-                    connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                    cursor = connection.cursor()
-                    cursor.execute(bloco_jogador_4, tupla_4)
-                    jogador_4_data = cursor.fetchone()
-
-                except (Exception, psycopg2.Error) as error:
-                    erro = str(error).rstrip()
-                    erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                    return jsonify({'erro' : erro_banco})
-
-                finally:
-                    if (connection):
-                        cursor.close()
-                        connection.close()
-                
-                lineout_partida['jogador_adversario_2'] = {
-                    'nome': jogador_4_data[0],
-                    'id': jogador_4_data[1],
-                }
-                
-            else:
-                lineout_partida['jogador_adversario_2'] = {}
-
-            # Pesquisa os sets da partida
-            bloco = " select set.id, set.ordem from set where set.partida_id = %s "
-
-            sqlvar = (id_partida,)
-                        
-            try:
-                connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                cursor = connection.cursor()
-                cursor.execute(bloco, sqlvar)
-                set_ordem_data = cursor.fetchall()
-                
+    if partida_data:
+        id_partida = partida_data[0] 
+        lineout_partida['id'] = partida_data[0]
+        lineout_partida['data'] = partida_data[1]
+        lineout_partida['tipo_jogo'] = partida_data[2]
+        lineout_partida['modalidade'] = partida_data[3]
+        lineout_partida['nome'] = partida_data[4]
+        
+        # Insere dados do jogador: uma partida pode ter dois ou quatro jogadores
+        lineout_partida['jogador_1'] = jogadores.get(partida_data[5], {})
+        lineout_partida['jogador_2'] = jogadores.get(partida_data[6], {})
+        lineout_partida['jogador_adversario_1'] = jogadores.get(partida_data[7], {})
+        lineout_partida['jogador_adversario_2'] = jogadores.get(partida_data[8], {})
 
-            except (Exception, psycopg2.Error) as error:
-                erro = str(error).rstrip()
-                erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                return jsonify({'erro' : erro_banco})
+        # Devolve os sets relacionados à partida pesquisada
+        output_set = []
+        for set_data in sets_partida[id_partida]:
+            set_partida = {}
+            set_partida['id_set'] = set_data[0]
+            set_partida['ordem_set'] = set_data[1]
 
-            finally:
-                if (connection):
-                    cursor.close()
-                    connection.close()
-           
+            # Devolve pontuação e verifica se o jogo deve continuar ou parar
+            set_partida.update(placar_set(set_data[2], set_data[3]))
+            output_set.append(set_partida)
 
-            # Pesquisa os sets da partida
-            bloco = " select set.id, set.ordem from set where set.partida_id = %s "
+        lineout_partida['sets'] = output_set
 
-            sqlvar = (id_partida,)
-                        
-            try:
-                connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                cursor = connection.cursor()
-                cursor.execute(bloco, sqlvar)
-                set_ordem_data = cursor.fetchall()
-                
+    return com_validadores(jsonify({'partida_badminton' : lineout_partida}), estado)
 
-            except (Exception, psycopg2.Error) as error:
-                erro = str(error).rstrip()
-                erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                return jsonify({'erro' : erro_banco})
 
-            finally:
-                if (connection):
-                    cursor.close()
-                    connection.close()
+@app.route('/get_partidas', methods=['GET'])
+def get_partidas():
+    """ Devolve dados da(s) partidas(s) conforme id(s) informado(s) 
+    ou devolve todas as partidas caso parametro esteja vazio.
+    Filtros opcionais: data_inicio, data_fim, tipo_jogo, modalidade e id_jogador.
+    Com 'limit' a lista é paginada; o cursor 'proximo' deve ser enviado em 'after' """
+    
+    # Verifica parâmetros recebidos
+    try:
+        lista_id_partida = le_lista_ids(request.args, 'lista_id_partida')
+        limite = le_limite(request.args)
+        apos = None
+        if request.args.get('after'):
+            apos = decodifica_cursor(request.args.get('after'), 2)
+
+        data_inicio = None
+        data_fim = None
+        if request.args.get('data_inicio'):
+            data_inicio = datetime.date.fromisoformat(request.args.get('data_inicio'))
+        if request.args.get('data_fim'):
+            data_fim = datetime.date.fromisoformat(request.args.get('data_fim'))
+
+    except ValueError as e:
+        erro = str(e)
+        if not erro.startswith('request.args'):
+            erro = 'request.args[data_inicio/data_fim] deve ser uma data (AAAA-MM-DD)'
+        return jsonify({'erro' : erro})
+
+    id_jogador = request.args.get('id_jogador')
+    if id_jogador and not id_jogador.isdigit():
+        return jsonify({'erro' : 'request.args[id_jogador] deve ser numerico'})
+    
+    # Pesquisa partidas conforme filtros informados, da mais recente para a mais antiga
+    bloco = " select partida.id, partida.data_partida, partida.tipo_jogo, partida.modalidade, partida.nome, \
+                partida.jogador_1_id, partida.jogador_2_id, partida.jogador_adversario_1_id, partida.jogador_adversario_2_id \
+                  from partida " 
+    condicoes = []
+    tupla = ()
 
-            # Devolve os sets relacionados à partida pesquisada
-            output_set = []
-            if set_ordem_data:
-                for set_data in set_ordem_data:
-                    set_partida = {}
-                    id_set = set_data[0]
-                    set_partida['id_set'] = id_set
-                    set_partida['ordem_set'] = set_data[1]
+    if lista_id_partida:
+        condicoes.append(" partida.id = any(%s) ")
+        tupla = tupla + (lista_id_partida,)
 
+    if data_inicio:
+        condicoes.append(" partida.data_partida >= %s ")
+        tupla = tupla + (data_inicio,)
 
-                    # Pesquisa as jogadas dos sets da partida
-                    sqlvar = (id_set,)
+    if data_fim:
+        condicoes.append(" partida.data_partida < %s ")
+        tupla = tupla + (data_fim + datetime.timedelta(days=1),)
 
-                    bloco = (" select count(acerto), acerto from jogada where set_id =%s  group by acerto; ")
-                    
-                    try:
-                        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                        cursor = connection.cursor()
-                        cursor.execute(bloco, sqlvar)
-                        acertos = cursor.fetchall()
-                    
-                    except (Exception, psycopg2.Error) as error:
-                        erro = str(error).rstrip()
-                        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                        return jsonify({'erro' : erro_banco})
+    if request.args.get('tipo_jogo'):
+        condicoes.append(" partida.tipo_jogo = %s ")
+        tupla = tupla + (request.args.get('tipo_jogo'),)
 
-                    finally:
-                        if (connection):
-                            connection.commit()
-                            cursor.close()
-                            connection.close()
-
-                    # Devolve pontuação e verifica se o jogo deve continuar ou parar
-                    if acertos:
-                        quantidade_resultado1 =  (acertos[0])[0]
-                        tipo_resultado1 = (acertos[0])[1]
-
-                        if tipo_resultado1:
-                            qtd_acertos = quantidade_resultado1
-                            qtd_erros = 0
-                        else:
-                            qtd_erros = quantidade_resultado1
-                            qtd_acertos = 0
-
-                        if len(acertos) == 2:
-                            quantidade_resultado2 =  (acertos[1])[0]
-                            tipo_resultado2 = (acertos[1])[1]
-                            if tipo_resultado2:
-                                qtd_acertos = quantidade_resultado2
-                            else:
-                                qtd_erros = quantidade_resultado2
+    if request.args.get('modalidade'):
+        condicoes.append(" partida.modalidade = %s ")
+        tupla = tupla + (request.args.get('modalidade'),)
 
-                    else:
-                        qtd_erros = 0
-                        qtd_acertos = 0
-                                
-                    diferenca_erro_acerto = abs(qtd_erros - qtd_acertos)
-                
-                    if qtd_erros > qtd_acertos:
-                        set_partida['resultado_set'] = 'perdeu'
-                    elif qtd_erros < qtd_acertos:
-                        set_partida['resultado_set'] = 'ganhou'
-                    else:
-                        set_partida['resultado_set'] = 'empate'
+    if id_jogador:
+        condicoes.append(" %s in (partida.jogador_1_id, partida.jogador_2_id, \
+                            partida.jogador_adversario_1_id, partida.jogador_adversario_2_id) ")
+        tupla = tupla + (int(id_jogador),)
 
-                    set_partida['status'] = 'continuar'
-                    if (qtd_erros >= 21 or qtd_acertos >= 21):
-                        if diferenca_erro_acerto >= 2:
-                            set_partida['status'] = 'parar'
-                        else:
-                            if (qtd_erros >= 30 or qtd_acertos >= 30):
-                                set_partida['status'] = 'parar'
+    # Paginação: continua a partir da última partida da página anterior
+    if apos:
+        condicoes.append(" (partida.data_partida, partida.id) < (%s, %s) ")
+        tupla = tupla + tuple(apos)
 
-                    set_partida['erros'] = qtd_erros
-                    set_partida['acertos'] = qtd_acertos
-                    
-                    output_set.append(set_partida)
+    if condicoes:
+        bloco = bloco + " where " + " and ".join(condicoes)
 
-            lineout_partida['sets'] = output_set
+    bloco = bloco + " order by partida.data_partida desc, partida.id desc "
 
-    return jsonify({'partida_badminton' : lineout_partida})
+    # Em NDJSON as partidas são enviadas à medida que são lidas do banco, sem paginação por cursor
+    if quer_ndjson():
+        if limite:
+            bloco = bloco + " limit %s "
+            tupla = tupla + (limite,)
 
+        try:
+            return resposta_ndjson(bloco, tupla, monta_partidas)
 
-@app.route('/get_partidas', methods=['GET'])
-def get_partidas():
-    """ Devolve dados da(s) partidas(s) conforme id(s) informado(s) 
-    ou devolve todas as partidas caso parametro esteja vazio"""
-    
-    # Verifica parâmetro recebido
-    lista_id_partida = None
-    if request.args.get('lista_id_partida'):
-        lista_id_partida = (request.args.get('lista_id_partida')).replace(" ", "").split(',')
-        
-        for partida in lista_id_partida:
-            if not partida.isdigit():
-                return jsonify({'erro' : 'request.args[lista_id_partida] deve ser numerico'})
+        except (Exception, psycopg2.Error) as error:
+            erro = str(error).rstrip()
+            erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
+            return jsonify({'erro' : erro_banco})
 
-    if not lista_id_partida:
-        lista_id_partida = '0'
-    
-    # Pesquisa partidas conforme ids informado no parâmetro
-    posicao = 0
-    blocoi = " select partida.id, partida.data_partida, partida.tipo_jogo, partida.modalidade, partida.nome, \
-                partida.jogador_1_id, partida.jogador_2_id, partida.jogador_adversario_1_id, partida.jogador_adversario_2_id \
-                  from partida " 
-                
-    blocof = ""
-    tupla = ()
- 
-    if lista_id_partida != '0':
-        for partida_id in lista_id_partida:
-            if posicao == 0:
-                blocof = " where partida.id = %s "
-                tupla = (partida_id, )
-                posicao += 1
-            else:
-                blocof = blocof + " or partida.id = %s "
-                tupla = (tupla) + (partida_id, )
-    
-    bloco = blocoi + blocof + " order by partida.data_partida desc "
+    # Pesquisa um registro a mais para saber se existe próxima página
+    if limite:
+        bloco = bloco + " limit %s "
+        tupla = tupla + (limite + 1,)
 
+    # Consultas por requisição: 3, independente do número de partidas (partidas, jogadores e sets com pontuação)
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
         cursor.execute(bloco, tupla)
         partidas_data = cursor.fetchall()
 
+        proximo = None
+        if limite and len(partidas_data) > limite:
+            partidas_data = partidas_data[:limite]
+            proximo = codifica_cursor([partidas_data[-1][1].isoformat(), partidas_data[-1][0]])
+
+        # Devolve dados das partidas pesquisadas
+        output_partidas = monta_partidas(cursor, partidas_data)
+
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
         erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
@@ -924,253 +805,17 @@ def get_partidas():
     finally:
         if (connection):
             cursor.close()
-            connection.close()
-    
-    # Devolve dados das partidas pesquisadas
-    output_partidas = []
-    if partidas_data:
-        for line in partidas_data:    
-            lineout_partida = {}
-            id_partida = line[0]
-            lineout_partida['id'] = line[0]
-            lineout_partida['data'] = line[1].strftime('%d-%m-%Y')
-            lineout_partida['tipo_jogo'] = line[2]
-            lineout_partida['modalidade'] = line[3]
-            lineout_partida['nome'] = line[4]      
-            
-            # Insere dados do jogador: uma partida pode ter dois ou quatro jogadores
-
-            # Pesquisa dados do jogador 1
-            jogador_1 = line[5]
-            if jogador_1:
-                
-                bloco_jogador_1 = " select jogador.nome_jogador, jogador.id from jogador where id = %s " 
-                            
-                tupla_1 = (jogador_1,)
-                try:
-                    connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                    cursor = connection.cursor()
-                    cursor.execute(bloco_jogador_1, tupla_1)
-                    jogador_1_data = cursor.fetchone()
-
-                except (Exception, psycopg2.Error) as error:
-                    erro = str(error).rstrip()
-                    erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                    return jsonify({'erro' : erro_banco})
-
-                finally:
-                    if (connection):
-                        cursor.close()
-                        connection.close()
-
-                lineout_partida['jogador_1'] = {
-                    'nome': jogador_1_data[0],
-                    'id': jogador_1_data[1],
-                }
-            else:
-                lineout_partida['jogador_1'] = {}
-
-            # Pesquisa dados do jogador 2
-            jogador_2 = line[6]
-            if jogador_2:
-            
-                bloco_jogador_2 = " select jogador.nome_jogador, jogador.id from jogador where id = %s " 
-                            
-                tupla_2 = (jogador_2,)
-                try:
-                    connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                    cursor = connection.cursor()
-                    cursor.execute(bloco_jogador_2, tupla_2)
-                    jogador_2_data = cursor.fetchone()
-
-                except (Exception, psycopg2.Error) as error:
-                    erro = str(error).rstrip()
-                    erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                    return jsonify({'erro' : erro_banco})
-
-                finally:
-                    if (connection):
-                        cursor.close()
-                        connection.close()
-
-                lineout_partida['jogador_2'] = {
-                    'nome': jogador_2_data[0],
-                    'id': jogador_2_data[1],
-                }
-            else:
-                lineout_partida['jogador_2'] = {}
-
-
-            # Pesquisa dados do jogador adversario 1
-            jogador_3 = line[7]
-            if jogador_3:
-                bloco_jogador_3 = " select jogador.nome_jogador, jogador.id from jogador where id = %s " 
-                            
-                tupla_3 = (jogador_3,)
-                try:
-                    connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                    cursor = connection.cursor()
-                    cursor.execute(bloco_jogador_3, tupla_3)
-                    jogador_3_data = cursor.fetchone()
-
-                except (Exception, psycopg2.Error) as error:
-                    erro = str(error).rstrip()
-                    erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                    return jsonify({'erro' : erro_banco})
-
-                finally:
-                    if (connection):
-                        cursor.close()
-                        connection.close()
-
-                lineout_partida['jogador_adversario_1'] = {
-                    'nome': jogador_3_data[0],
-                    'id': jogador_3_data[1],
-                }
-
-            else:
-                lineout_partida['jogador_adversario_1'] = {}
-            
-            # Pesquisa dados do jogador adversario 2
-            jogador_4 = line[8]
-            if jogador_4:
-            
-                bloco_jogador_4 = " select jogador.nome_jogador, jogador.id from jogador where id = %s " 
-                            
-                tupla_4 = (jogador_4,)
-                try:
-                    connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                    cursor = connection.cursor()
-                    cursor.execute(bloco_jogador_4, tupla_4)
-                    jogador_4_data = cursor.fetchone()
-
-                except (Exception, psycopg2.Error) as error:
-                    erro = str(error).rstrip()
-                    erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                    return jsonify({'erro' : erro_banco})
-
-                finally:
-                    if (connection):
-                        cursor.close()
-                        connection.close()
-                
-                lineout_partida['jogador_adversario_2'] = {
-                    'nome': jogador_4_data[0],
-                    'id': jogador_4_data[1],
-                }
-                
-            else:
-                lineout_partida['jogador_adversario_2'] = {}
 
-            # Pesquisa os sets da partida
-            bloco = " select set.id, set.ordem from set where set.partida_id = %s "
+    resposta = {'partidas_badminton' : output_partidas}
+    if limite:
+        resposta['proximo'] = proximo
 
-            sqlvar = (id_partida,)
-                        
-            try:
-                connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                cursor = connection.cursor()
-                cursor.execute(bloco, sqlvar)
-                set_ordem_data = cursor.fetchall()
-                
+    return jsonify(resposta)
 
-            except (Exception, psycopg2.Error) as error:
-                erro = str(error).rstrip()
-                erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                return jsonify({'erro' : erro_banco})
 
-            finally:
-                if (connection):
-                    cursor.close()
-                    connection.close()
-
-            # Devolve os sets relacionados às partidas pesquisadas
-            output_set = []
-            if set_ordem_data:
-                for set_data in set_ordem_data:
-                    set_partida = {}
-                    id_set = set_data[0]
-                    set_partida['id_set'] = set_data[0]
-                    set_partida['ordem_set'] = set_data[1]
-
-            
-                    # Pesquisa as jogadas dos sets da partida
-                    sqlvar = (id_set,)
-
-                    bloco = (" select count(acerto), acerto from jogada where set_id =%s  group by acerto; ")
-                    
-                    try:
-                        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                        cursor = connection.cursor()
-                        cursor.execute(bloco, sqlvar)
-                        acertos = cursor.fetchall()
-                    
-                    except (Exception, psycopg2.Error) as error:
-                        erro = str(error).rstrip()
-                        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                        return jsonify({'erro' : erro_banco})
-
-                    finally:
-                        if (connection):
-                            connection.commit()
-                            cursor.close()
-                            connection.close()
-
-                    # Devolve pontuação e verifica se o jogo deve continuar ou parar
-                    
-                    if acertos:
-                        quantidade_resultado1 =  (acertos[0])[0]
-                        tipo_resultado1 = (acertos[0])[1]
-
-                        if tipo_resultado1:
-                            qtd_acertos = quantidade_resultado1
-                            qtd_erros = 0
-                        else:
-                            qtd_erros = quantidade_resultado1
-                            qtd_acertos = 0
-
-                        if len(acertos) == 2:
-                            quantidade_resultado2 =  (acertos[1])[0]
-                            tipo_resultado2 = (acertos[1])[1]
-                            if tipo_resultado2:
-                                qtd_acertos = quantidade_resultado2
-                            else:
-                                qtd_erros = quantidade_resultado2
-    
-                    else:
-                        qtd_erros = 0
-                        qtd_acertos = 0
-                    diferenca_erro_acerto = abs(qtd_erros - qtd_acertos)
-                
-                    if qtd_erros > qtd_acertos:
-                        set_partida['resultado_set'] = 'perdeu'
-                    elif qtd_erros < qtd_acertos:
-                        set_partida['resultado_set'] = 'ganhou'
-                    else:
-                        set_partida['resultado_set'] = 'empate'
-
-                    set_partida['status'] = 'continuar'
-                    if (qtd_erros >= 21 or qtd_acertos >= 21):
-                        if diferenca_erro_acerto >= 2:
-                            set_partida['status'] = 'parar'
-                        else:
-                            if (qtd_erros >= 30 or qtd_acertos >= 30):
-                                set_partida['status'] = 'parar'
-
-                    set_partida['erros'] = qtd_erros
-                    set_partida['acertos'] = qtd_acertos
-                    
-                    output_set.append(set_partida)
-
-            lineout_partida['sets'] = output_set
-            output_partidas.append(lineout_partida)
-
-    return jsonify({'partidas_badminton' : output_partidas})
-
-
-@app.route('/post_set', methods=['POST'])
-def post_set():
-    """ Cria registro do set no banco de dados """
+@app.route('/post_set', methods=['POST'])
+def post_set():
+    """ Cria registro do set no banco de dados """
 
     # Verifica parâmetros de entrada
     id_partida = None
@@ -1199,12 +844,21 @@ def post_set():
     datetimenow = datetime.datetime.now()
     sqlvar = (id_partida, ordem_set, datetimenow, datetimenow)
 
-    bloco = ("insert into set (partida_id, ordem, criado_em, atualizado_em) \
-            VALUES (%s, %s, %s, %s) \
-            returning id, partida_id, ordem ")
+    # O novo set incrementa a versão da partida (cache de relatórios) no mesmo comando
+    bloco = ("with novo as ( \
+                insert into set (partida_id, ordem, criado_em, atualizado_em) \
+                VALUES (%s, %s, %s, %s) \
+                returning id, partida_id, ordem, atualizado_em \
+            ), versao as ( \
+                insert into versao_partida (partida_id, versao, atualizado_em) \
+                    select novo.partida_id, 1, novo.atualizado_em from novo \
+                on conflict (partida_id) do update \
+                    set versao = versao_partida.versao + 1, atualizado_em = excluded.atualizado_em \
+            ) \
+            select novo.id, novo.partida_id, novo.ordem from novo ")
 
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
         cursor.execute(bloco, sqlvar)
         set_data = cursor.fetchone()
@@ -1218,7 +872,6 @@ def post_set():
         if (connection):
             connection.commit()
             cursor.close()
-            connection.close()
 
     # Devolve dados do set recém salvo
     data_set = {}
@@ -1239,130 +892,94 @@ def post_jogada():
     if not data:
         return jsonify({'erro' : 'JSON inválido.'})
 
-    schema = {
-        "type": "object",
-        "required": ["set", "golpe", "quadrante", "acerto"],
-        "properties": {
-            "set": {
-                "type": "integer",
-                "minimum": 1,
-                "exclusiveMaximum": 999999999
-            },
-            "golpe": {
-                "type": "integer",
-                "minimum": 1,
-                "exclusiveMaximum": 999999999
-            },
-            "quadrante": {
-                "type": "integer",
-                "minimum": 1,
-                "exclusiveMaximum": 999999999
-            },
-            "tipoerro": {
-                "type": "integer",
-                "minimum": 0,
-                "exclusiveMaximum": 999999999
-
-            },
-            "acerto": {
-                "type": "boolean",
-            }
-          }
-        }
-
     #Verifica se Json é valido (conforme Json-schema).
     try:
-        validate(data, schema)
+        valida(validador_jogada, data)
 
     except ValidationError as e:
         mensagem = 'JSON inválido.' + ' - Path: ' + str(e.path)  + ' - Message: ' + str(e.message)
         return jsonify({'erro' : mensagem})
 
-    if data['tipoerro'] == 0:
+    if not data.get('tipoerro'):
         data['tipoerro'] = None
     
-    # Realiza insert no banco de dados
+    # Insere a jogada e atualiza o placar do set no mesmo comando e na mesma transação
     datetimenow = datetime.datetime.now()
     set_id = data['set']
     sqlvar = (set_id, data['golpe'], data['quadrante'], data['tipoerro'], data['acerto'], datetimenow, datetimenow)
 
-    bloco = ("insert into jogada (set_id, golpe_id, quadrante_id, tipo_erro_id, acerto, criado_em, atualizado_em) \
-            VALUES (%s, %s, %s, %s, %s, %s, %s) ")
+    if gravador_jogadas:
+        # A jogada é gravada junto com as de outras requisições simultâneas, em um único commit
+        try:
+            ordem_set, qtd_acertos, qtd_erros = gravador_jogadas.grava(sqlvar)
 
-    try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-        cursor = connection.cursor()
-        cursor.execute(bloco, sqlvar)
+        except JogadaNaoGravada as error:
+            # A jogada foi cancelada sem ser gravada: o cliente pode reenviá-la
+            return jsonify({'erro' : str(error)}), 503, {'Retry-After': '1'}
 
-    except (Exception, psycopg2.Error) as error:
-        erro = str(error).rstrip()
-        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-        return jsonify({'erro' : erro_banco})
+        except GravacaoIncerta as error:
+            # Não se sabe se a jogada foi gravada: reenviar sem conferir o placar poderia duplicá-la
+            return jsonify({'erro' : str(error)}), 504
 
-    finally:
-        if (connection):
+        except (Exception, psycopg2.Error) as error:
+            erro = str(error).rstrip()
+            erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
+            return jsonify({'erro' : erro_banco})
+
+    else:
+        try:
+            connection = get_conexao()
+            cursor = connection.cursor()
+            placares = grava_jogadas(cursor, [sqlvar])
             connection.commit()
-            cursor.close()
-            connection.close()
 
-    # Pesquisa as jogadas dos sets da partida
-    sqlvar = (set_id,)
+        except (Exception, psycopg2.Error) as error:
+            erro = str(error).rstrip()
+            erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
+            return jsonify({'erro' : erro_banco})
 
-    bloco = (" select count(acerto), acerto from jogada where set_id =%s  group by acerto; ")
-    
-    try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-        cursor = connection.cursor()
-        cursor.execute(bloco, sqlvar)
-        acertos = cursor.fetchall()
-    
-    except (Exception, psycopg2.Error) as error:
-        erro = str(error).rstrip()
-        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-        return jsonify({'erro' : erro_banco})
+        finally:
+            if (connection):
+                cursor.close()
+
+        ordem_set, qtd_acertos, qtd_erros = placares[set_id]
 
-    finally:
-        if (connection):
-            connection.commit()
-            cursor.close()
-            connection.close()
     # Devolve pontuação e verifica se o jogo deve continuar ou parar
-    if acertos:
-        quantidade_resultado1 =  (acertos[0])[0]
-        tipo_resultado1 = (acertos[0])[1]
+    data_pontuacao = pontuacao_set(set_id, ordem_set, qtd_acertos, qtd_erros)
 
-        if tipo_resultado1:
-            qtd_acertos = quantidade_resultado1
-            qtd_erros = 0
-        else:
-            qtd_erros = quantidade_resultado1
-            qtd_acertos = 0
+    return jsonify({'pontuacao_set': data_pontuacao})
 
-        
-        if len(acertos) == 2:
-            quantidade_resultado2 =  (acertos[1])[0]
-            tipo_resultado2 = (acertos[1])[1]
-            if tipo_resultado2:
-                qtd_acertos = quantidade_resultado2
-            else:
-                qtd_erros = quantidade_resultado2
 
-    else:
-        qtd_erros = 0
-        qtd_acertos = 0
+@app.route('/post_jogadas', methods=['POST'])
+def post_jogadas():
+    """ Cria em lote registros de jogadas (ex.: jogadas acumuladas por um marcador sem conexão) """
 
-    # Pesquisar ordem do set
+    data = request.get_json()
 
-    sqlvar = (set_id,)
+    if not data:
+        return jsonify({'erro' : 'JSON inválido.'})
 
-    bloco = (" select ordem from set where id = %s  ")
-    
+    #Verifica se Json é valido (conforme Json-schema): todas as jogadas são validadas de uma vez.
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        valida(validador_jogadas, data)
+
+    except ValidationError as e:
+        mensagem = 'JSON inválido.' + ' - Path: ' + str(e.path)  + ' - Message: ' + str(e.message)
+        return jsonify({'erro' : mensagem})
+
+    # Insere todas as jogadas e atualiza o placar dos sets em um único comando e uma única transação
+    datetimenow = datetime.datetime.now()
+    tuplas = []
+    for jogada in data:
+        tuplas.append((jogada['set'], jogada['golpe'], jogada['quadrante'], jogada.get('tipoerro') or None,
+                       jogada['acerto'], datetimenow, datetimenow))
+
+    try:
+        connection = get_conexao()
         cursor = connection.cursor()
-        cursor.execute(bloco, sqlvar)
-        ordem_set = cursor.fetchone()
-    
+        placares = grava_jogadas(cursor, tuplas)
+        connection.commit()
+
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
         erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
@@ -1370,38 +987,15 @@ def post_jogada():
 
     finally:
         if (connection):
-            connection.commit()
             cursor.close()
-            connection.close()
-
-    # Devolve pontuação e verifica se o jogo deve continuar ou parar
-    data_pontuacao = {}
-    
-    data_pontuacao['set_id'] = data['set']
-    data_pontuacao['ordem_set'] = ordem_set[0]
 
+    # Devolve a pontuação de cada set afetado após a gravação do lote
+    output_pontuacao = []
+    for set_id in sorted(placares):
+        ordem_set, qtd_acertos, qtd_erros = placares[set_id]
+        output_pontuacao.append(pontuacao_set(set_id, ordem_set, qtd_acertos, qtd_erros))
 
-    diferenca_erro_acerto = abs(qtd_erros - qtd_acertos)
-    
-    if qtd_erros > qtd_acertos:
-        data_pontuacao['resultado_set'] = 'perdendo'
-    elif qtd_erros < qtd_acertos:
-        data_pontuacao['resultado_set'] = 'ganhando'
-    else:
-        data_pontuacao['resultado_set'] = 'empatando'
-    
-    data_pontuacao['status'] = 'continuar'
-    if (qtd_erros >= 21 or qtd_acertos >= 21):
-        if diferenca_erro_acerto >= 2:
-            data_pontuacao['status'] = 'parar'
-        else:
-            if (qtd_erros >= 30 or qtd_acertos >= 30):
-                data_pontuacao['status'] = 'parar'
-
-    data_pontuacao['erros'] = qtd_erros
-    data_pontuacao['acertos'] = qtd_acertos
-
-    return jsonify({'pontuacao_set': data_pontuacao})
+    return jsonify({'jogadas_gravadas': len(tuplas), 'pontuacao_sets': output_pontuacao})
 
 
 @app.route('/get_set', methods=['GET'])
@@ -1420,15 +1014,16 @@ def get_set():
     if not id_set.isdigit():
         return jsonify({'erro' : 'request.args[id_set] deve ser numerico'})
 
-    sqlvar = (id_set, )
-
-    bloco = (" select set.id, set.partida_id, set.ordem from set where set.id = %s ")
-    
+    # Pesquisa o set e calcula sua pontuação em uma única consulta, precedida da
+    # consulta ao estado da partida do set, que basta para responder 304
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
-        cursor.execute(bloco, sqlvar)
-        data_set = cursor.fetchone()
+        estado = estado_partida(cursor, id_set=int(id_set))
+        if nao_modificada(estado):
+            return resposta_nao_modificada(estado)
+
+        data_set = carrega_set(cursor, id_set)
     
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
@@ -1437,84 +1032,18 @@ def get_set():
 
     finally:
         if (connection):
-            connection.commit()
             cursor.close()
-            connection.close()
 
     set_data = {}
     if data_set:
-        set_id = data_set[0]
         set_data['set_id'] = data_set[0]
         set_data['partida_id'] = data_set[1]
         set_data['ordem'] = data_set[2] 
 
-        
-        # Pesquisa as jogadas dos sets da partida
-        sqlvar = (set_id,)
-
-        bloco = (" select count(acerto), acerto from jogada where set_id =%s  group by acerto; ")
-        
-        try:
-            connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-            cursor = connection.cursor()
-            cursor.execute(bloco, sqlvar)
-            acertos = cursor.fetchall()
-        
-        except (Exception, psycopg2.Error) as error:
-            erro = str(error).rstrip()
-            erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-            return jsonify({'erro' : erro_banco})
-
-        finally:
-            if (connection):
-                connection.commit()
-                cursor.close()
-                connection.close()
         # Devolve pontuação e verifica se o jogo deve continuar ou parar
-        if acertos:
-            quantidade_resultado1 =  (acertos[0])[0]
-            tipo_resultado1 = (acertos[0])[1]
-
-            if tipo_resultado1:
-                qtd_acertos = quantidade_resultado1
-                qtd_erros = 0
-            else:
-                qtd_erros = quantidade_resultado1
-                qtd_acertos = 0
-
-            if len(acertos) == 2:
-                quantidade_resultado2 =  (acertos[1])[0]
-                tipo_resultado2 = (acertos[1])[1]
-                if tipo_resultado2:
-                    qtd_acertos = quantidade_resultado2
-                else:
-                    qtd_erros = quantidade_resultado2
-
-        else:
-            qtd_erros = 0
-            qtd_acertos = 0
-
-        diferenca_erro_acerto = abs(qtd_erros - qtd_acertos)
-       
-        if qtd_erros > qtd_acertos:
-            set_data['resultado_set'] = 'perdeu'
-        elif qtd_erros < qtd_acertos:
-            set_data['resultado_set'] = 'ganhou'
-        else:
-            set_data['resultado_set'] = 'empate'
-
-        set_data['status'] = 'continuar'
-        if (qtd_erros >= 21 or qtd_acertos >= 21):
-            if diferenca_erro_acerto >= 2:
-                set_data['status'] = 'parar'
-            else:
-                if (qtd_erros >= 30 or qtd_acertos >= 30):
-                    set_data['status'] = 'parar'
-
-        set_data['erros'] = qtd_erros
-        set_data['acertos'] = qtd_acertos
+        set_data.update(placar_set(data_set[3], data_set[4]))
 
-    return jsonify({'data_set': set_data})
+    return com_validadores(jsonify({'data_set': set_data}), estado)
 
 
 # versão 1
@@ -1543,11 +1072,20 @@ def get_relatoriopartida_v1():
                 inner join jogador on (partida.jogador_1_id = jogador.id) \
                 where set.partida_id = %s"
                 
+    # O relatório é reaproveitado do cache enquanto a versão da partida não mudar
+    chave = (int(id_partida), 'v1', None)
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
-        cursor.execute(bloco, sqlvar)
-        partida_set_data = cursor.fetchall()
+        estado = estado_partida(cursor, id_partida=int(id_partida))
+        if nao_modificada(estado):
+            return resposta_nao_modificada(estado)
+
+        versao = estado['versao'] if estado else 0
+        corpo = relatorios.obtem(chave, versao)
+        if corpo is None:
+            cursor.execute(bloco, sqlvar)
+            partida_set_data = cursor.fetchall()
 
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
@@ -1557,7 +1095,9 @@ def get_relatoriopartida_v1():
     finally:
         if (connection):
             cursor.close()
-            connection.close()
+
+    if corpo is not None:
+        return com_validadores(resposta_json(corpo), estado)
 
     output_partida = []
     if partida_set_data:
@@ -1588,7 +1128,7 @@ def get_relatoriopartida_v1():
                         where set_id = %s GROUP BY (golpe_id, quadrante_id, set_id, acerto);")
 
             try:
-                connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+                connection = get_conexao()
                 cursor = connection.cursor()
                 cursor.execute(bloco, tupla)
                 dados_jogada = cursor.fetchall()
@@ -1602,7 +1142,6 @@ def get_relatoriopartida_v1():
                 if (connection):
                     connection.commit()
                     cursor.close()
-                    connection.close()
            
             if dados_jogada:
                 for jogada in dados_jogada:
@@ -1621,53 +1160,16 @@ def get_relatoriopartida_v1():
                         erros_set = erros_set + quantidade_jogada
 
 
-                    tupla = (golpe_id,)
-                    bloco = ("  SELECT golpe.descricao_golpe from golpe where golpe.id = %s ")
-
+                    # Descrições de golpe e quadrante vêm do cache de referências
                     try:
-                        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                        cursor = connection.cursor()
-                        cursor.execute(bloco, tupla)
-                        golpe = cursor.fetchone()
-                    
-                    except (Exception, psycopg2.Error) as error:
-                        erro = str(error).rstrip()
-                        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                        return jsonify({'erro' : erro_banco})
+                        golpe = referencias.descricao_golpe(golpe_id)
+                        quadrante = referencias.descricao_quadrante(quadrante_id)
 
-                    finally:
-                        if (connection):
-                            connection.commit()
-                            cursor.close()
-                            connection.close()
-                    
-                    tupla = (quadrante_id,)
-                    bloco = ("  select quadrante.descricao_quadrante, quadrante.lado FROM quadrante \
-                                where quadrante.id = %s ")
-
-                    try:
-                        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                        cursor = connection.cursor()
-                        cursor.execute(bloco, tupla)
-                        quadrante = cursor.fetchone()
-                    
                     except (Exception, psycopg2.Error) as error:
                         erro = str(error).rstrip()
                         erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
                         return jsonify({'erro' : erro_banco})
 
-                    finally:
-                        if (connection):
-                            connection.commit()
-                            cursor.close()
-                            connection.close()
-                
-                    golpe = golpe[0]
-                    if quadrante[1]:
-                        quadrante = quadrante[0] + ' ' + quadrante[1]
-                    else:
-                        quadrante = quadrante[0]
-
                     jogada_tupla = (set_id, acerto_jogada, golpe_id, golpe, quadrante_id, quadrante, quantidade_jogada)    
                     jogada_resultado_global.append(jogada_tupla)
 
@@ -1681,7 +1183,7 @@ def get_relatoriopartida_v1():
         if jogadas_partida > 0:
             # Dados da partida
             lineout_partida['partida_id'] = line[2]
-            lineout_partida['data'] = line[3].strftime('%d-%m-%Y')
+            lineout_partida['data'] = line[3]
             lineout_partida['tipo_jogo'] = line[4]
             lineout_partida['modalidade'] = line[5]
             lineout_partida['nome'] = line[6]
@@ -1733,8 +1235,10 @@ def get_relatoriopartida_v1():
             
             output_partida.append(lineout_partida)
 
+    corpo = codifica({'relatorio_partida': output_partida})
+    relatorios.guarda(chave, versao, corpo)
 
-    return jsonify({'relatorio_partida': output_partida})
+    return com_validadores(resposta_json(corpo), estado)
 
 # versão 2
 @app.route('/v2/get_relatoriopartida', methods=['GET'])
@@ -1753,32 +1257,25 @@ def get_relatoriopartida_v2():
     if not id_partida.isdigit():
         return jsonify({'erro' : 'request.args[id_partida] deve ser numerico'})
 
-    sqlvar = (id_partida, )
+    try:
+        formato = le_formato(request.args)
+    except ValueError as error:
+        return jsonify({'erro' : str(error)})
 
-    # Pesquisa partida conforme id informado no parâmetro
-    bloco = " select set.id, set.ordem, partida.id, partida.data_partida, partida.tipo_jogo, partida.modalidade, partida.nome, \
-                partida.jogador_1_id, jogador.nome_jogador from set \
-                inner join partida on (partida.id = set.partida_id)\
-                inner join jogador on (partida.jogador_1_id = jogador.id) \
-                where set.partida_id = %s"
-                
+    # Pesquisa os sets e as jogadas da partida (duas consultas), a menos que o relatório
+    # desta versão da partida esteja no cache; os totais são agregados em memória
+    chave = (int(id_partida), 'v2', formato)
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
-        cursor.execute(bloco, sqlvar)
-        partida_set_data = cursor.fetchall()
-
-        """
-        RESULTADO DOS 3 SETS 
-        [
-            (7, 1, 23, 
-            datetime.datetime(2022, 5, 30, 0, 0, tzinfo=datetime.timezone(datetime.timedelta
-            (days=-1, seconds=75600))), 'simples', 'misto', 'Partida Relatorio', 3, 'Fabiana da Silva'), 
-            
-            (8, 2, 23, datetime.datetime(2022, 5, 30, 0, 0, tzinfo=datetime.timezone(datetime.timedelta
-            (days=-1, seconds=75600))), 'simples', 'misto', 'Partida Relatorio', 3, 'Fabiana da Silva')]
+        estado = estado_partida(cursor, id_partida=int(id_partida))
+        if nao_modificada(estado):
+            return resposta_nao_modificada(estado)
 
-        """
+        versao = estado['versao'] if estado else 0
+        corpo = relatorios.obtem(chave, versao)
+        if corpo is None:
+            dados_relatorio = carrega_relatorio(cursor, [int(id_partida)])
 
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
@@ -1788,241 +1285,20 @@ def get_relatoriopartida_v2():
     finally:
         if (connection):
             cursor.close()
-            connection.close()
 
-    output_partida = []  # Verificar se é necessario criar uma lista de partidas
-    if partida_set_data:
-        lineout_partida = {}
-        lineout_partida['L_set_resultado'] = []
-        
-        set_resultado_global = []
-        jogada_resultado_global = []
-        quadrante_resultado_global = []
-        
-        jogadas_partida = 0
-        acertos_partida = 0
-        erros_partida = 0
-
-        
-   
-        for line in partida_set_data:
-
-            jogadas_set = 0
-            acertos_set = 0
-            erros_set = 0
-          
-            lineout_set = {}
-            
-            id_set = line[0]
-            
-            tupla = (id_set,)
-            
-            # Pesquiusa quantidade de cada golpe no set
-            bloco = ("  SELECT jogada.golpe_id, jogada.set_id, golpe.descricao_golpe, count(jogada.id) \
-                        FROM jogada \
-                        inner join golpe on (golpe.id = jogada.golpe_id)    \
-                        where set_id = %s GROUP BY (golpe_id, set_id, golpe.descricao_golpe);")
-
-            try:
-                connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                cursor = connection.cursor()
-                cursor.execute(bloco, tupla)
-                dados_jogada = cursor.fetchall()
+    # A versão 2 não detalha os tipos de erro dos quadrantes
+    if corpo is not None:
+        return com_validadores(resposta_json(corpo), estado)
 
-                """
-                JOGADAS POR SET:  [(1, 7, 'Saque', 5), (3, 7, 'Backhand', 9), (7, 7, 'Drive', 8)]
-                JOGADAS POR SET:  [(1, 8, 'Saque', 2)]
-
-                """
-            
-            except (Exception, psycopg2.Error) as error:
-                erro = str(error).rstrip()
-                erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                return jsonify({'erro' : erro_banco})
-
-            finally:
-                if (connection):
-                    connection.commit()
-                    cursor.close()
-                    connection.close()
-            
-            if dados_jogada:
-                for jogada in dados_jogada:
-
-                    total_jogadas = 0
-                    total_acertos_jogadas = 0
-                    total_erros_jogadas = 0
-
-                    id_golpe = jogada[0]
-                    golpe = jogada[2]
-                    set_id = jogada[1]   
-                    quantidade_jogada = jogada[3]  # total de jogadas do golpe
-                    jogadas_set = jogadas_set + quantidade_jogada  # Total de jogadas do set
-
-                    tupla = (id_set, id_golpe)
-
-                    # Pesquisa os quadrantes agrupados por erro e acerto 
-                    bloco = ("  SELECT jogada.quadrante_id, acerto, quadrante.descricao_quadrante, count(jogada.id), jogada.set_id, quadrante.lado \
-                            FROM jogada \
-                            inner join quadrante on (quadrante.id = jogada.quadrante_id)    \
-                            where set_id = %s and golpe_id = %s GROUP BY (quadrante_id, acerto, quadrante.descricao_quadrante, jogada.set_id, quadrante.lado);")
-
-                    try:
-                        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                        cursor = connection.cursor()
-                        cursor.execute(bloco, tupla)
-                        dados_quadrante = cursor.fetchall()
-
-                        """
-                        DADOS QUADRANTES:  [(1, False, 'Q 01', 2), (1, True, 'Q 01', 3)]
-                        DADOS QUADRANTES:  [(2, False, 'Q 02', 4), (2, True, 'Q 02', 1), (5, False, 'Q 05', 2), (5, True, 'Q 05', 2)]
-                        DADOS QUADRANTES:  [(2, False, 'Q 02', 3), (2, True, 'Q 02', 5)]
-                        DADOS QUADRANTES:  [(1, True, 'Q 01', 2)]
-
-                        """
-                    
-                    except (Exception, psycopg2.Error) as error:
-                        erro = str(error).rstrip()
-                        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                        return jsonify({'erro' : erro_banco})
-
-                    finally:
-                        if (connection):
-                            connection.commit()
-                            cursor.close()
-                            connection.close()
-
-                    if dados_quadrante:
-                        for line_quadrante in dados_quadrante:
-
-                            id_quadrante = line_quadrante[0]
-                            acerto_quadrante = line_quadrante[1]
-
-                            if line_quadrante[5]:
-                                quadrante = line_quadrante[2] + ' ' + line_quadrante[5]
-                            else:
-                                quadrante = line_quadrante[2]
-
-                            quantidade_jogada_quadrante = line_quadrante[3]
-                            set_id_quadrante = line_quadrante[4]
-                        
-
-                            if acerto_quadrante:
-                                total_acertos_jogadas = total_acertos_jogadas + quantidade_jogada_quadrante
-                            else:
-                                total_erros_jogadas = total_erros_jogadas + quantidade_jogada_quadrante
-                                
-                            tupla = (id_set, id_golpe, id_quadrante)
-
-                            quadrante_tupla = (set_id_quadrante, id_golpe, id_quadrante, quadrante, acerto_quadrante, quantidade_jogada_quadrante)
-                            quadrante_resultado_global.append(quadrante_tupla)
-                            
-
-                            if acerto_quadrante:
-                                acertos_set = acertos_set + quantidade_jogada_quadrante
-                            else:
-                                erros_set = erros_set + quantidade_jogada_quadrante
-
-
-                        # total_jogadas = total_acertos_jogadas + total_erros_jogadas
-                    
-                    jogada_tupla = (set_id, id_golpe, golpe, quantidade_jogada, total_acertos_jogadas, total_erros_jogadas)    
-                    jogada_resultado_global.append(jogada_tupla)
-                          
-                # acertos_set = acertos_set + total_acertos_jogadas
-                # erros_set = erros_set + total_erros_jogadas
-
-            jogadas_partida = jogadas_partida + jogadas_set
-            acertos_partida = acertos_partida + acertos_set
-            erros_partida = erros_partida + erros_set
-
-            set_data = (line[0], line[1], jogadas_set, acertos_set, erros_set)
-            set_resultado_global.append(set_data)
-
-
-        if jogadas_partida > 0:
-            # Dados da partida
-            lineout_partida['A_partida_id'] = line[2]
-            lineout_partida['B_data'] = line[3].strftime('%d-%m-%Y')
-            lineout_partida['C_tipo_jogo'] = line[4]
-            lineout_partida['D_modalidade'] = line[5]
-            lineout_partida['E_nome'] = line[6]
-            lineout_partida['F_jogador'] = line[8]
-
-            # Resultados da partida
-            lineout_partida['G_partida_total'] = jogadas_partida
-            lineout_partida['H_partida_acertos'] = acertos_partida
-            lineout_partida['I_partida_acertos_%'] = round(((acertos_partida / jogadas_partida)*100), 2)
-            lineout_partida['J_partida_erros'] = erros_partida
-            lineout_partida['K_partida_erros_%'] = round(((erros_partida / jogadas_partida)*100), 2)
-            
-            if jogadas_partida > 0:
-                for line_set in set_resultado_global:
-                    set_resultado = {}
-                    if line_set[2] > 0:
-                        # Dados do set
-                        id_set = line_set[0]
-                        set_resultado['A_set_id'] = line_set[0]
-                        set_resultado['B_set_ordem'] = line_set[1]
-
-                        # Resultados individual do set
-                        set_resultado['C_set_total'] = line_set[2]
-                        set_resultado['E_set_acertos'] = line_set[3]
-                        set_resultado['G_set_acertos_relacao_set'] = round(((line_set[3] / line_set[2])*100), 2)
-                        set_resultado['H_set_erros'] = line_set[4]
-                        set_resultado['J_set_erros_relacao_set'] = round(((line_set[4] / line_set[2])*100), 2)
-                        
-                        # Resultados individual do set
-                        set_resultado['D_set_total_relacao_partida'] = round(((line_set[2] / jogadas_partida)*100), 2)
-                        set_resultado['F_set_acertos_relacao_partida'] = round(((line_set[3] / jogadas_partida)*100), 2)
-                        set_resultado['I_set_erros_relacao_partida'] = round(((line_set[4] / jogadas_partida)*100), 2)
-                        
-                        set_resultado['K_jogadas'] = []
-                        if line_set[2] > 0:
-                            for line_jogada in jogada_resultado_global:
-                                jogada = {}
-                                if id_set == line_jogada[0]:
-                                    id_golpe = line_jogada[1]
-                                    jogada['A_golpe_id'] = line_jogada[1]
-                                    jogada['B_golpe'] = line_jogada[2]
-                                    jogada['C_golpe_total'] = line_jogada[3]
-                                    jogada['D_golpe_total_relacao_set'] = round(((line_jogada[3] / line_set[2])*100), 2)
-
-                                    jogada['I_quadrantes_acerto'] = []
-                                    jogada['J_quadrantes_erro'] = []
-                                    if line_jogada[3] > 0:
-                                        jogadas_acerto = 0
-                                        jogadas_erro = 0
-                                        for line_quadrante in quadrante_resultado_global:
-                                            quadrante = {}
-                                            if id_golpe == line_quadrante[1] and line_jogada[0] == line_quadrante[0]:
-                                                if line_quadrante[4]:
-                                                    quadrante['A_quadrante_id'] = line_quadrante[2]
-                                                    quadrante['B_quadrante'] = line_quadrante[3]
-                                                    quadrante['C_quadrante_total'] = line_quadrante[5]
-                                                    quadrante['D_quadrante_relacao_golpe'] = round(((line_quadrante[5] / line_jogada[3])*100), 2)
-                                                    # jogadas_acerto = jogadas_acerto + line_quadrante[5]
-                                                    jogada['I_quadrantes_acerto'].append(quadrante)
-                                                else:
-                                                    quadrante['A_quadrante_id'] = line_quadrante[2]
-                                                    quadrante['B_quadrante'] = line_quadrante[3]
-                                                    quadrante['C_quadrante_total'] = line_quadrante[5]
-                                                    quadrante['D_quadrante_relacao_golpe'] = round(((line_quadrante[5] / line_jogada[3])*100), 2)
-                                                    # jogadas_erro = jogadas_erro + line_quadrante[5]
-                                                    jogada['J_quadrantes_erro'].append(quadrante)
-
-                                    jogada['E_golpe_acertos'] = line_jogada[4]
-                                    jogada['F_golpe_acertos_porc'] = round(((line_jogada[4]/line_jogada[3])*100), 2)
-                                    jogada['G_golpe_erros'] = line_jogada[5]
-                                    jogada['H_golpe_erros_porc'] = round(((line_jogada[5]/line_jogada[3])*100), 2)
-                                    set_resultado['K_jogadas'].append(jogada)
-
-                        lineout_partida['L_set_resultado'].append(set_resultado)
-            
-            output_partida.append(lineout_partida)
+    if formato:
+        output_partida = monta_relatorio_colunar(dados_relatorio, com_tipos_erro=False)
+    else:
+        output_partida = monta_relatorio(dados_relatorio, com_tipos_erro=False)
 
+    corpo = codifica({'relatorio_partida': output_partida})
+    relatorios.guarda(chave, versao, corpo)
 
-    return jsonify({'relatorio_partida': output_partida})
+    return com_validadores(resposta_json(corpo), estado)
 
 
 # versão 3
@@ -2042,20 +1318,25 @@ def get_relatoriopartida_v3():
     if not id_partida.isdigit():
         return jsonify({'erro' : 'request.args[id_partida] deve ser numerico'})
 
-    sqlvar = (id_partida, )
+    try:
+        formato = le_formato(request.args)
+    except ValueError as error:
+        return jsonify({'erro' : str(error)})
 
-    # Pesquisa partida conforme id informado no parâmetro
-    bloco = " select set.id, set.ordem, partida.id, partida.data_partida, partida.tipo_jogo, partida.modalidade, partida.nome, \
-                partida.jogador_1_id, jogador.nome_jogador from set \
-                inner join partida on (partida.id = set.partida_id)\
-                inner join jogador on (partida.jogador_1_id = jogador.id) \
-                where set.partida_id = %s"
-                
+    # Pesquisa os sets e as jogadas da partida (duas consultas), a menos que o relatório
+    # desta versão da partida esteja no cache; os totais são agregados em memória
+    chave = (int(id_partida), 'v3', formato)
     try:
-        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+        connection = get_conexao()
         cursor = connection.cursor()
-        cursor.execute(bloco, sqlvar)
-        partida_set_data = cursor.fetchall()
+        estado = estado_partida(cursor, id_partida=int(id_partida))
+        if nao_modificada(estado):
+            return resposta_nao_modificada(estado)
+
+        versao = estado['versao'] if estado else 0
+        corpo = relatorios.obtem(chave, versao)
+        if corpo is None:
+            dados_relatorio = carrega_relatorio(cursor, [int(id_partida)])
 
     except (Exception, psycopg2.Error) as error:
         erro = str(error).rstrip()
@@ -2065,270 +1346,82 @@ def get_relatoriopartida_v3():
     finally:
         if (connection):
             cursor.close()
-            connection.close()
 
-    output_partida = []  # Verificar se é necessario criar uma lista de partidas
-    if partida_set_data:
-        lineout_partida = {}
-        lineout_partida['L_set_resultado'] = []
-        
-        set_resultado_global = []
-        jogada_resultado_global = []
-        quadrante_resultado_global = []
-        erros_golpe_global = []
+    if corpo is not None:
+        return com_validadores(resposta_json(corpo), estado)
 
-        jogadas_partida = 0
-        acertos_partida = 0
-        erros_partida = 0
-   
-        for line in partida_set_data:
+    if formato:
+        output_partida = monta_relatorio_colunar(dados_relatorio, com_tipos_erro=True)
+    else:
+        output_partida = monta_relatorio(dados_relatorio, com_tipos_erro=True)
 
-            jogadas_set = 0
-            acertos_set = 0
-            erros_set = 0
-          
-            lineout_set = {}
-            
-            id_set = line[0]
-            
-            tupla = (id_set,)
-            
-            # Pesquiusa quantidade de cada golpe no set
-            bloco = ("  SELECT jogada.golpe_id, jogada.set_id, golpe.descricao_golpe, count(jogada.id) \
-                        FROM jogada \
-                        inner join golpe on (golpe.id = jogada.golpe_id)    \
-                        where set_id = %s GROUP BY (golpe_id, set_id, golpe.descricao_golpe);")
+    corpo = codifica({'relatorio_partida': output_partida})
+    relatorios.guarda(chave, versao, corpo)
 
-            try:
-                connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                cursor = connection.cursor()
-                cursor.execute(bloco, tupla)
-                dados_jogada = cursor.fetchall()
-            
-            except (Exception, psycopg2.Error) as error:
-                erro = str(error).rstrip()
-                erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                return jsonify({'erro' : erro_banco})
+    return com_validadores(resposta_json(corpo), estado)
 
-            finally:
-                if (connection):
-                    connection.commit()
-                    cursor.close()
-                    connection.close()
-            
-            if dados_jogada:
-                for jogada in dados_jogada:
-
-                    total_jogadas = 0
-                    total_acertos_jogadas = 0
-                    total_erros_jogadas = 0
 
-                    id_golpe = jogada[0]
-                    golpe = jogada[2]
-                    set_id = jogada[1]   
-                    quantidade_jogada = jogada[3]  # total de jogadas do golpe
-                    jogadas_set = jogadas_set + quantidade_jogada  # Total de jogadas do set
+# versão 4
+@app.route('/v4/get_relatoriopartida', methods=['GET'])
+def get_relatoriopartida_v4():
+    """ Retorna resultados da partida no mesmo formato da versão 3, calculados em uma única consulta """
 
-                    tupla = (id_set, id_golpe)
+    # Verifica parâmetros de entrada
+    id_partida = None
+    
+    if request.args.get('id_partida'):
+        id_partida = request.args.get('id_partida')
+        
+    if not id_partida:
+        id_partida = '0'
 
-                    # Pesquisa os quadrantes agrupados por erro e acerto 
-                    bloco = ("  SELECT jogada.quadrante_id, acerto, quadrante.descricao_quadrante, count(jogada.id), jogada.set_id, quadrante.lado \
-                            FROM jogada \
-                            inner join quadrante on (quadrante.id = jogada.quadrante_id)    \
-                            where set_id = %s and golpe_id = %s GROUP BY (quadrante_id, acerto, quadrante.descricao_quadrante, jogada.set_id, quadrante.lado);")
+    if not id_partida.isdigit():
+        return jsonify({'erro' : 'request.args[id_partida] deve ser numerico'})
 
-                    try:
-                        connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                        cursor = connection.cursor()
-                        cursor.execute(bloco, tupla)
-                        dados_quadrante = cursor.fetchall()
-                    
-                    except (Exception, psycopg2.Error) as error:
-                        erro = str(error).rstrip()
-                        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                        return jsonify({'erro' : erro_banco})
+    try:
+        formato = le_formato(request.args)
+    except ValueError as error:
+        return jsonify({'erro' : str(error)})
 
-                    finally:
-                        if (connection):
-                            connection.commit()
-                            cursor.close()
-                            connection.close()
-
-                    if dados_quadrante:
-                        for line_quadrante in dados_quadrante:
-
-                            id_quadrante = line_quadrante[0]
-                            acerto_quadrante = line_quadrante[1]
-                            if line_quadrante[5]:
-                                quadrante = line_quadrante[2] + ' ' + line_quadrante[5]
-                            else:
-                                quadrante = line_quadrante[2]
-                            
-                            quantidade_jogada_quadrante = line_quadrante[3]
-                            set_id_quadrante = line_quadrante[4]
-                           
-
-                            if acerto_quadrante:
-                                total_acertos_jogadas = total_acertos_jogadas + quantidade_jogada_quadrante
-                            else:
-                                total_erros_jogadas = total_erros_jogadas + quantidade_jogada_quadrante
-
-
-                          
-                                
-                            tupla = (id_set, id_golpe, id_quadrante)
-
-                            # Pesquisar os erros de saque 
-                            bloco = ("  SELECT jogada.golpe_id, jogada.quadrante_id, acerto, tipoerro.descricao_erro, \
-                                    count(jogada.id), jogada.set_id, jogada.tipo_erro_id \
-                                    FROM jogada \
-                                    inner join tipoerro on (tipoerro.id = jogada.tipo_erro_id)    \
-                                    where set_id = %s and golpe_id = %s and quadrante_id = %s \
-                                    GROUP BY (golpe_id, quadrante_id, acerto, tipoerro.descricao_erro, jogada.set_id, jogada.tipo_erro_id);")
-
-                            try:
-                                connection = psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'], user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
-                                cursor = connection.cursor()
-                                cursor.execute(bloco, tupla)
-                                dados_tipo_erro = cursor.fetchall()    
-                                                        
-                            except (Exception, psycopg2.Error) as error:
-                                erro = str(error).rstrip()
-                                erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
-                                return jsonify({'erro' : erro_banco})
-
-                            finally:
-                                if (connection):
-                                    connection.commit()
-                                    cursor.close()
-                                    connection.close()
-                                    
-                            if dados_tipo_erro:
-                                for line_erro in dados_tipo_erro:
-                                    golpe_id_erro = line_erro[0]
-                                    quadrante_id_erro = line_erro[1]
-                                    acerto = line_erro[2]
-                                    descricao_erro = line_erro[3]
-                                    quantidade_erro = line_erro[4]
-                                    set_id_erro = line_erro[5]
-                                    tipo_erro_id = line_erro[6]
-                            
-                                    erros_golpe_tupla = (golpe_id_erro, quadrante_id_erro, acerto, descricao_erro, quantidade_erro, set_id_erro, tipo_erro_id)
-                                    erros_golpe_global.append(erros_golpe_tupla)
-
-
-                            quadrante_tupla = (set_id_quadrante, id_golpe, id_quadrante, quadrante, acerto_quadrante, quantidade_jogada_quadrante)
-                            quadrante_resultado_global.append(quadrante_tupla)
-                            
-
-                            if acerto_quadrante:
-                                acertos_set = acertos_set + quantidade_jogada_quadrante
-                            else:
-                                erros_set = erros_set + quantidade_jogada_quadrante
-                    
-                    jogada_tupla = (set_id, id_golpe, golpe, quantidade_jogada, total_acertos_jogadas, total_erros_jogadas)    
-                    jogada_resultado_global.append(jogada_tupla)
+    sqlvar = (id_partida, )
 
-            jogadas_partida = jogadas_partida + jogadas_set
-            acertos_partida = acertos_partida + acertos_set
-            erros_partida = erros_partida + erros_set
+    # Pesquisa sets, golpes, quadrantes e tipos de erro da partida de uma só vez (GROUPING SETS),
+    # a menos que o relatório desta versão da partida esteja no cache
+    chave = (int(id_partida), 'v4', formato)
+    try:
+        connection = get_conexao()
+        cursor = connection.cursor()
+        estado = estado_partida(cursor, id_partida=int(id_partida))
+        if nao_modificada(estado):
+            return resposta_nao_modificada(estado)
 
-            set_data = (line[0], line[1], jogadas_set, acertos_set, erros_set)
-            set_resultado_global.append(set_data)
+        versao = estado['versao'] if estado else 0
+        corpo = relatorios.obtem(chave, versao)
+        if corpo is None:
+            cursor.execute(bloco_relatorio_v4, sqlvar)
+            relatorio_data = cursor.fetchall()
 
+    except (Exception, psycopg2.Error) as error:
+        erro = str(error).rstrip()
+        erro_banco = 'Erro ao acessar o Banco de Dados (' + erro + ').'
+        return jsonify({'erro' : erro_banco})
 
-        if jogadas_partida > 0:
-            # Dados da partida
-            lineout_partida['A_partida_id'] = line[2]
-            lineout_partida['B_data'] = line[3].strftime('%d-%m-%Y')
-            lineout_partida['C_tipo_jogo'] = line[4]
-            lineout_partida['D_modalidade'] = line[5]
-            lineout_partida['E_nome'] = line[6]
-            lineout_partida['F_jogador'] = line[8]
+    finally:
+        if (connection):
+            cursor.close()
 
-            # Resultados da partida
-            lineout_partida['G_partida_total'] = jogadas_partida
-            lineout_partida['H_partida_acertos'] = acertos_partida
-            lineout_partida['I_partida_acertos_%'] = round(((acertos_partida / jogadas_partida)*100), 2)
-            lineout_partida['J_partida_erros'] = erros_partida
-            lineout_partida['K_partida_erros_%'] = round(((erros_partida / jogadas_partida)*100), 2)
-            
-            if jogadas_partida > 0:
-                for line_set in set_resultado_global:
-                    set_resultado = {}
-                    if line_set[2] > 0:
-                        # Dados do set
-                        id_set = line_set[0]
-                        set_resultado['A_set_id'] = line_set[0]
-                        set_resultado['B_set_ordem'] = line_set[1]
+    if corpo is not None:
+        return com_validadores(resposta_json(corpo), estado)
 
-                        # Resultados individual do set
-                        set_resultado['C_set_total'] = line_set[2]
-                        set_resultado['E_set_acertos'] = line_set[3]
-                        set_resultado['G_set_acertos_relacao_set'] = round(((line_set[3] / line_set[2])*100), 2)
-                        set_resultado['H_set_erros'] = line_set[4]
-                        set_resultado['J_set_erros_relacao_set'] = round(((line_set[4] / line_set[2])*100), 2)
-                        
-                        # Resultados individual do set
-                        set_resultado['D_set_total_relacao_partida'] = round(((line_set[2] / jogadas_partida)*100), 2)
-                        set_resultado['F_set_acertos_relacao_partida'] = round(((line_set[3] / jogadas_partida)*100), 2)
-                        set_resultado['I_set_erros_relacao_partida'] = round(((line_set[4] / jogadas_partida)*100), 2)
-                        
-                        set_resultado['K_jogadas'] = []
-                        if line_set[2] > 0:
-                            for line_jogada in jogada_resultado_global:
-                                jogada = {}
-                                if id_set == line_jogada[0]:
-                                    id_golpe = line_jogada[1]
-                                    jogada['A_golpe_id'] = line_jogada[1]
-                                    jogada['B_golpe'] = line_jogada[2]
-                                    jogada['C_golpe_total'] = line_jogada[3]
-                                    jogada['D_golpe_total_relacao_set'] = round(((line_jogada[3] / line_set[2])*100), 2)
-
-                                    jogada['I_quadrantes_acerto'] = []
-                                    jogada['J_quadrantes_erro'] = []
-                                    if line_jogada[3] > 0:
-                                        jogadas_acerto = 0
-                                        jogadas_erro = 0
-                                        for line_quadrante in quadrante_resultado_global:
-                                            quadrante = {}
-                                            if id_golpe == line_quadrante[1] and line_jogada[0] == line_quadrante[0]:
-                                                if line_quadrante[4]:
-                                                    quadrante['A_quadrante_id'] = line_quadrante[2]
-                                                    quadrante['B_quadrante'] = line_quadrante[3]
-                                                    quadrante['C_quadrante_total'] = line_quadrante[5]
-                                                    quadrante['D_quadrante_relacao_golpe'] = round(((line_quadrante[5] / line_jogada[3])*100), 2)
-                                                    # jogadas_acerto = jogadas_acerto + line_quadrante[5]
-                                                    jogada['I_quadrantes_acerto'].append(quadrante)
-                                                else:
-                                                    quadrante['A_quadrante_id'] = line_quadrante[2]
-                                                    quadrante['B_quadrante'] = line_quadrante[3]
-                                                    quadrante['C_quadrante_total'] = line_quadrante[5]
-                                                    quadrante['D_quadrante_relacao_golpe'] = round(((line_quadrante[5] / line_jogada[3])*100), 2)
-                                                    quadrante['E_tipo_erro'] = []
-                                                    if erros_golpe_global:
-                                                            for line_erro in erros_golpe_global:
-                                                                if line_erro[5] == line_quadrante[0] and line_erro[0] == line_quadrante[1] and line_erro[1] == line_quadrante[2]:
-                                                            
-                                                                    tipo_erro = {}
-                                                                    tipo_erro['A_id'] = line_erro[6]
-                                                                    tipo_erro['B_tipo_erro'] = line_erro[3]
-                                                                    tipo_erro['C_quantidade'] = line_erro[4]
-                                                                    quadrante['E_tipo_erro'].append(tipo_erro)
-                                                                    
-                                                    jogada['J_quadrantes_erro'].append(quadrante)
-                                    jogada['E_golpe_acertos'] = line_jogada[4]
-                                    jogada['F_golpe_acertos_porc'] = round(((line_jogada[4]/line_jogada[3])*100), 2)
-                                    jogada['G_golpe_erros'] = line_jogada[5]
-                                    jogada['H_golpe_erros_porc'] = round(((line_jogada[5]/line_jogada[3])*100), 2)
-                                    set_resultado['K_jogadas'].append(jogada)
-
-                        lineout_partida['L_set_resultado'].append(set_resultado)
-            
-            output_partida.append(lineout_partida)
+    if formato:
+        output_partida = monta_relatorio_colunar(agrupa_v4(relatorio_data))
+    else:
+        output_partida = monta_relatorio(agrupa_v4(relatorio_data))
 
+    corpo = codifica({'relatorio_partida': output_partida})
+    relatorios.guarda(chave, versao, corpo)
 
-    return jsonify({'relatorio_partida': output_partida})
+    return com_validadores(resposta_json(corpo), estado)
 
 
 
@@ -2351,64 +1444,39 @@ if not config:
     logging.error(errormessage)
     exit()
 
-schema = {
-    "title": "config",
-    "type": "object",
-    "required": [ "SECRET_KEY", "DATABASE_HOST", "DATABASE_NAME", "DATABASE_USER", "DATABASE_PASSWORD", "URLMEDIA", "UPLOAD_URL", "UPLOAD_PATH"],
-    "properties": {
-        "SECRET_KEY": {
-            "type": "string",
-            "minLength": 1,
-            "maxLength": 50
-        },
-        "DATABASE_HOST": {
-            "type": "string",
-            "minLength": 1,
-            "maxLength": 200
-        },
-        "DATABASE_NAME": {
-            "type": "string",
-            "minLength": 1,
-            "maxLength": 200
-        },
-        "DATABASE_USER": {
-            "type": "string",
-            "minLength": 1,
-            "maxLength": 100
-        },
-        "DATABASE_PASSWORD": {
-            "type": "string",
-            "minLength": 1,
-            "maxLength": 200
-        },
-        "URLMEDIA": {
-            "type": "string",
-            "minLength": 1,
-            "maxLength": 100
-        },
-        "UPLOAD_URL": {
-            "type": "string",
-            "minLength": 1,
-            "maxLength": 100
-        },
-        "UPLOAD_PATH": {
-            "type": "string",
-            "minLength": 1,
-            "maxLength": 100
-        },
-    }
-}
-
-
 # Verifica se Json é valido (conforme Json-schema)
 try:
-    validate(config, schema)
+    valida(validador_config, config)
 
 except ValidationError as e:
     errormessage = 'apibadminton.json formato invalido' + ' (mensagem: [' + str(e.message) + ']) ' + '(path: [' + str(e.path) + '])'
     logging.error(errormessage)
     exit()
 
+db.configura(config)
+referencias.ttl = config.get('CACHE_REFERENCIAS_TTL', referencias.ttl)
+relatorios.maximo = config.get('CACHE_RELATORIOS_MAX', relatorios.maximo)
+
+# Uploads: limite por arquivo e margem para os cabeçalhos do multipart no limite da requisição
+armazenamento.diretorio = config['UPLOAD_PATH']
+armazenamento.url_base = config['URLMEDIA']
+armazenamento.tamanho_maximo = int(config.get('UPLOAD_MAX_MB', 15) * 1024 * 1024)
+armazenamento.miniaturas = config.get('UPLOAD_MINIATURAS', armazenamento.miniaturas)
+app.config['MAX_CONTENT_LENGTH'] = armazenamento.tamanho_maximo + 64 * 1024
+
+# Registro de comandos SQL lentos em arquivo rotativo, um JSON por linha
+if config.get('SLOW_QUERY_MS') is not None:
+    handler_lentas = logging.handlers.RotatingFileHandler(config.get('SLOW_QUERY_LOG', 'consultas_lentas.log'),
+                                                          maxBytes=10 * 1024 * 1024, backupCount=5, encoding='utf-8')
+    handler_lentas.setFormatter(logging.Formatter('%(message)s'))
+    log_consultas_lentas.addHandler(handler_lentas)
+    log_consultas_lentas.propagate = False
+    configura_consultas_lentas(config['SLOW_QUERY_MS'], config.get('SLOW_QUERY_EXPLAIN_AMOSTRA', 0.1))
+
+if config.get('GROUP_COMMIT'):
+    gravador_jogadas = GravadorEmGrupo(max_lote=config.get('GROUP_COMMIT_MAX_LOTE', 50),
+                                       max_espera_ms=config.get('GROUP_COMMIT_MAX_ESPERA_MS', 5))
+
 
 if __name__ == '__main__':
     app.run(debug=True)
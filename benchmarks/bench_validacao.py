@@ -0,0 +1,52 @@
+""" Custo da validação JSON-schema por requisição: jsonschema.validate (schema
+verificado e validador criado a cada chamada) x validador pré-compilado
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_validacao.py [repeticoes]
+"""
+
+import os
+import sys
+import timeit
+
+from jsonschema import validate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from validacao import (valida, schema_jogador, schema_partida, schema_jogada, schema_jogadas,
+                       validador_jogador, validador_partida, validador_jogada, validador_jogadas)
+
+
+jogada = {'set': 1, 'golpe': 3, 'quadrante': 7, 'tipoerro': 0, 'acerto': True}
+
+casos = [
+    ('post_jogador', schema_jogador, validador_jogador,
+     {'nome': 'Jogador', 'data_nascimento': '2000-01-01', 'telefone': '51999999999',
+      'email': 'jogador@exemplo.com', 'lateralidade': 'destro', 'foto': ''}),
+    ('post_partida', schema_partida, validador_partida,
+     {'nome': 'Partida', 'data': '2021-10-01', 'tipo_jogo': 'simples', 'modalidade': 'misto',
+      'jogador_1': 1, 'jogador_2': 0, 'jogador_adversario_1': 2, 'jogador_adversario_2': 0}),
+    ('post_jogada', schema_jogada, validador_jogada, jogada),
+    ('post_jogadas (100)', schema_jogadas, validador_jogadas, [jogada] * 100),
+]
+
+
+def mede(funcao, repeticoes):
+    """ Devolve o menor tempo médio por chamada, em microssegundos """
+
+    tempos = timeit.repeat(funcao, number=repeticoes, repeat=5)
+    return min(tempos) / repeticoes * 1000000
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print('%-20s %14s %14s %8s' % ('rota', 'validate (us)', 'compilado (us)', 'ganho'))
+    for nome, schema, validador, data in casos:
+        antes = mede(lambda: validate(data, schema), repeticoes)
+        depois = mede(lambda: valida(validador, data), repeticoes)
+        print('%-20s %14.1f %14.1f %7.1fx' % (nome, antes, depois, antes / depois))
+
+
+if __name__ == '__main__':
+    main()
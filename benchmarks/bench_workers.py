@@ -0,0 +1,237 @@
+""" Vazão da API com workers síncronos x workers com threads (gthread), com o mesmo número de processos
+
+Sobe o gunicorn com cada configuração (usando o apibadminton.json do projeto),
+dispara requisições simultâneas contra as rotas informadas durante alguns
+segundos e mede requisições por segundo, latências e a memória (RSS) somada
+dos processos do gunicorn.
+
+Com --latencia-ms, as conexões com o banco passam por um proxy TCP local que
+atrasa cada ida e volta em N milissegundos, simulando um banco em outra
+máquina (com um banco local a ida e volta custa quase nada e as threads não
+têm espera a aproveitar).
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/bench_workers.py [--workers 2] [--threads 8] [--clientes 32] [--duracao 10]
+                                       [--latencia-ms 2 [--porta-banco 5432]] [--config apibadminton.json]
+                                       [--rota /get_partida?id_partida=1 ...]
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+ROTAS_PADRAO = [
+    '/get_partida?id_partida=1',
+    '/get_partidas?limit=20',
+    '/get_set?id_set=1',
+    '/v3/get_relatoriopartida?id_partida=1',
+]
+
+
+def rss_kb(pid):
+    """ Memória residente (KB) do processo e dos seus filhos (Linux) """
+
+    total = 0
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for linha in f:
+                if linha.startswith('VmRSS:'):
+                    total += int(linha.split()[1])
+        with open('/proc/%d/task/%d/children' % (pid, pid)) as f:
+            filhos = [int(filho) for filho in f.read().split()]
+    except OSError:
+        return total
+
+    return total + sum(rss_kb(filho) for filho in filhos)
+
+
+class ProxyLatencia:
+    """ Proxy TCP para o PostgreSQL que entrega cada bloco recebido, nos dois sentidos, `latencia` / 2
+        segundos depois (um diretório em `host` indica o socket Unix do servidor, como no libpq) """
+
+    def __init__(self, host, porta, latencia):
+        self.host = host
+        self.porta = porta
+        self.latencia = latencia
+        self._servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._servidor.bind(('127.0.0.1', 0))
+        self._servidor.listen(128)
+        self.porta_local = self._servidor.getsockname()[1]
+        threading.Thread(target=self._aceita, daemon=True).start()
+
+    def _conecta_banco(self):
+        if self.host.startswith('/'):
+            banco = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            banco.connect(os.path.join(self.host, '.s.PGSQL.%d' % self.porta))
+        else:
+            banco = socket.create_connection((self.host, self.porta))
+            banco.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return banco
+
+    def _aceita(self):
+        while True:
+            cliente, endereco = self._servidor.accept()
+            cliente.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            banco = self._conecta_banco()
+            for origem, destino in ((cliente, banco), (banco, cliente)):
+                blocos = queue.Queue()
+                threading.Thread(target=self._le, args=(origem, blocos), daemon=True).start()
+                threading.Thread(target=self._entrega, args=(blocos, destino), daemon=True).start()
+
+    def _le(self, origem, blocos):
+        while True:
+            try:
+                dados = origem.recv(65536)
+            except OSError:
+                dados = b''
+            blocos.put((time.monotonic() + self.latencia / 2, dados))
+            if not dados:
+                return
+
+    def _entrega(self, blocos, destino):
+        while True:
+            entrega_em, dados = blocos.get()
+            espera = entrega_em - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            try:
+                if not dados:
+                    destino.shutdown(socket.SHUT_WR)
+                    return
+                destino.sendall(dados)
+            except OSError:
+                return
+
+
+def prepara_config(config, latencia, porta_banco):
+    """ Devolve (diretório, ambiente) de onde o gunicorn lê o apibadminton.json. Com latência, sobe o proxy e grava
+        uma cópia da configuração apontando para ele (o libpq lê a porta de PGPORT) """
+
+    if not latencia and os.path.basename(config) == 'apibadminton.json':
+        return os.path.dirname(os.path.abspath(config)), {}
+
+    with open(config) as f:
+        dados = json.load(f)
+
+    ambiente = {}
+    if latencia:
+        proxy = ProxyLatencia(dados['DATABASE_HOST'], porta_banco, latencia)
+        dados['DATABASE_HOST'] = '127.0.0.1'
+        ambiente['PGPORT'] = str(proxy.porta_local)
+
+    diretorio = tempfile.mkdtemp(prefix='badminton_workers_')
+    with open(os.path.join(diretorio, 'apibadminton.json'), 'w') as f:
+        json.dump(dados, f)
+    return diretorio, ambiente
+
+
+def sobe_gunicorn(porta, worker_class, workers, threads, diretorio=RAIZ, ambiente=None):
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(workers),
+               GUNICORN_THREADS=str(threads), **(ambiente or {}))
+    processo = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(RAIZ, 'gunicorn.conf.py'),
+                                 '--pythonpath', RAIZ, '-b', '127.0.0.1:%d' % porta, 'app:app'],
+                                cwd=diretorio, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            if requests.get('http://127.0.0.1:%d/health' % porta, timeout=1).ok:
+                return processo
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    processo.terminate()
+    raise RuntimeError('gunicorn não respondeu em /health')
+
+
+def carga(porta, rotas, clientes, duracao):
+    latencias = []
+    erros = [0]
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def cliente(numero):
+        sessao = requests.Session()
+        i = numero
+        while time.monotonic() < fim:
+            url = 'http://127.0.0.1:%d%s' % (porta, rotas[i % len(rotas)])
+            i += 1
+            inicio = time.monotonic()
+            try:
+                ok = sessao.get(url, timeout=30).ok
+            except requests.RequestException:
+                ok = False
+            decorrido = time.monotonic() - inicio
+            with lock:
+                if ok:
+                    latencias.append(decorrido)
+                else:
+                    erros[0] += 1
+
+    threads = [threading.Thread(target=cliente, args=(numero,)) for numero in range(clientes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencias.sort()
+    return latencias, erros[0]
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clientes', type=int, default=32)
+    parser.add_argument('--duracao', type=float, default=10)
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--latencia-ms', type=float, default=0,
+                        help='atraso acrescentado a cada ida e volta ao banco (proxy local)')
+    parser.add_argument('--porta-banco', type=int, default=int(os.environ.get('PGPORT', 5432)))
+    parser.add_argument('--config', default=os.path.join(RAIZ, 'apibadminton.json'))
+    parser.add_argument('--rota', action='append', dest='rotas')
+    args = parser.parse_args()
+    rotas = args.rotas or ROTAS_PADRAO
+
+    diretorio, ambiente = prepara_config(args.config, args.latencia_ms / 1000, args.porta_banco)
+
+    configuracoes = [('sync', args.workers, 1), ('gthread', args.workers, args.threads)]
+
+    print('%-8s %7s %7s %9s %9s %9s %7s %9s' % ('worker', 'procs', 'threads', 'req/s', 'p50 ms', 'p95 ms', 'erros', 'RSS MB'))
+    for worker_class, workers, threads in configuracoes:
+        processo = sobe_gunicorn(args.porta, worker_class, workers, threads, diretorio, ambiente)
+        try:
+            # Aquecimento: pools, caches e importações de todos os workers
+            carga(args.porta, rotas, args.clientes, 1)
+            latencias, erros = carga(args.porta, rotas, args.clientes, args.duracao)
+            memoria = rss_kb(processo.pid) / 1024
+        finally:
+            processo.terminate()
+            processo.wait()
+
+        print('%-8s %7d %7d %9.1f %9.1f %9.1f %7d %9.1f' % (
+            worker_class, workers, threads, len(latencias) / args.duracao,
+            percentil(latencias, 0.5) * 1000, percentil(latencias, 0.95) * 1000, erros, memoria))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+""" Compara dois resultados de benchmarks/executa.py (ex.: antes e depois de um commit)
+
+Uso:
+    python benchmarks/compara.py antes.json depois.json [--limite 10]
+
+Mostra, para cada rota, a variação da latência mediana, das consultas ao
+banco e do tamanho da resposta. Variações de latência acima de --limite
+por cento são marcadas como melhora (+) ou piora (!). O código de saída é 1
+se alguma rota piorou.
+"""
+
+import argparse
+import json
+
+
+def variacao(antes, depois):
+    if not antes:
+        return 0
+    return (depois - antes) / antes * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('antes')
+    parser.add_argument('depois')
+    parser.add_argument('--limite', type=float, default=10, help='variação percentual considerada relevante')
+    args = parser.parse_args()
+
+    with open(args.antes) as f:
+        antes = json.load(f)
+    with open(args.depois) as f:
+        depois = json.load(f)
+
+    print('antes: %s (%s)   depois: %s (%s)' % (antes.get('commit'), antes.get('data'), depois.get('commit'), depois.get('data')))
+    print('%-34s %10s %10s %8s %11s %15s' % ('rota', 'p50 antes', 'p50 depois', 'var %', 'consultas', 'bytes'))
+
+    piorou = False
+    for nome in sorted(set(antes['rotas']) | set(depois['rotas'])):
+        a = antes['rotas'].get(nome)
+        d = depois['rotas'].get(nome)
+        if a is None or d is None:
+            print('%-34s %s' % (nome, 'só em ' + ('depois' if a is None else 'antes')))
+            continue
+
+        var = variacao(a['p50_ms'], d['p50_ms'])
+        marca = ' '
+        if var <= -args.limite:
+            marca = '+'
+        elif var >= args.limite:
+            marca = '!'
+            piorou = True
+
+        print('%-34s %10.2f %10.2f %7.1f%s %5d -> %-3d %7d -> %d' % (
+            nome, a['p50_ms'], d['p50_ms'], var, marca, a['consultas'], d['consultas'],
+            a['bytes_resposta'], d['bytes_resposta']))
+
+    raise SystemExit(1 if piorou else 0)
+
+
+if __name__ == '__main__':
+    main()
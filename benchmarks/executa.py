@@ -0,0 +1,268 @@
+""" Mede latência, quantidade de consultas e alocação de memória de cada rota da API
+
+As requisições são feitas pelo cliente de testes do Flask, no mesmo processo,
+contra o banco criado por benchmarks/semeia.py. O resultado é gravado em JSON
+para ser comparado entre commits com benchmarks/compara.py.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/executa.py [--porta 54329 ...] [--repeticoes 50] [--saida resultado.json]
+                                 [--cache-relatorios] [--rota get_partidas ...]
+"""
+
+import argparse
+import datetime
+import hashlib
+import io
+import itertools
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from semeia import argumentos_conexao
+
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Quantidade de comandos SQL da requisição, informada pela própria API no cabeçalho Server-Timing
+_comandos_server_timing = re.compile(r'desc="(\d+) comandos SQL"')
+
+# Arquivos enviados a upload_file: o conteúdo muda a cada requisição, para que cada envio grave um arquivo novo
+TAMANHO_ARQUIVO = 256 * 1024
+
+_sequencia = itertools.count()
+_execucao = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+def jogador_novo():
+    """ Jogador no formato de post_jogador, com um nome ainda não cadastrado """
+
+    return {'nome': 'Benchmark %s %d' % (_execucao, next(_sequencia)), 'data_nascimento': '1990-01-01',
+            'telefone': '', 'email': '', 'lateralidade': 'destro', 'foto': ''}
+
+
+def arquivo_novo():
+    return str(next(_sequencia)).encode().ljust(TAMANHO_ARQUIVO, b'\0')
+
+
+def grava_foto(diretorio):
+    """ Grava no diretório de upload uma foto nomeada pelo conteúdo e a sua miniatura de 160 pixels, servidas pela
+        rota /media/jogador; devolve o nome da foto """
+
+    conteudo = b'foto'.ljust(64 * 1024, b'\0')
+    nome = hashlib.sha256(conteudo).hexdigest() + '.jpg'
+    for arquivo, tamanho in ((nome, len(conteudo)), (nome[:-4] + '_160.jpg', 8 * 1024)):
+        with open(os.path.join(diretorio, arquivo), 'wb') as f:
+            f.write(conteudo[:tamanho])
+    return nome
+
+
+def rotas(ids):
+    """ Devolve as rotas medidas: {nome: (método, url, corpo)}; o corpo pode ser uma função chamada a cada requisição """
+
+    jogada = {'set': ids['set_escrita'], 'golpe': 1, 'quadrante': 1, 'tipoerro': 0, 'acerto': True}
+    partida = ids['partida']
+    nova_partida = {'nome': 'Benchmark', 'data': '2022-01-01', 'tipo_jogo': 'simples', 'modalidade': 'misto',
+                    'jogador_1': ids['jogador'], 'jogador_2': 0,
+                    'jogador_adversario_1': ids['adversario'], 'jogador_adversario_2': 0}
+
+    return {
+        'get_jogador': ('GET', '/get_jogador?id_jogador=%d' % ids['jogador'], None),
+        'get_jogadores': ('GET', '/get_jogadores', None),
+        'get_jogadores_limit_50': ('GET', '/get_jogadores?limit=50', None),
+        'get_jogador_estatisticas': ('GET', '/get_jogador_estatisticas?id_jogador=%d' % ids['jogador'], None),
+        'get_golpes': ('GET', '/get_golpes', None),
+        'get_tipoerro': ('GET', '/get_tipoerro', None),
+        'get_quadrantes': ('GET', '/get_quadrantes', None),
+        'get_media_jogador': ('GET', '/media/jogador/' + ids['foto'], None),
+        'get_media_jogador_miniatura': ('GET', '/media/jogador/' + ids['foto'] + '?tamanho=160', None),
+        'get_partida': ('GET', '/get_partida?id_partida=%d' % partida, None),
+        'get_partidas': ('GET', '/get_partidas', None),
+        'get_partidas_limit_50': ('GET', '/get_partidas?limit=50', None),
+        'get_set': ('GET', '/get_set?id_set=%d' % ids['set'], None),
+        'v1_get_relatoriopartida': ('GET', '/v1/get_relatoriopartida?id_partida=%d' % partida, None),
+        'v2_get_relatoriopartida': ('GET', '/v2/get_relatoriopartida?id_partida=%d' % partida, None),
+        'v3_get_relatoriopartida': ('GET', '/v3/get_relatoriopartida?id_partida=%d' % partida, None),
+        'v4_get_relatoriopartida': ('GET', '/v4/get_relatoriopartida?id_partida=%d' % partida, None),
+        'v3_get_relatoriopartida_colunar': ('GET', '/v3/get_relatoriopartida?id_partida=%d&format=columnar' % partida, None),
+        'post_jogador': ('POST', '/post_jogador', jogador_novo),
+        'post_jogadores_100': ('POST', '/post_jogadores', lambda: [jogador_novo() for i in range(100)]),
+        'post_partida': ('POST', '/post_partida', nova_partida),
+        'post_set': ('POST', '/post_set?id_partida=%d&ordem_set=1' % ids['partida_escrita'], None),
+        'post_jogada': ('POST', '/post_jogada', jogada),
+        'post_jogadas_100': ('POST', '/post_jogadas', [jogada] * 100),
+        'upload_file': ('UPLOAD', '/upload_file', arquivo_novo),
+    }
+
+
+def escolhe_ids(connection):
+    """ Escolhe os registros usados nas rotas: a partida com mais jogadas e um set de outra partida para as escritas """
+
+    cursor = connection.cursor()
+    cursor.execute(" select set.partida_id, count(*) from jogada inner join set on (set.id = jogada.set_id) \
+                    group by set.partida_id order by count(*) desc, set.partida_id limit 1 ")
+    partida = cursor.fetchone()[0]
+    cursor.execute(" select min(set.id) from set where set.partida_id = %s ", (partida,))
+    id_set = cursor.fetchone()[0]
+    cursor.execute(" select set.id, set.partida_id from set order by set.id desc limit 1 ")
+    set_escrita, partida_escrita = cursor.fetchone()
+    cursor.execute(" select min(jogador.id), max(jogador.id) from jogador ")
+    jogador, adversario = cursor.fetchone()
+    cursor.close()
+    return {'partida': partida, 'set': id_set, 'set_escrita': set_escrita, 'partida_escrita': partida_escrita,
+            'jogador': jogador, 'adversario': adversario}
+
+
+def requisita(cliente, metodo, url, corpo):
+    if callable(corpo):
+        corpo = corpo()
+    if metodo == 'POST':
+        return cliente.post(url, json=corpo)
+    if metodo == 'UPLOAD':
+        return cliente.post(url, data={'file': (io.BytesIO(corpo), 'foto.jpg')}, content_type='multipart/form-data')
+    return cliente.get(url)
+
+
+def comandos_sql(resposta):
+    encontrado = _comandos_server_timing.search(resposta.headers.get('Server-Timing', ''))
+    if encontrado is None:
+        raise RuntimeError('resposta sem a quantidade de comandos SQL no cabeçalho Server-Timing')
+    return int(encontrado.group(1))
+
+
+def mede_rota(cliente, metodo, url, corpo, repeticoes):
+    # Aquecimento: caches de referência, pool de conexões e planos do banco
+    for i in range(3):
+        requisita(cliente, metodo, url, corpo)
+
+    tempos = []
+    comandos = []
+    tamanho = 0
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        resposta = requisita(cliente, metodo, url, corpo)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        tamanho = len(resposta.get_data())
+        if resposta.status_code != 200 or b'"erro"' in resposta.get_data()[:20]:
+            raise RuntimeError(url + ' falhou: ' + resposta.get_data(as_text=True)[:200])
+        comandos.append(comandos_sql(resposta))
+
+    # Alocações medidas em passagem separada: o tracemalloc deixa as requisições bem mais lentas
+    picos = []
+    alocados = []
+    tracemalloc.start()
+    for i in range(max(1, repeticoes // 5)):
+        tracemalloc.reset_peak()
+        antes = tracemalloc.get_traced_memory()[0]
+        requisita(cliente, metodo, url, corpo)
+        atual, pico = tracemalloc.get_traced_memory()
+        picos.append(pico - antes)
+        alocados.append(atual - antes)
+    tracemalloc.stop()
+
+    tempos.sort()
+    return {
+        'repeticoes': repeticoes,
+        'media_ms': round(statistics.mean(tempos), 3),
+        'p50_ms': round(statistics.median(tempos), 3),
+        'p95_ms': round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 3),
+        'min_ms': round(tempos[0], 3),
+        'consultas': max(comandos),
+        'bytes_resposta': tamanho,
+        'pico_memoria_kb': round(statistics.median(picos) / 1024, 1),
+        'memoria_retida_kb': round(statistics.median(alocados) / 1024, 1),
+    }
+
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def carrega_app(args, diretorio):
+    """ Importa app.py com um apibadminton.json apontando para o banco de benchmark """
+
+    config = {
+        'SECRET_KEY': 'benchmark',
+        'DATABASE_HOST': args.host,
+        'DATABASE_NAME': args.banco,
+        'DATABASE_USER': args.usuario,
+        'DATABASE_PASSWORD': args.senha or 'benchmark',
+        'URLMEDIA': 'http://localhost/media/',
+        'UPLOAD_URL': 'http://localhost/upload/',
+        'UPLOAD_PATH': diretorio,
+        'CACHE_RELATORIOS_MAX': 256 if args.cache_relatorios else 0,
+    }
+    with open(os.path.join(diretorio, 'apibadminton.json'), 'w') as f:
+        json.dump(config, f)
+
+    os.chdir(diretorio)
+    sys.path.insert(0, RAIZ)
+    import app
+    import db
+
+    # As conexões mantêm a instrumentação da API, que informa os comandos de cada requisição em Server-Timing
+    pool = db.get_pool()
+    pool.parametros['port'] = args.porta
+    if not args.senha:
+        pool.parametros.pop('password')
+    return app.app, pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    argumentos_conexao(parser)
+    parser.add_argument('--repeticoes', type=int, default=50)
+    parser.add_argument('--saida', default=None)
+    parser.add_argument('--cache-relatorios', action='store_true',
+                        help='mantém o cache de relatórios ligado (por padrão mede a montagem do relatório)')
+    parser.add_argument('--rota', action='append', dest='rotas')
+    args = parser.parse_args()
+
+    saida_arquivo = os.path.abspath(args.saida) if args.saida else None
+    diretorio = tempfile.mkdtemp(prefix='badminton_bench_')
+    app, pool = carrega_app(args, diretorio)
+
+    connection = pool.obtem()
+    ids = escolhe_ids(connection)
+    pool.devolve(connection)
+    ids['foto'] = grava_foto(diretorio)
+
+    cliente = app.test_client()
+    resultados = {}
+    for nome, (metodo, url, corpo) in rotas(ids).items():
+        if args.rotas and nome not in args.rotas:
+            continue
+        resultados[nome] = mede_rota(cliente, metodo, url, corpo, args.repeticoes)
+        print('%-34s p50 %8.2f ms  p95 %8.2f ms  consultas %3d  %8d bytes  pico %8.1f KB' % (
+            nome, resultados[nome]['p50_ms'], resultados[nome]['p95_ms'], resultados[nome]['consultas'],
+            resultados[nome]['bytes_resposta'], resultados[nome]['pico_memoria_kb']))
+
+    saida = {
+        'commit': commit_atual(),
+        'data': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'banco': args.banco,
+        'cache_relatorios': args.cache_relatorios,
+        'ids': ids,
+        'rotas': resultados,
+    }
+
+    if saida_arquivo:
+        with open(saida_arquivo, 'w') as f:
+            json.dump(saida, f, indent=2, sort_keys=True)
+        print('resultado gravado em ' + saida_arquivo)
+
+
+if __name__ == '__main__':
+    main()
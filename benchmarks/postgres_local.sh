@@ -0,0 +1,17 @@
+#!/bin/sh
+# Sobe um PostgreSQL descartável para a suíte de benchmarks (requer initdb e pg_ctl no PATH).
+#
+#   sh benchmarks/postgres_local.sh [diretorio]      (padrão: /tmp/badminton_bench)
+#   PORTA=54329 sh benchmarks/postgres_local.sh
+#
+# Para encerrar: pg_ctl -D /tmp/badminton_bench stop
+
+DIR=${1:-/tmp/badminton_bench}
+PORTA=${PORTA:-54329}
+
+if [ ! -f "$DIR/PG_VERSION" ]; then
+    initdb -D "$DIR" -U postgres -A trust >/dev/null || exit 1
+fi
+
+pg_ctl -D "$DIR" -o "-p $PORTA -k $DIR -c listen_addresses=localhost" -l "$DIR/postgres.log" -w start || exit 1
+echo "PostgreSQL em localhost:$PORTA (usuário postgres, sem senha)"
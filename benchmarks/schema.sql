@@ -0,0 +1,68 @@
+-- Esquema mínimo usado pela suíte de benchmarks. É um substituto local dos
+-- scripts oficiais (https://github.com/csdamo/sql_badminton), com as tabelas e
+-- colunas consultadas pela API. As tabelas auxiliares são criadas em seguida
+-- pelos scripts do diretório migracoes.
+--
+-- Os tipos das colunas seguem os dos scripts oficiais: a data da partida e as
+-- datas de criação e alteração de partidas, sets e jogadas são timestamptz.
+
+create table jogador (
+    id serial primary key,
+    nome_jogador varchar(200) not null,
+    data_nascimento date,
+    telefone varchar(12),
+    email varchar(100),
+    lateralidade varchar(20),
+    foto text,
+    criado_em timestamp,
+    atualizado_em timestamp
+);
+
+create table golpe (
+    id serial primary key,
+    descricao_golpe varchar(100) not null
+);
+
+create table tipoerro (
+    id serial primary key,
+    descricao_erro varchar(100) not null
+);
+
+create table quadrante (
+    id serial primary key,
+    descricao_quadrante varchar(100) not null,
+    lado varchar(20)
+);
+
+create table partida (
+    id serial primary key,
+    nome varchar(200),
+    data_partida timestamptz,
+    tipo_jogo varchar(20),
+    modalidade varchar(20),
+    jogador_1_id integer references jogador (id),
+    jogador_2_id integer references jogador (id),
+    jogador_adversario_1_id integer references jogador (id),
+    jogador_adversario_2_id integer references jogador (id),
+    criado_em timestamptz,
+    atualizado_em timestamptz
+);
+
+create table set (
+    id serial primary key,
+    partida_id integer references partida (id),
+    ordem integer,
+    criado_em timestamptz,
+    atualizado_em timestamptz
+);
+
+create table jogada (
+    id serial primary key,
+    set_id integer references set (id),
+    golpe_id integer references golpe (id),
+    quadrante_id integer references quadrante (id),
+    tipo_erro_id integer references tipoerro (id),
+    acerto boolean,
+    criado_em timestamptz,
+    atualizado_em timestamptz
+);
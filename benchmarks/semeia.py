@@ -0,0 +1,154 @@
+""" Cria e popula o banco de dados da suíte de benchmarks
+
+O banco é recriado do zero a cada execução: esquema (benchmarks/schema.sql),
+migrações do diretório migracoes (aplicadas por migracao.py) e dados gerados a
+partir de uma semente fixa, de modo que duas execuções com os mesmos parâmetros
+produzem o mesmo banco.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/semeia.py [--host localhost] [--porta 54329] [--usuario postgres] [--senha ...]
+                                [--banco badminton_bench] [--semente 42] [--jogadores 200] [--partidas 300]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+
+import psycopg2
+import psycopg2.extras
+
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+import migracao  # noqa: E402
+
+
+GOLPES = ['Saque curto', 'Saque longo', 'Clear', 'Drop', 'Smash', 'Drive', 'Lob', 'Deixada', 'Push', 'Kill']
+TIPOS_ERRO = ['Rede', 'Fora', 'Falta', 'Toque duplo']
+LADOS = ['esquerdo', 'direito']
+LATERALIDADES = ['naoinformado', 'destro', 'canhoto', 'ambidestro']
+MODALIDADES = ['misto', 'feminino', 'masculino']
+
+
+def argumentos_conexao(parser):
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--porta', type=int, default=54329)
+    parser.add_argument('--usuario', default='postgres')
+    parser.add_argument('--senha', default='')
+    parser.add_argument('--banco', default='badminton_bench')
+
+
+def conecta(args, banco):
+    return psycopg2.connect(host=args.host, port=args.porta, user=args.usuario, password=args.senha, dbname=banco)
+
+
+def recria_banco(args):
+    connection = conecta(args, 'postgres')
+    connection.autocommit = True
+    cursor = connection.cursor()
+    cursor.execute('drop database if exists ' + args.banco)
+    cursor.execute('create database ' + args.banco)
+    cursor.close()
+    connection.close()
+
+
+def placar_set(aleatorio):
+    """ Sorteia a pontuação final de um set (acertos, erros) seguindo a regra dos 21 pontos """
+
+    vencedor = 21
+    perdedor = aleatorio.randint(5, 19)
+    if aleatorio.random() < 0.2:
+        # Set disputado: prorrogação até abrir dois pontos ou chegar a 30
+        vencedor = aleatorio.randint(22, 30)
+        perdedor = vencedor - 2 if vencedor < 30 else 29
+    if aleatorio.random() < 0.5:
+        return vencedor, perdedor
+    return perdedor, vencedor
+
+
+def popula(cursor, args):
+    aleatorio = random.Random(args.semente)
+    agora = datetime.datetime(2022, 5, 1, 10, 0, 0)
+
+    psycopg2.extras.execute_values(cursor, "insert into golpe (descricao_golpe) values %s", [(golpe,) for golpe in GOLPES])
+    psycopg2.extras.execute_values(cursor, "insert into tipoerro (descricao_erro) values %s", [(erro,) for erro in TIPOS_ERRO])
+    quadrantes = [('Q %02d' % numero, lado) for lado in LADOS for numero in range(1, 7)]
+    psycopg2.extras.execute_values(cursor, "insert into quadrante (descricao_quadrante, lado) values %s", quadrantes)
+
+    jogadores = []
+    for numero in range(args.jogadores):
+        jogadores.append(('Jogador %04d' % numero, datetime.date(1990, 1, 1) + datetime.timedelta(days=aleatorio.randint(0, 9000)),
+                          '5499%07d' % numero, 'jogador%04d@exemplo.com' % numero, aleatorio.choice(LATERALIDADES),
+                          '', agora, agora))
+    psycopg2.extras.execute_values(cursor, "insert into jogador (nome_jogador, data_nascimento, telefone, email, \
+                                            lateralidade, foto, criado_em, atualizado_em) values %s", jogadores)
+
+    for numero in range(args.partidas):
+        tipo_jogo = aleatorio.choice(['simples', 'dupla'])
+        ids = aleatorio.sample(range(1, args.jogadores + 1), 4)
+        if tipo_jogo == 'simples':
+            ids[1] = None
+            ids[3] = None
+        data_partida = datetime.date(2022, 1, 1) + datetime.timedelta(days=numero % 365)
+        cursor.execute("insert into partida (nome, data_partida, tipo_jogo, modalidade, jogador_1_id, jogador_2_id, \
+                            jogador_adversario_1_id, jogador_adversario_2_id, criado_em, atualizado_em) \
+                        values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) returning id",
+                       ('Partida %04d' % numero, data_partida, tipo_jogo, aleatorio.choice(MODALIDADES),
+                        ids[0], ids[1], ids[2], ids[3], agora, agora))
+        id_partida = cursor.fetchone()[0]
+
+        # Melhor de três: a última partida fica em andamento (segundo set incompleto)
+        quantidade_sets = aleatorio.choice([2, 2, 3])
+        for ordem in range(1, quantidade_sets + 1):
+            cursor.execute("insert into set (partida_id, ordem, criado_em, atualizado_em) values (%s, %s, %s, %s) returning id",
+                           (id_partida, ordem, agora, agora))
+            id_set = cursor.fetchone()[0]
+
+            acertos, erros = placar_set(aleatorio)
+            if numero == args.partidas - 1 and ordem == quantidade_sets:
+                acertos, erros = acertos // 2, erros // 2
+
+            jogadas = []
+            for acerto in [True] * acertos + [False] * erros:
+                tipo_erro = None if acerto else aleatorio.randint(1, len(TIPOS_ERRO))
+                jogadas.append((id_set, aleatorio.randint(1, len(GOLPES)), aleatorio.randint(1, len(quadrantes)),
+                                tipo_erro, acerto, agora, agora))
+            aleatorio.shuffle(jogadas)
+            psycopg2.extras.execute_values(cursor, "insert into jogada (set_id, golpe_id, quadrante_id, tipo_erro_id, \
+                                                    acerto, criado_em, atualizado_em) values %s", jogadas, page_size=100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    argumentos_conexao(parser)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--jogadores', type=int, default=200)
+    parser.add_argument('--partidas', type=int, default=300)
+    args = parser.parse_args()
+
+    recria_banco(args)
+
+    connection = conecta(args, args.banco)
+    cursor = connection.cursor()
+    with open(os.path.join(RAIZ, 'benchmarks', 'schema.sql')) as f:
+        cursor.execute(f.read())
+
+    # Os dados são inseridos antes das migrações para que as cargas iniciais delas também sejam exercitadas
+    popula(cursor, args)
+    connection.commit()
+
+    # Pelo mesmo executor da produção: os índices são criados com CONCURRENTLY, fora de transação
+    migracao.aplica(connection)
+
+    cursor.execute("analyze")
+    connection.commit()
+    cursor.close()
+    connection.close()
+    print('banco ' + args.banco + ' criado: ' + str(args.jogadores) + ' jogadores, ' + str(args.partidas) + ' partidas')
+
+
+if __name__ == '__main__':
+    main()
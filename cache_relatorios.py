@@ -0,0 +1,73 @@
+""" Cache dos relatórios de partida, versionado por partida
+
+Cada partida tem um contador de versão (tabela versao_partida) incrementado na
+mesma transação que grava os seus sets e jogadas. Os relatórios são guardados
+já codificados em JSON, por (partida, versão da rota, formato), junto com a
+versão da partida usada para montá-los; um relatório só é reaproveitado
+enquanto a versão da partida no banco (lida por condicional.estado_partida)
+for a mesma.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class CacheRelatorios:
+    """ Cache LRU com até `maximo` relatórios codificados """
+
+    def __init__(self, maximo=256):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # chave: (versão da partida, corpo)
+        self._acertos = 0
+        self._falhas = 0
+        self._descartes = 0
+        self._desatualizados = 0
+
+    def obtem(self, chave, versao):
+        """ Devolve o corpo guardado para a chave, ou None se ausente ou montado com outra versão da partida """
+
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None and item[0] == versao:
+                self._itens.move_to_end(chave)
+                self._acertos += 1
+                return item[1]
+
+            self._falhas += 1
+            if item is not None:
+                del self._itens[chave]
+                self._desatualizados += 1
+            return None
+
+    def guarda(self, chave, versao, corpo):
+        """ Guarda o corpo montado com a versão informada, descartando os relatórios menos usados """
+
+        if self.maximo <= 0:
+            return
+
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None and item[0] > versao:
+                # Outra requisição já guardou o relatório de uma versão mais nova
+                return
+
+            self._itens[chave] = (versao, corpo)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+                self._descartes += 1
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'itens': len(self._itens),
+                'maximo': self.maximo,
+                'acertos': self._acertos,
+                'falhas': self._falhas,
+                'descartes': self._descartes,
+                'desatualizados': self._desatualizados,
+            }
+
+
+relatorios = CacheRelatorios()
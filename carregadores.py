@@ -0,0 +1,122 @@
+""" Consultas em lote e montagem das respostas das rotas de jogadores e partidas
+
+Cada função executa uma única consulta para todas as partidas (ou jogadores)
+informadas, evitando uma ida ao banco por registro.
+"""
+
+from midia import armazenamento
+from placar import placar_set
+from paralelo import consultas_paralelas
+
+
+def carrega_jogadores(cursor, ids_jogador):
+    """ Devolve um dict {id: {'nome', 'id'}} com os jogadores informados, pesquisados em uma única consulta """
+
+    ids = sorted({id_jogador for id_jogador in ids_jogador if id_jogador})
+    if not ids:
+        return {}
+
+    bloco = " select jogador.nome_jogador, jogador.id from jogador where jogador.id = any(%s) "
+    cursor.execute(bloco, (ids,))
+
+    jogadores = {}
+    for line in cursor.fetchall():
+        jogadores[line[1]] = {
+            'nome': line[0],
+            'id': line[1],
+        }
+    return jogadores
+
+
+bloco_sets = " select set.id, set.ordem, set.partida_id, \
+                count(jogada.id) filter (where jogada.acerto), count(jogada.id) filter (where not jogada.acerto) \
+                from set left join jogada on (jogada.set_id = set.id) "
+
+
+def carrega_sets(cursor, ids_partida):
+    """ Devolve um dict {partida_id: [(set_id, ordem, acertos, erros), ...]} com os sets das partidas
+        informadas e a pontuação de cada um, calculada em uma única consulta agregada """
+
+    sets_partida = {id_partida: [] for id_partida in ids_partida}
+    if not sets_partida:
+        return sets_partida
+
+    bloco = bloco_sets + " where set.partida_id = any(%s) group by set.id order by set.id "
+    cursor.execute(bloco, (list(sets_partida),))
+
+    for line in cursor.fetchall():
+        sets_partida[line[2]].append((line[0], line[1], line[3], line[4]))
+    return sets_partida
+
+
+def carrega_set(cursor, id_set):
+    """ Devolve (set_id, partida_id, ordem, acertos, erros) do set informado ou None """
+
+    bloco = bloco_sets + " where set.id = %s group by set.id "
+    cursor.execute(bloco, (id_set,))
+
+    line = cursor.fetchone()
+    if not line:
+        return None
+    return (line[0], line[2], line[1], line[3], line[4])
+
+
+def monta_jogadores(cursor, jogadores_data):
+    """ Devolve a lista de jogadores no formato das rotas get_jogador(es) """
+
+    output_jogadores = []
+    for line in jogadores_data:
+        lineout_jogador = {}
+        lineout_jogador['id'] = line[0]
+        lineout_jogador['nome'] = line[1]
+        lineout_jogador['data_nascimento'] = line[2]
+        lineout_jogador['telefone'] = line[3]
+        lineout_jogador['email'] = line[4]
+        lineout_jogador['lateralidade'] = line[5]
+        lineout_jogador['foto'], lineout_jogador['miniaturas'] = armazenamento.urls_foto(line[6])
+
+        output_jogadores.append(lineout_jogador)
+    return output_jogadores
+
+
+def monta_partidas(cursor, partidas_data):
+    """ Devolve a lista de partidas no formato da rota get_partidas, com jogadores e sets
+        pesquisados em duas consultas para todas as partidas informadas """
+
+    # Pesquisa os jogadores e os sets de todas as partidas de uma só vez, as duas consultas ao mesmo tempo
+    ids_jogador = [id_jogador for line in partidas_data for id_jogador in line[5:9]]
+    ids_partida = [line[0] for line in partidas_data]
+    jogadores, sets_partidas = consultas_paralelas(cursor,
+                                                   lambda cursor: carrega_jogadores(cursor, ids_jogador),
+                                                   lambda cursor: carrega_sets(cursor, ids_partida))
+
+    output_partidas = []
+    for line in partidas_data:
+        lineout_partida = {}
+        id_partida = line[0]
+        lineout_partida['id'] = line[0]
+        lineout_partida['data'] = line[1]
+        lineout_partida['tipo_jogo'] = line[2]
+        lineout_partida['modalidade'] = line[3]
+        lineout_partida['nome'] = line[4]
+
+        # Insere dados do jogador: uma partida pode ter dois ou quatro jogadores
+        lineout_partida['jogador_1'] = jogadores.get(line[5], {})
+        lineout_partida['jogador_2'] = jogadores.get(line[6], {})
+        lineout_partida['jogador_adversario_1'] = jogadores.get(line[7], {})
+        lineout_partida['jogador_adversario_2'] = jogadores.get(line[8], {})
+
+        # Devolve os sets relacionados às partidas pesquisadas
+        output_set = []
+        for set_data in sets_partidas[id_partida]:
+            set_partida = {}
+            set_partida['id_set'] = set_data[0]
+            set_partida['ordem_set'] = set_data[1]
+
+            # Devolve pontuação e verifica se o jogo deve continuar ou parar
+            set_partida.update(placar_set(set_data[2], set_data[3]))
+            output_set.append(set_partida)
+
+        lineout_partida['sets'] = output_set
+        output_partidas.append(lineout_partida)
+    return output_partidas
@@ -0,0 +1,183 @@
+""" Gravação de jogadas com commit em grupo
+
+Jogadas recebidas por requisições simultâneas do mesmo worker são enfileiradas
+e gravadas em micro-lotes, em uma única transação por lote. Cada requisição
+aguarda o commit do seu lote e recebe o placar do set imediatamente após a sua
+própria jogada.
+
+Se o tempo de espera acabar antes de o gravador reservar a jogada para um lote,
+a jogada é cancelada (nunca será gravada) e grava levanta JogadaNaoGravada: a
+requisição pode ser reenviada. Se o lote já estava sendo gravado, grava aguarda
+o seu término por mais `espera_gravacao` segundos; esgotado também esse tempo,
+levanta GravacaoIncerta: a jogada pode ter sido gravada e só deve ser reenviada
+depois de conferido o placar do set.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+from db import conexao_avulsa
+from jogadas import grava_jogadas
+from metricas import HistogramaExportado
+
+
+# Compartilhados pelos gravadores do processo e exportados em /metrics
+tamanho_lote = HistogramaExportado('badminton_commit_em_grupo_lote', 'Jogadas por lote do commit em grupo',
+                                   [1, 2, 5, 10, 20, 50, 100, 200])
+latencia_flush_ms = HistogramaExportado('badminton_commit_em_grupo_gravacao_milissegundos',
+                                        'Duração da gravação de cada lote do commit em grupo',
+                                        [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000])
+
+
+class JogadaNaoGravada(TimeoutError):
+    """ A jogada foi cancelada por tempo esgotado antes de ser gravada e pode ser reenviada """
+
+
+class GravacaoIncerta(TimeoutError):
+    """ O tempo acabou durante a gravação do lote da jogada: ela pode ter sido gravada """
+
+
+class _Pedido:
+
+    def __init__(self, jogada):
+        self.jogada = jogada
+        self.placar = None
+        self.erro = None
+        self.concluido = threading.Event()
+        self._lock = threading.Lock()
+        self._estado = 'pendente'  # pendente, reservado (em um lote sendo gravado) ou cancelado
+
+    def reserva(self):
+        """ Reserva a jogada para o lote que será gravado; devolve False se ela foi cancelada """
+
+        with self._lock:
+            if self._estado == 'pendente':
+                self._estado = 'reservado'
+            return self._estado == 'reservado'
+
+    def cancela(self):
+        """ Cancela a jogada que ainda não foi reservada; devolve False se ela já está em um lote """
+
+        with self._lock:
+            if self._estado == 'pendente':
+                self._estado = 'cancelado'
+            return self._estado == 'cancelado'
+
+
+class GravadorEmGrupo:
+    """ Agrupa jogadas em lotes de até `max_lote` itens ou `max_espera_ms` milissegundos """
+
+    def __init__(self, max_lote=50, max_espera_ms=5):
+        self.max_lote = max_lote
+        self.max_espera_ms = max_espera_ms
+        self.tamanho_lote = tamanho_lote
+        self.latencia_flush_ms = latencia_flush_ms
+
+        self._fila = queue.Queue()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _inicia(self):
+        # A thread de gravação pertence ao processo; após um fork é criada novamente
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._fila = queue.Queue()
+                thread = threading.Thread(target=self._executa, name='commit_em_grupo', daemon=True)
+                thread.start()
+                self._pid = os.getpid()
+
+    def grava(self, jogada, espera=30, espera_gravacao=10):
+        """ Enfileira a jogada (mesma tupla de grava_jogadas) e devolve (ordem, acertos, erros) do seu set
+            após o commit do lote; levanta a exceção do banco se a jogada não pôde ser gravada, JogadaNaoGravada
+            se ela foi cancelada após `espera` segundos e GravacaoIncerta se o resultado não é conhecido """
+
+        self._inicia()
+        pedido = _Pedido(jogada)
+        self._fila.put(pedido)
+
+        if not pedido.concluido.wait(espera):
+            if pedido.cancela():
+                raise JogadaNaoGravada('tempo esgotado aguardando a gravação: a jogada não foi gravada e pode ser reenviada')
+            if not pedido.concluido.wait(espera_gravacao):
+                raise GravacaoIncerta('tempo esgotado durante a gravação: a jogada pode ter sido gravada, '
+                                      'confira o placar do set antes de reenviá-la')
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.placar
+
+    def _executa(self):
+        while True:
+            lote = [self._fila.get()]
+            limite = time.monotonic() + self.max_espera_ms / 1000
+            while len(lote) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+
+            inicio = time.monotonic()
+            try:
+                self._grava_lote(lote)
+            except Exception as error:
+                if len(lote) == 1:
+                    lote[0].erro = error
+                    continue
+                # Uma jogada inválida não deve derrubar o lote inteiro: grava uma a uma
+                logging.warning('Falha ao gravar lote de jogadas, gravando individualmente: ' + str(error).rstrip())
+                for pedido in lote:
+                    try:
+                        self._grava_lote([pedido])
+                    except Exception as error_pedido:
+                        pedido.erro = error_pedido
+            finally:
+                self.tamanho_lote.observa(len(lote))
+                self.latencia_flush_ms.observa((time.monotonic() - inicio) * 1000)
+                for pedido in lote:
+                    pedido.concluido.set()
+
+    def _grava_lote(self, lote):
+        with conexao_avulsa() as connection:
+            # Reservadas só depois de obtida a conexão: enquanto o gravador aguarda o pool, as requisições
+            # com tempo esgotado ainda podem cancelar as suas jogadas
+            lote = [pedido for pedido in lote if pedido.reserva()]
+            if not lote:
+                return
+
+            cursor = connection.cursor()
+            try:
+                placares = grava_jogadas(cursor, [pedido.jogada for pedido in lote])
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+        # O placar devolvido é o final do lote; percorrendo o lote de trás para frente,
+        # obtém-se o placar do set logo após cada jogada
+        atual = {set_id: [acertos, erros] for set_id, (ordem, acertos, erros) in placares.items()}
+        for pedido in reversed(lote):
+            set_id = pedido.jogada[0]
+            acerto = pedido.jogada[4]
+            ordem = placares[set_id][0]
+            pedido.placar = (ordem, atual[set_id][0], atual[set_id][1])
+            if acerto:
+                atual[set_id][0] -= 1
+            elif acerto is not None:
+                atual[set_id][1] -= 1
+
+    def estatisticas(self):
+        return {
+            'max_lote': self.max_lote,
+            'max_espera_ms': self.max_espera_ms,
+            'tamanho_lote': self.tamanho_lote.resumo(),
+            'latencia_flush_ms': self.latencia_flush_ms.resumo(),
+        }
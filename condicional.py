@@ -0,0 +1,100 @@
+""" Requisições condicionais (ETag / Last-Modified) das rotas de partida, set e relatório
+
+O estado da partida (versão, quantidade de jogadas e data da última alteração)
+é lido em uma única consulta, antes de qualquer outra. Se o cliente já tem a
+representação atual, a rota responde 304 sem montar a resposta.
+"""
+
+import datetime
+
+from flask import current_app, request
+
+from placar import partida_encerrada
+
+
+# Um ano: arquivos nomeados pelo hash do conteúdo (fotos) nunca mudam
+IDADE_IMUTAVEL = 31536000
+
+# Cinco minutos: a partida encerrada ainda pode receber correções (novas jogadas ou sets), que ficam
+# visíveis para o cliente ao fim desse prazo, quando ele revalida a resposta pelo ETag
+IDADE_ENCERRADA = 300
+
+# Última alteração: a maior data entre a partida e a sua versão, convertidas para o mesmo tipo (timestamp
+# sem fuso, na hora local em que são gravadas) para não depender do tipo de partida.atualizado_em
+bloco_estado_partida = " select partida.id, \
+                greatest(partida.atualizado_em::timestamp, versao_partida.atualizado_em::timestamp), \
+                versao_partida.versao, set.id, placar_set.acertos, placar_set.erros \
+                from partida \
+                left join versao_partida on (versao_partida.partida_id = partida.id) \
+                left join set on (set.partida_id = partida.id) \
+                left join placar_set on (placar_set.set_id = set.id) "
+
+
+def estado_partida(cursor, id_partida=None, id_set=None):
+    """ Devolve {'versao', 'etag', 'ultima_modificacao', 'encerrada'} da partida (ou da partida do set
+        informado), ou None se ela não existir """
+
+    if id_set is not None:
+        bloco = bloco_estado_partida + " where partida.id = (select set.partida_id from set where set.id = %s) "
+        cursor.execute(bloco, (id_set,))
+    else:
+        bloco = bloco_estado_partida + " where partida.id = %s "
+        cursor.execute(bloco, (id_partida,))
+
+    linhas = cursor.fetchall()
+    if not linhas:
+        return None
+
+    partida_id, atualizada_em, versao = linhas[0][0:3]
+    versao = versao or 0
+
+    placares = [(line[4] or 0, line[5] or 0) for line in linhas if line[3] is not None]
+    jogadas = sum(acertos + erros for acertos, erros in placares)
+
+    # Os horários são gravados na hora local do servidor da API (datetime.now())
+    ultima_modificacao = (atualizada_em or datetime.datetime.now()).astimezone(datetime.timezone.utc)
+
+    return {
+        'versao': versao,
+        'etag': 'p%d-%d-%d-%d' % (partida_id, versao, jogadas, int(ultima_modificacao.timestamp() * 1000000)),
+        'ultima_modificacao': ultima_modificacao,
+        'encerrada': bool(placares) and partida_encerrada(placares),
+    }
+
+
+def nao_modificada(estado):
+    """ Indica se a representação que o cliente tem (If-None-Match / If-Modified-Since) ainda é a atual """
+
+    if estado is None:
+        return False
+
+    # If-None-Match tem precedência; If-Modified-Since só é considerado na sua ausência
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(estado['etag'])
+
+    if request.if_modified_since:
+        return estado['ultima_modificacao'].replace(microsecond=0) <= request.if_modified_since
+
+    return False
+
+
+def com_validadores(resposta, estado):
+    """ Acrescenta ETag, Last-Modified e Cache-Control à resposta """
+
+    if estado is None:
+        return resposta
+
+    resposta.set_etag(estado['etag'])
+    resposta.last_modified = estado['ultima_modificacao']
+    if estado['encerrada']:
+        resposta.headers['Cache-Control'] = 'max-age=' + str(IDADE_ENCERRADA) + ', must-revalidate'
+    else:
+        # Partida em andamento: o cliente pode guardar a resposta, mas deve revalidá-la a cada uso
+        resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+
+def resposta_nao_modificada(estado):
+    """ Devolve a resposta 304 com os mesmos validadores da resposta completa """
+
+    return com_validadores(current_app.response_class(status=304), estado)
@@ -0,0 +1,241 @@
+""" Pool de conexões com o banco de dados PostgreSQL
+
+Cada processo (worker do gunicorn) mantém o seu próprio pool, criado na
+primeira utilização. Cada requisição recebe uma única conexão, guardada em
+flask.g, que é devolvida ao pool ao final da requisição. As conexões são
+instrumentadas (instrumentacao.py) para medir os comandos de cada requisição.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from flask import g
+
+from instrumentacao import ConexaoInstrumentada, associa, medicao_atual
+
+
+class PoolEsgotado(Exception):
+    """ Nenhuma conexão ficou disponível dentro do tempo de espera """
+
+
+class PoolConexoes:
+    """ Pool de conexões com limite de tamanho, espera bloqueante e validação das conexões """
+
+    def __init__(self, parametros, maximo=10, espera=30, idade_maxima=1800, ociosidade_validacao=30):
+        self.parametros = parametros
+        self.maximo = maximo
+        self.espera = espera
+        self.idade_maxima = idade_maxima
+        self.ociosidade_validacao = ociosidade_validacao
+        self.pid = os.getpid()
+
+        self._condicao = threading.Condition()
+        self._livres = []  # (conexão, devolvida_em)
+        self._criadas_em = {}
+        self._em_uso = 0
+        self._aguardando = 0
+        self._criadas = 0
+        self._recicladas = 0
+
+    def _conecta(self):
+        connection = psycopg2.connect(**self.parametros)
+        with self._condicao:
+            self._criadas += 1
+            self._criadas_em[id(connection)] = time.monotonic()
+        return connection
+
+    def _descarta(self, connection):
+        with self._condicao:
+            self._criadas_em.pop(id(connection), None)
+            self._recicladas += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _valida(self, connection, devolvida_em):
+        """ Verifica se a conexão ociosa ainda está utilizável (executado fora do lock do pool) """
+
+        if connection.closed:
+            return False
+
+        if time.monotonic() - self._criadas_em.get(id(connection), 0) > self.idade_maxima:
+            return False
+
+        if time.monotonic() - devolvida_em > self.ociosidade_validacao:
+            try:
+                cursor = connection.cursor()
+                cursor.execute("select 1")
+                cursor.close()
+                connection.rollback()
+            except psycopg2.Error:
+                return False
+
+        return True
+
+    def obtem(self, espera=None):
+        """ Retira uma conexão do pool, aguardando até `espera` segundos (padrão: o do pool) se todas estiverem em uso """
+
+        if espera is None:
+            espera = self.espera
+        limite = time.monotonic() + espera
+        while True:
+            # Sob o lock apenas a reserva da vaga (conexão livre ou nova); os comandos no banco
+            # (validação e abertura da conexão) são executados fora dele, sem bloquear as demais threads
+            with self._condicao:
+                livre = None
+                while True:
+                    if self._livres:
+                        livre = self._livres.pop()
+                        break
+                    if self._em_uso < self.maximo:
+                        break
+
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise PoolEsgotado('nenhuma conexão disponível no pool')
+
+                    self._aguardando += 1
+                    try:
+                        self._condicao.wait(restante)
+                    finally:
+                        self._aguardando -= 1
+                self._em_uso += 1
+
+            if livre is None:
+                try:
+                    return self._conecta()
+                except Exception:
+                    self._libera_vaga()
+                    raise
+
+            connection, devolvida_em = livre
+            if self._valida(connection, devolvida_em):
+                return connection
+            self._descarta(connection)
+            self._libera_vaga()
+
+    def _libera_vaga(self):
+        with self._condicao:
+            self._em_uso -= 1
+            self._condicao.notify()
+
+    def devolve(self, connection):
+        """ Devolve a conexão ao pool, descartando-a se estiver quebrada """
+
+        # O rollback da transação aberta pela requisição é feito fora do lock
+        reciclar = connection.closed
+        if not reciclar:
+            try:
+                if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                reciclar = True
+
+        with self._condicao:
+            self._em_uso -= 1
+            guardada = not reciclar and len(self._livres) < self.maximo
+            if guardada:
+                self._livres.append((connection, time.monotonic()))
+            self._condicao.notify()
+
+        if not guardada:
+            self._descarta(connection)
+
+    def fecha(self):
+        with self._condicao:
+            while self._livres:
+                connection, devolvida_em = self._livres.pop()
+                self._descarta(connection)
+
+    def estatisticas(self):
+        with self._condicao:
+            return {
+                'em_uso': self._em_uso,
+                'livres': len(self._livres),
+                'aguardando': self._aguardando,
+                'criadas': self._criadas,
+                'recicladas': self._recicladas,
+                'maximo': self.maximo,
+            }
+
+
+_config = None
+_pool = None
+_pools_herdados = []
+_lock_pool = threading.Lock()
+
+
+def configura(config):
+    """ Registra a configuração do banco (apibadminton.json) usada para criar o pool """
+
+    global _config
+    _config = config
+
+
+def get_pool():
+    """ Devolve o pool do processo atual, recriando-o após um fork """
+
+    global _pool
+    if _pool is not None and _pool.pid == os.getpid():
+        return _pool
+
+    with _lock_pool:
+        if _pool is None or _pool.pid != os.getpid():
+            # Conexões herdadas do processo pai não podem ser reutilizadas no filho. O pool antigo
+            # é mantido referenciado para que o coletor de lixo não encerre os sockets do pai.
+            if _pool is not None:
+                _pools_herdados.append(_pool)
+
+            parametros = {
+                'host': _config['DATABASE_HOST'],
+                'database': _config['DATABASE_NAME'],
+                'user': _config['DATABASE_USER'],
+                'password': _config['DATABASE_PASSWORD'],
+                'connection_factory': ConexaoInstrumentada,
+            }
+            _pool = PoolConexoes(parametros,
+                                 maximo=_config.get('DATABASE_POOL_MAX', 10),
+                                 espera=_config.get('DATABASE_POOL_TIMEOUT', 30))
+    return _pool
+
+
+def get_conexao():
+    """ Devolve a conexão da requisição atual, obtendo-a do pool na primeira chamada """
+
+    medicao = medicao_atual()
+    if 'conexao' not in g:
+        inicio = time.perf_counter()
+        g.conexao = get_pool().obtem()
+        if medicao is not None:
+            medicao.tempo_conexao += time.perf_counter() - inicio
+
+    # A conexão pode ter sido obtida antes do início da medição (ex.: before_first_request)
+    if medicao is not None:
+        associa(g.conexao, medicao)
+    return g.conexao
+
+
+def devolve_conexao(exception=None):
+    """ Devolve ao pool a conexão da requisição (registrado em app.teardown_appcontext) """
+
+    connection = g.pop('conexao', None)
+    if connection is not None:
+        associa(connection, None)
+        get_pool().devolve(connection)
+
+
+@contextmanager
+def conexao_avulsa():
+    """ Empresta uma conexão do pool para uso fora de uma requisição (tarefas de inicialização e de fundo) """
+
+    pool = get_pool()
+    connection = pool.obtem()
+    try:
+        yield connection
+    finally:
+        pool.devolve(connection)
@@ -0,0 +1,94 @@
+""" Estatísticas de carreira dos jogadores (rota get_jogador_estatisticas)
+
+Os totais vêm da tabela estatistica_jogador (migração 0005), atualizada a cada
+jogada gravada: a consulta lê apenas as linhas do jogador, uma por combinação
+de golpe, quadrante e tipo de erro, qualquer que seja a quantidade de jogadas.
+"""
+
+from referencias import referencias
+
+
+bloco_estatisticas_jogador = " select jogador.id, jogador.nome_jogador, estatistica_jogador.golpe_id, \
+                estatistica_jogador.quadrante_id, estatistica_jogador.tipo_erro_id, \
+                estatistica_jogador.acertos, estatistica_jogador.erros \
+                from jogador \
+                left join estatistica_jogador on (estatistica_jogador.jogador_id = jogador.id) \
+                where jogador.id = %s "
+
+
+def porcentagem(parte, total):
+    if not total:
+        return 0
+    return round(((parte / total)*100), 2)
+
+
+def _totais(acertos, erros):
+    total = acertos + erros
+    return {
+        'total': total,
+        'acertos': acertos,
+        'acertos_%': porcentagem(acertos, total),
+        'erros': erros,
+        'erros_%': porcentagem(erros, total),
+    }
+
+
+def monta_estatisticas(linhas):
+    """ Devolve as estatísticas do jogador a partir das linhas de bloco_estatisticas_jogador,
+        ou {} se o jogador não existir """
+
+    if not linhas:
+        return {}
+
+    golpes = {}
+    quadrantes = {}
+    tipos_erro = {}
+    acertos = 0
+    erros = 0
+    for line in linhas:
+        golpe_id, quadrante_id, tipo_erro_id, acertos_linha, erros_linha = line[2:7]
+        if golpe_id is None:
+            continue
+
+        acertos = acertos + acertos_linha
+        erros = erros + erros_linha
+
+        golpe = golpes.setdefault(golpe_id, [0, 0])
+        golpe[0] = golpe[0] + acertos_linha
+        golpe[1] = golpe[1] + erros_linha
+
+        quadrante = quadrantes.setdefault(quadrante_id, [0, 0])
+        quadrante[0] = quadrante[0] + acertos_linha
+        quadrante[1] = quadrante[1] + erros_linha
+
+        if erros_linha:
+            tipos_erro[tipo_erro_id] = tipos_erro.get(tipo_erro_id, 0) + erros_linha
+
+    output = {}
+    output['jogador'] = {'id': linhas[0][0], 'nome': linhas[0][1]}
+    output.update(_totais(acertos, erros))
+
+    output['golpes'] = []
+    for golpe_id in sorted(golpes):
+        lineout_golpe = {'golpe_id': golpe_id, 'golpe': referencias.descricao_golpe(golpe_id)}
+        lineout_golpe.update(_totais(*golpes[golpe_id]))
+        output['golpes'].append(lineout_golpe)
+
+    output['quadrantes'] = []
+    for quadrante_id in sorted(quadrantes):
+        lineout_quadrante = {'quadrante_id': quadrante_id, 'quadrante': referencias.descricao_quadrante(quadrante_id)}
+        lineout_quadrante.update(_totais(*quadrantes[quadrante_id]))
+        output['quadrantes'].append(lineout_quadrante)
+
+    # Erros sem tipo informado aparecem com tipo_erro_id 0
+    output['tipos_erro'] = []
+    for tipo_erro_id in sorted(tipos_erro):
+        descricao = referencias.descricao_tipo_erro(tipo_erro_id) if tipo_erro_id else 'Não informado'
+        output['tipos_erro'].append({
+            'tipo_erro_id': tipo_erro_id,
+            'tipo_erro': descricao,
+            'quantidade': tipos_erro[tipo_erro_id],
+            'erros_%': porcentagem(tipos_erro[tipo_erro_id], erros),
+        })
+
+    return output
@@ -0,0 +1,30 @@
+""" Executores de threads compartilhados pelas requisições de um worker """
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorPorProcesso:
+    """ ThreadPoolExecutor criado sob demanda, um por processo """
+
+    def __init__(self, max_workers, prefixo):
+        self.max_workers = max_workers
+        self.prefixo = prefixo
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def obtem(self):
+        """ Devolve o executor do processo atual """
+
+        # Threads não sobrevivem a um fork: cada processo (worker do gunicorn) cria o seu executor
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.prefixo)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, funcao, *args, **kwargs):
+        return self.obtem().submit(funcao, *args, **kwargs)
@@ -0,0 +1,55 @@
+""" Configuração do gunicorn
+
+Workers com threads (gthread): enquanto uma requisição aguarda o banco de
+dados, as demais threads do mesmo worker continuam atendendo. Com o mesmo
+número de processos (e praticamente a mesma memória) dos workers síncronos,
+cada worker atende várias requisições ao mesmo tempo. O pool de conexões
+(DATABASE_POOL_MAX) deve ser maior ou igual ao número de threads. O ganho
+depende da latência do banco: com o banco na mesma máquina, workers síncronos
+(GUNICORN_WORKER_CLASS=sync) são mais rápidos (benchmarks/README.md).
+
+As métricas de /metrics são somadas entre os workers pelo prometheus_client em
+modo multiprocesso, em arquivos do diretório PROMETHEUS_MULTIPROC_DIR (criado
+em um diretório temporário quando a variável não está definida).
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Definida antes de os workers importarem o prometheus_client, que só lê a variável na importação. A
+# marca do diretório temporário fica no ambiente: este arquivo é lido de novo a cada reload (HUP)
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='badminton-metricas-')
+    os.environ['BADMINTON_METRICAS_TEMPORARIAS'] = '1'
+
+
+def on_starting(server):
+    # Arquivos de uma execução anterior seriam somados às métricas dos workers atuais
+    diretorio = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(diretorio, exist_ok=True)
+    for arquivo in glob.glob(os.path.join(diretorio, '*.db')):
+        os.remove(arquivo)
+
+
+def post_worker_init(worker):
+    # Catálogos de referência carregados antes de o worker atender a primeira requisição
+    from app import carrega_referencias
+    carrega_referencias()
+
+
+def child_exit(server, worker):
+    # Os gauges do worker encerrado deixam de entrar na soma; os histogramas continuam acumulados
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if os.environ.get('BADMINTON_METRICAS_TEMPORARIAS'):
+        shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
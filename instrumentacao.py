@@ -0,0 +1,259 @@
+""" Instrumentação das requisições: comandos SQL, tempo de banco, de conexão e de serialização
+
+Cada requisição recebe uma Medicao (em flask.g). As conexões do pool são
+ConexaoInstrumentada e os seus cursores registram cada comando na medição
+associada à conexão enquanto ela está emprestada à requisição. No fim da
+requisição a medição vira o cabeçalho Server-Timing e alimenta os
+histogramas por rota exportados em /metrics.
+
+Comandos mais lentos que o limite configurado (configura_consultas_lentas) são
+registrados no logger 'badminton.consultas_lentas', um JSON por linha, com o
+SQL e os parâmetros redigidos e, por amostragem, o plano de execução.
+"""
+
+import datetime
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.sql
+from flask import g, has_app_context
+
+from metricas import HistogramasPorRota, LIMITES_SEGUNDOS, LIMITES_COMANDOS
+
+
+class Medicao:
+    """ Totais de uma requisição (tempos em segundos) """
+
+    def __init__(self, rota=None):
+        self.rota = rota
+        self.inicio = time.perf_counter()
+        self.comandos = 0
+        self.tempo_banco = 0.0
+        self.tempo_conexao = 0.0
+        self.tempo_serializacao = 0.0
+        self._lock = threading.Lock()
+
+    def registra_comando(self, duracao):
+        # Consultas paralelas da mesma requisição registram a partir de outras threads
+        with self._lock:
+            self.comandos += 1
+            self.tempo_banco += duracao
+
+    def duracao(self):
+        return time.perf_counter() - self.inicio
+
+
+def medicao_atual():
+    """ Devolve a medição da requisição atual, ou None fora de uma requisição """
+
+    if not has_app_context():
+        return None
+    return g.get('medicao')
+
+
+log_consultas_lentas = logging.getLogger('badminton.consultas_lentas')
+
+# Limite (segundos) a partir do qual um comando é registrado como lento; None desliga o registro
+_limite_lenta = None
+_amostra_explain = 0.0
+
+
+def configura_consultas_lentas(limite_ms, amostra_explain=0.1):
+    """ Liga o registro de comandos com duração >= limite_ms; uma fração `amostra_explain` dos SELECTs lentos
+        é executada de novo com EXPLAIN (ANALYZE, BUFFERS) para registrar o plano """
+
+    global _limite_lenta, _amostra_explain
+    _limite_lenta = limite_ms / 1000 if limite_ms is not None else None
+    _amostra_explain = amostra_explain
+
+
+_literais = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def _texto_sql(cursor, query):
+    if isinstance(query, psycopg2.sql.Composable):
+        query = query.as_string(cursor.connection)
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    return query
+
+
+def redige_sql(texto):
+    """ Substitui os literais (textos e números) do SQL por '?' (comandos montados com execute_values
+        chegam com os valores já incluídos no texto) """
+
+    return ' '.join(_literais.sub('?', texto).split())
+
+
+def redige_parametros(vars):
+    """ Devolve apenas o tipo (e o tamanho, para textos e listas) de cada parâmetro """
+
+    def tipo(valor):
+        if valor is None:
+            return 'null'
+        if isinstance(valor, (str, bytes, list, tuple)):
+            return '%s(%d)' % (type(valor).__name__, len(valor))
+        return type(valor).__name__
+
+    if vars is None:
+        return None
+    if isinstance(vars, dict):
+        return {nome: tipo(valor) for nome, valor in vars.items()}
+    return [tipo(valor) for valor in vars]
+
+
+def _plano(cursor, texto, vars):
+    # Cursor comum, fora da instrumentação, na mesma conexão e transação do comando original. O EXPLAIN
+    # roda em um savepoint: se falhar (ex.: statement_timeout), a transação da requisição continua utilizável
+    connection = cursor.connection
+    explain = connection.cursor(cursor_factory=psycopg2.extensions.cursor)
+    savepoint = not connection.autocommit
+    try:
+        if savepoint:
+            explain.execute('savepoint explain_lenta')
+        explain.execute('explain (analyze, buffers, format json) ' + texto, vars)
+        plano = explain.fetchone()[0]
+        if savepoint:
+            explain.execute('release savepoint explain_lenta')
+        return plano
+    except psycopg2.Error as error:
+        if savepoint:
+            try:
+                explain.execute('rollback to savepoint explain_lenta')
+                explain.execute('release savepoint explain_lenta')
+            except psycopg2.Error:
+                pass
+        return {'erro': str(error).rstrip()}
+    finally:
+        explain.close()
+
+
+def _registra_lenta(cursor, query, vars, duracao, medicao, executou):
+    texto = _texto_sql(cursor, query)
+    registro = {
+        'data': datetime.datetime.now().isoformat(timespec='milliseconds'),
+        'duracao_ms': round(duracao * 1000, 2),
+        'rota': medicao.rota if medicao is not None else None,
+        'sql': redige_sql(texto),
+        'parametros': redige_parametros(vars),
+    }
+
+    # O EXPLAIN ANALYZE executa o comando de novo: só para SELECTs, em cursores comuns, e por amostragem
+    if (executou and cursor.name is None and texto.lstrip().lower().startswith('select')
+            and random.random() < _amostra_explain):
+        registro['plano'] = _plano(cursor, texto, vars)
+
+    log_consultas_lentas.warning(json.dumps(registro, ensure_ascii=False, default=str))
+
+
+class CursorInstrumentado(psycopg2.extensions.cursor):
+    """ Cursor que registra a duração de cada comando na medição da conexão """
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        executou = False
+        try:
+            resultado = super().execute(query, vars)
+            executou = True
+            return resultado
+        finally:
+            self._registra(inicio, query, vars, executou)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._registra(inicio, query, None, False)
+
+    # Em cursores nomeados (do lado do servidor) cada leitura envia um FETCH ao banco
+    def fetchone(self):
+        if self.name is None:
+            return super().fetchone()
+        inicio = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._registra(inicio, 'fetch forward 1 from ' + self.name, None, False)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        if self.name is None:
+            return super().fetchmany(size)
+        inicio = time.perf_counter()
+        try:
+            return super().fetchmany(size)
+        finally:
+            self._registra(inicio, 'fetch forward %d from %s' % (size, self.name), None, False)
+
+    def fetchall(self):
+        if self.name is None:
+            return super().fetchall()
+        inicio = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._registra(inicio, 'fetch forward all from ' + self.name, None, False)
+
+    def _registra(self, inicio, query, vars, executou):
+        duracao = time.perf_counter() - inicio
+        medicao = getattr(self.connection, 'medicao', None)
+        if medicao is not None:
+            medicao.registra_comando(duracao)
+
+        if _limite_lenta is not None and duracao >= _limite_lenta:
+            try:
+                _registra_lenta(self, query, vars, duracao, medicao, executou)
+            except Exception as error:
+                logging.warning('Falha ao registrar comando lento: ' + str(error).rstrip())
+
+
+class ConexaoInstrumentada(psycopg2.extensions.connection):
+    """ Conexão cujos cursores são instrumentados; `medicao` é a medição da requisição que a está usando """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CursorInstrumentado
+        self.medicao = None
+
+
+def associa(connection, medicao):
+    """ Associa a conexão à medição de uma requisição (None desassocia) """
+
+    if isinstance(connection, ConexaoInstrumentada):
+        connection.medicao = medicao
+
+
+def server_timing(medicao):
+    """ Devolve o valor do cabeçalho Server-Timing da medição (durações em milissegundos) """
+
+    return ', '.join([
+        'db;dur=%.2f;desc="%d comandos SQL"' % (medicao.tempo_banco * 1000, medicao.comandos),
+        'conexao;dur=%.2f' % (medicao.tempo_conexao * 1000),
+        'serializacao;dur=%.2f' % (medicao.tempo_serializacao * 1000),
+        'total;dur=%.2f' % (medicao.duracao() * 1000),
+    ])
+
+
+duracao_requisicao = HistogramasPorRota('badminton_requisicao_segundos', 'Duração das requisições', LIMITES_SEGUNDOS)
+tempo_banco = HistogramasPorRota('badminton_banco_segundos', 'Tempo gasto em comandos SQL por requisição', LIMITES_SEGUNDOS)
+comandos_sql = HistogramasPorRota('badminton_comandos_sql', 'Comandos SQL por requisição', LIMITES_COMANDOS)
+tempo_conexao = HistogramasPorRota('badminton_conexao_segundos', 'Espera por uma conexão do pool por requisição', LIMITES_SEGUNDOS)
+tempo_serializacao = HistogramasPorRota('badminton_serializacao_segundos', 'Tempo de codificação JSON por requisição', LIMITES_SEGUNDOS)
+
+
+def registra(rota, medicao):
+    """ Acrescenta a medição da requisição aos histogramas da rota """
+
+    duracao_requisicao.observa(rota, medicao.duracao())
+    tempo_banco.observa(rota, medicao.tempo_banco)
+    comandos_sql.observa(rota, medicao.comandos)
+    tempo_conexao.observa(rota, medicao.tempo_conexao)
+    tempo_serializacao.observa(rota, medicao.tempo_serializacao)
@@ -0,0 +1,65 @@
+""" Gravação de jogadas e atualização do placar dos sets e das estatísticas dos jogadores """
+
+import psycopg2.extras
+
+
+# Insere as jogadas, soma os acertos/erros no placar dos sets e nas estatísticas dos jogadores
+# avaliados (migração 0005) e incrementa a versão das partidas em um único comando; o placar de
+# cada set afetado é devolvido já atualizado
+bloco_grava_jogadas = " with nova as ( \
+                insert into jogada (set_id, golpe_id, quadrante_id, tipo_erro_id, acerto, criado_em, atualizado_em) \
+                values %s \
+                returning set_id, golpe_id, quadrante_id, tipo_erro_id, acerto, atualizado_em \
+            ), placar as ( \
+                insert into placar_set (set_id, acertos, erros, atualizado_em) \
+                    select nova.set_id, count(*) filter (where nova.acerto), count(*) filter (where not nova.acerto), \
+                        max(nova.atualizado_em) \
+                    from nova group by nova.set_id \
+                on conflict (set_id) do update \
+                    set acertos = placar_set.acertos + excluded.acertos, \
+                        erros = placar_set.erros + excluded.erros, \
+                        atualizado_em = excluded.atualizado_em \
+                returning placar_set.set_id, placar_set.acertos, placar_set.erros, placar_set.atualizado_em \
+            ), versao as ( \
+                insert into versao_partida (partida_id, versao, atualizado_em) \
+                    select set.partida_id, 1, max(placar.atualizado_em) \
+                    from placar inner join set on (set.id = placar.set_id) group by set.partida_id \
+                on conflict (partida_id) do update \
+                    set versao = versao_partida.versao + 1, atualizado_em = excluded.atualizado_em \
+            ), estatistica as ( \
+                insert into estatistica_jogador (jogador_id, golpe_id, quadrante_id, tipo_erro_id, acertos, erros, \
+                        atualizado_em) \
+                    select jogador.id, nova.golpe_id, nova.quadrante_id, \
+                        case when nova.acerto then 0 else coalesce(nova.tipo_erro_id, 0) end, \
+                        count(*) filter (where nova.acerto), count(*) filter (where not nova.acerto), \
+                        max(nova.atualizado_em) \
+                    from nova \
+                    inner join set on (set.id = nova.set_id) \
+                    inner join partida on (partida.id = set.partida_id) \
+                    cross join lateral (values (partida.jogador_1_id), \
+                        (nullif(partida.jogador_2_id, partida.jogador_1_id))) as jogador (id) \
+                    where jogador.id is not null \
+                    group by 1, 2, 3, 4 \
+                    order by 1, 2, 3, 4 \
+                on conflict (jogador_id, golpe_id, quadrante_id, tipo_erro_id) do update \
+                    set acertos = estatistica_jogador.acertos + excluded.acertos, \
+                        erros = estatistica_jogador.erros + excluded.erros, \
+                        atualizado_em = excluded.atualizado_em \
+            ) \
+            select placar.set_id, set.ordem, placar.acertos, placar.erros \
+            from placar inner join set on (set.id = placar.set_id) "
+
+
+def grava_jogadas(cursor, jogadas):
+    """ Insere as jogadas (set_id, golpe_id, quadrante_id, tipo_erro_id, acerto, criado_em, atualizado_em)
+        e devolve um dict {set_id: (ordem, acertos, erros)} com o placar atualizado dos sets afetados.
+        Não faz commit: a gravação pertence à transação de quem chama """
+
+    if not jogadas:
+        return {}
+
+    # page_size cobre todas as jogadas para que o comando seja executado uma única vez
+    placares = psycopg2.extras.execute_values(cursor, bloco_grava_jogadas, jogadas,
+                                              page_size=len(jogadas), fetch=True)
+
+    return {line[0]: (line[1], line[2], line[3]) for line in placares}
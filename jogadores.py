@@ -0,0 +1,47 @@
+""" Gravação de jogadores """
+
+import psycopg2.extras
+
+
+# O índice único de jogador.nome_jogador (migração 0004) descarta os nomes já cadastrados no
+# próprio INSERT: não há pesquisa prévia nem janela entre a pesquisa e a inserção
+bloco_grava_jogadores = " insert into jogador (nome_jogador, data_nascimento, telefone, \
+                email, lateralidade, foto, criado_em, atualizado_em) \
+                values %s \
+                on conflict (nome_jogador) do nothing \
+                returning id, nome_jogador, data_nascimento, telefone, \
+                email, lateralidade, foto "
+
+
+def tupla_jogador(data, datetimenow):
+    """ Devolve a tupla de grava_jogadores a partir do JSON de um jogador (schema_jogador) """
+
+    foto = 'jogador/' + data["foto"]
+    return (data["nome"], data["data_nascimento"], data["telefone"], data["email"], data["lateralidade"],
+            foto, datetimenow, datetimenow)
+
+
+def grava_jogadores(cursor, jogadores):
+    """ Insere os jogadores (nome, data_nascimento, telefone, email, lateralidade, foto, criado_em, atualizado_em)
+        em um único comando e devolve as linhas dos jogadores inseridos; nomes já cadastrados (ou repetidos
+        na lista) são ignorados. Não faz commit: a gravação pertence à transação de quem chama """
+
+    if not jogadores:
+        return []
+
+    return psycopg2.extras.execute_values(cursor, bloco_grava_jogadores, jogadores,
+                                          page_size=len(jogadores), fetch=True)
+
+
+def monta_jogador_gravado(line):
+    """ Devolve o jogador gravado no formato da resposta de post_jogador """
+
+    jogador = {}
+    jogador['id'] = line[0]
+    jogador['nome'] = line[1]
+    jogador['data_nascimento'] = line[2]
+    jogador['telefone'] = line[3]
+    jogador['email'] = line[4]
+    jogador['lateralidade'] = line[5]
+    jogador['foto'] = line[6]
+    return jogador
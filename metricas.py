@@ -0,0 +1,104 @@
+""" Métricas da API no formato do Prometheus (prometheus_client)
+
+Com o gunicorn, o gunicorn.conf.py define PROMETHEUS_MULTIPROC_DIR antes de os
+workers importarem o prometheus_client: cada worker grava as suas métricas em
+arquivos desse diretório e a rota /metrics, atendida por qualquer worker,
+devolve a soma de todos. Sem a variável (servidor de desenvolvimento), as
+métricas ficam na memória do processo. O Histograma local alimenta os resumos
+da rota /health.
+"""
+
+import bisect
+import os
+import threading
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+
+class Histograma:
+    """ Histograma de buckets cumulativos (no estilo Prometheus), seguro entre threads """
+
+    def __init__(self, limites):
+        self.limites = sorted(limites)
+        self._lock = threading.Lock()
+        self._contagens = [0] * (len(self.limites) + 1)
+        self._soma = 0
+        self._total = 0
+
+    def observa(self, valor):
+        posicao = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            self._contagens[posicao] += 1
+            self._soma += valor
+            self._total += 1
+
+    def resumo(self):
+        """ Devolve os buckets cumulativos ({limite: quantidade <= limite}), a soma e o total de observações """
+
+        with self._lock:
+            contagens = list(self._contagens)
+            soma = self._soma
+            total = self._total
+
+        buckets = {}
+        acumulado = 0
+        for limite, contagem in zip(self.limites, contagens):
+            acumulado += contagem
+            buckets[str(limite)] = acumulado
+        buckets['+Inf'] = total
+
+        return {'buckets': buckets, 'soma': soma, 'total': total}
+
+
+class HistogramaExportado(Histograma):
+    """ Histograma local (resumo da rota /health) também exportado em /metrics, somado entre os workers """
+
+    def __init__(self, nome, ajuda, limites):
+        super().__init__(limites)
+        self.nome = nome
+        self._exportado = Histogram(nome, ajuda, buckets=limites)
+
+    def observa(self, valor):
+        super().observa(valor)
+        self._exportado.observe(valor)
+
+
+LIMITES_SEGUNDOS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+LIMITES_COMANDOS = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+
+
+class HistogramasPorRota:
+    """ Histograma do Prometheus com o rótulo rota """
+
+    def __init__(self, nome, ajuda, limites):
+        self.nome = nome
+        self._histograma = Histogram(nome, ajuda, ['rota'], buckets=limites)
+
+    def observa(self, rota, valor):
+        self._histograma.labels(rota=rota).observe(valor)
+
+
+class GaugesPorTipo:
+    """ Gauge do Prometheus com um valor por rótulo tipo, somado entre os workers em execução """
+
+    def __init__(self, nome, ajuda):
+        self.nome = nome
+        self._gauge = Gauge(nome, ajuda, ['tipo'], multiprocess_mode='livesum')
+
+    def atualiza(self, valores):
+        """ Registra os valores do worker atual ({tipo: valor}) """
+
+        for tipo, valor in valores.items():
+            self._gauge.labels(tipo=tipo).set(valor)
+
+
+def exposicao():
+    """ Devolve (corpo, content type) das métricas de todos os workers no formato de exposição do Prometheus """
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
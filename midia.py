@@ -0,0 +1,172 @@
+""" Recebimento e armazenamento das fotos enviadas pela rota upload_file
+
+O arquivo do formulário multipart é gravado em blocos, à medida que chega, em
+um arquivo temporário no diretório de upload, calculando o SHA-256 e limitando
+o tamanho durante a própria gravação. O arquivo é guardado com o nome
+<sha256>.<extensão>: o mesmo conteúdo enviado duas vezes ocupa um único
+arquivo. As miniaturas das imagens são geradas depois da resposta, em um pool
+de threads limitado, com o Pillow, quando instalado.
+
+As fotos são servidas pela rota /media/jogador/<nome> da API; as rotas de
+jogadores devolvem as URLs da foto e das miniaturas a partir de URLMEDIA.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+from executores import ExecutorPorProcesso
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+
+THREADS_MINIATURA = 2
+
+# Miniaturas aguardando geração; acima disso as novas são descartadas (e geradas quando pedidas)
+MAX_MINIATURAS_PENDENTES = 32
+
+_extensao_valida = re.compile(r'^\.[a-z0-9]{1,5}$')
+_nome_conteudo = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]{1,5})?$')
+
+
+class ArquivoGrandeDemais(RequestEntityTooLarge):
+    """ O arquivo enviado ultrapassou o tamanho máximo do upload """
+
+
+class ArquivoRecebido:
+    """ Arquivo temporário que calcula o SHA-256 e confere o tamanho de cada bloco gravado pelo parser do multipart """
+
+    def __init__(self, diretorio, tamanho_maximo):
+        # Temporário no próprio diretório de upload: o arquivo final é um link para ele, sem cópia
+        self._arquivo = tempfile.NamedTemporaryFile(dir=diretorio, prefix='.recebendo-')
+        self._hash = hashlib.sha256()
+        self.tamanho_maximo = tamanho_maximo
+        self.tamanho = 0
+
+    def write(self, dados):
+        self.tamanho += len(dados)
+        if self.tamanho_maximo is not None and self.tamanho > self.tamanho_maximo:
+            self._arquivo.close()
+            raise ArquivoGrandeDemais()
+        self._hash.update(dados)
+        return self._arquivo.write(dados)
+
+    def __getattr__(self, nome):
+        return getattr(self._arquivo, nome)
+
+    def __iter__(self):
+        return iter(self._arquivo)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+class RequisicaoComUpload(Request):
+    """ Requisição do Flask que recebe os arquivos do multipart em ArquivoRecebido (app.request_class) """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if armazenamento.diretorio is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return ArquivoRecebido(armazenamento.diretorio, armazenamento.tamanho_maximo)
+
+
+class ArmazenamentoMidia:
+    """ Diretório de upload com arquivos nomeados pelo conteúdo e as suas miniaturas """
+
+    def __init__(self, diretorio=None, url_base='', tamanho_maximo=15 * 1024 * 1024, miniaturas=(160, 640)):
+        self.diretorio = diretorio
+        self.url_base = url_base
+        self.tamanho_maximo = tamanho_maximo
+        self.miniaturas = miniaturas
+
+        self._executor = ExecutorPorProcesso(THREADS_MINIATURA, 'miniatura')
+        self._pendentes = threading.BoundedSemaphore(MAX_MINIATURAS_PENDENTES)
+
+    def guarda(self, recebido, nome_original):
+        """ Guarda o arquivo recebido com o nome <sha256>.<extensão>; devolve (nome, novo) """
+
+        extensao = os.path.splitext(secure_filename(nome_original or ''))[1].lower()
+        if not _extensao_valida.match(extensao):
+            extensao = ''
+        nome = recebido.hexdigest() + extensao
+        destino = os.path.join(self.diretorio, nome)
+
+        recebido.flush()
+        try:
+            os.link(recebido.name, destino)
+        except FileExistsError:
+            return nome, False
+        except OSError:
+            # Sistema de arquivos sem links: cópia para um temporário e troca atômica
+            temporario = destino + '.tmp-' + str(os.getpid()) + '-' + str(threading.get_ident())
+            shutil.copyfile(recebido.name, temporario)
+            os.replace(temporario, destino)
+        return nome, True
+
+    def nome_miniatura(self, nome, tamanho):
+        return os.path.splitext(nome)[0] + '_' + str(tamanho) + '.jpg'
+
+    def nome_por_conteudo(self, nome):
+        """ Indica se o nome é o hash do conteúdo (o arquivo nunca muda e pode ficar em cache indefinidamente) """
+
+        return bool(_nome_conteudo.match(nome))
+
+    def urls_foto(self, foto):
+        """ Devolve (url da foto, {lado: url da miniatura}) a partir do valor de jogador.foto, ou ('', {}) sem foto """
+
+        if not foto or foto.endswith('/'):
+            return '', {}
+
+        url = self.url_base.rstrip('/') + '/' + foto
+        return url, {str(tamanho): url + '?tamanho=' + str(tamanho) for tamanho in self.miniaturas}
+
+    def agenda_miniaturas(self, nome):
+        """ Agenda a geração das miniaturas do arquivo; devolve False se o Pillow não está instalado ou a fila está cheia """
+
+        if Image is None or not self.miniaturas:
+            return False
+        if not self._pendentes.acquire(blocking=False):
+            logging.warning('fila de miniaturas cheia: ' + nome + ' ficou sem miniaturas')
+            return False
+
+        futuro = self._executor.submit(self.gera_miniaturas, nome)
+        futuro.add_done_callback(lambda futuro: self._pendentes.release())
+        return True
+
+    def gera_miniaturas(self, nome):
+        """ Gera as miniaturas JPEG que ainda não existem, da maior para a menor """
+
+        faltando = [tamanho for tamanho in sorted(self.miniaturas, reverse=True)
+                    if not os.path.exists(os.path.join(self.diretorio, self.nome_miniatura(nome, tamanho)))]
+        if not faltando:
+            return
+
+        try:
+            with Image.open(os.path.join(self.diretorio, nome)) as original:
+                # JPEGs são decodificados já reduzidos (1/2 a 1/8) quando a maior miniatura permite
+                original.draft('RGB', (faltando[0], faltando[0]))
+                imagem = ImageOps.exif_transpose(original).convert('RGB')
+        except (OSError, Image.DecompressionBombError) as error:
+            logging.info('miniaturas de ' + nome + ' não geradas: ' + str(error))
+            return
+
+        for tamanho in faltando:
+            imagem.thumbnail((tamanho, tamanho), Image.LANCZOS)
+            destino = os.path.join(self.diretorio, self.nome_miniatura(nome, tamanho))
+            temporario = destino + '.tmp-' + str(os.getpid()) + '-' + str(threading.get_ident())
+            imagem.save(temporario, 'JPEG', quality=85, optimize=True)
+            os.replace(temporario, destino)
+
+
+armazenamento = ArmazenamentoMidia()
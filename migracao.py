@@ -0,0 +1,321 @@
+""" Migrações do banco de dados (scripts do diretório migracoes)
+
+Os scripts são aplicados em ordem de nome e registrados na tabela migracao, de
+modo que cada um é executado uma única vez por banco. Um script é executado em
+uma transação; os que começam com a linha '-- migracao: sem transacao' (ex.:
+CREATE INDEX CONCURRENTLY) são executados com autocommit, um comando por vez
+(comandos separados por ';', que não deve aparecer dentro de textos).
+
+Uso (a partir do diretório com o apibadminton.json):
+    python migracao.py aplicar      aplica as migrações pendentes
+    python migracao.py marcar N...  registra os scripts N (já executados manualmente) sem executá-los
+    python migracao.py status       lista as migrações aplicadas e pendentes
+    python migracao.py saude        verifica os índices e as leituras sequenciais das tabelas de jogadas
+"""
+
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import os
+import sys
+
+import psycopg2
+
+from validacao import valida, validador_config
+
+
+DIRETORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migracoes')
+
+MARCA_SEM_TRANSACAO = '-- migracao: sem transacao'
+
+bloco_tabela = " create table if not exists migracao ( \
+                    nome text primary key, \
+                    hash text not null, \
+                    aplicada_em timestamp not null) "
+
+# Índices de que as consultas dependem: (tabela, colunas iniciais do índice)
+INDICES_ESPERADOS = [
+    ('jogada', ['set_id']),
+    ('jogada', ['set_id', 'golpe_id', 'quadrante_id']),
+    ('set', ['partida_id']),
+    ('partida', ['data_partida']),
+    ('jogador', ['nome_jogador']),
+]
+
+# Tabelas que crescem com o total de jogadas do banco: leitura sequencial nelas é sinal de índice faltando
+TABELAS_QUENTES = ['jogada']
+
+bloco_indices = " select tabela.relname, indice.relname, pg_index.indisvalid, \
+                    array(select pg_attribute.attname \
+                          from unnest(pg_index.indkey) with ordinality as chave(attnum, posicao) \
+                          inner join pg_attribute on (pg_attribute.attrelid = pg_index.indrelid \
+                                                      and pg_attribute.attnum = chave.attnum) \
+                          order by chave.posicao) \
+                  from pg_index \
+                  inner join pg_class indice on (indice.oid = pg_index.indexrelid) \
+                  inner join pg_class tabela on (tabela.oid = pg_index.indrelid) \
+                  where tabela.relname = any(%s) and pg_table_is_visible(tabela.oid) \
+                  order by tabela.relname, indice.relname "
+
+bloco_leituras = " select relname, seq_scan, seq_tup_read, coalesce(idx_scan, 0), n_live_tup \
+                   from pg_stat_user_tables \
+                   where relname = any(%s) \
+                   order by relname "
+
+
+def scripts(diretorio=DIRETORIO):
+    """ Devolve os scripts de migração em ordem: [(nome, texto)] """
+
+    lista = []
+    for caminho in sorted(glob.glob(os.path.join(diretorio, '*.sql'))):
+        with open(caminho, encoding='utf-8') as f:
+            lista.append((os.path.basename(caminho), f.read()))
+    return lista
+
+
+def resumo(texto):
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def sem_transacao(texto):
+    return texto.lstrip().startswith(MARCA_SEM_TRANSACAO)
+
+
+def comandos(texto):
+    """ Separa o script em comandos, descartando as linhas de comentário """
+
+    linhas = [line for line in texto.splitlines() if not line.strip().startswith('--')]
+    return [trecho.strip() for trecho in '\n'.join(linhas).split(';') if trecho.strip()]
+
+
+def aplicadas(connection):
+    """ Devolve as migrações já registradas no banco: {nome: (hash, aplicada_em)} """
+
+    cursor = connection.cursor()
+    cursor.execute(bloco_tabela)
+    cursor.execute(" select nome, hash, aplicada_em from migracao ")
+    registros = {line[0]: (line[1], line[2]) for line in cursor.fetchall()}
+    cursor.close()
+    connection.commit()
+    return registros
+
+
+def indices_invalidos(connection, tabelas):
+    """ Devolve os índices inválidos das tabelas (deixados por um CREATE INDEX CONCURRENTLY interrompido) """
+
+    cursor = connection.cursor()
+    cursor.execute(bloco_indices, (tabelas,))
+    invalidos = [line[1] for line in cursor.fetchall() if not line[2]]
+    cursor.close()
+    connection.commit()
+    return invalidos
+
+
+def aplica(connection, diretorio=DIRETORIO, saida=print):
+    """ Aplica as migrações pendentes; devolve os nomes das migrações aplicadas """
+
+    registros = aplicadas(connection)
+    feitas = []
+    for nome, texto in scripts(diretorio):
+        if nome in registros:
+            if registros[nome][0] != resumo(texto):
+                saida('aviso: ' + nome + ' foi alterada depois de aplicada')
+            continue
+
+        saida('aplicando ' + nome)
+        cursor = connection.cursor()
+        if sem_transacao(texto):
+            connection.autocommit = True
+            try:
+                for comando in comandos(texto):
+                    cursor.execute(comando)
+            finally:
+                connection.autocommit = False
+
+            # Um CREATE INDEX CONCURRENTLY que falha deixa o índice inválido, e o IF NOT EXISTS
+            # impediria a sua recriação: a migração só é registrada se nenhum índice ficou inválido
+            invalidos = indices_invalidos(connection, [tabela for tabela, colunas in INDICES_ESPERADOS])
+            if invalidos:
+                raise RuntimeError(nome + ': índices inválidos (' + ', '.join(invalidos) + '); '
+                                   'remova-os com DROP INDEX CONCURRENTLY e aplique de novo')
+        else:
+            cursor.execute(texto)
+
+        cursor.execute(" insert into migracao (nome, hash, aplicada_em) values (%s, %s, %s) ",
+                       (nome, resumo(texto), datetime.datetime.now()))
+        connection.commit()
+        cursor.close()
+        feitas.append(nome)
+
+    return feitas
+
+
+def marca(connection, nomes, diretorio=DIRETORIO, saida=print):
+    """ Registra as migrações como aplicadas sem executá-las (scripts já executados manualmente no banco);
+        devolve os nomes registrados """
+
+    textos = dict(scripts(diretorio))
+    desconhecidas = [nome for nome in nomes if nome not in textos]
+    if desconhecidas:
+        raise ValueError('migrações não encontradas em ' + diretorio + ': ' + ', '.join(desconhecidas))
+
+    registros = aplicadas(connection)
+    feitas = []
+    cursor = connection.cursor()
+    for nome in nomes:
+        if nome in registros:
+            saida(nome + ' já registrada')
+            continue
+        saida('marcando ' + nome)
+        cursor.execute(" insert into migracao (nome, hash, aplicada_em) values (%s, %s, %s) ",
+                       (nome, resumo(textos[nome]), datetime.datetime.now()))
+        feitas.append(nome)
+    connection.commit()
+    cursor.close()
+    return feitas
+
+
+def status(connection, diretorio=DIRETORIO, saida=print):
+    registros = aplicadas(connection)
+    for nome, texto in scripts(diretorio):
+        if nome not in registros:
+            saida('%-40s pendente' % nome)
+            continue
+        hash_aplicado, aplicada_em = registros[nome]
+        situacao = 'aplicada em ' + aplicada_em.isoformat(sep=' ', timespec='seconds')
+        if hash_aplicado != resumo(texto):
+            situacao = situacao + ' (alterada depois de aplicada)'
+        saida('%-40s %s' % (nome, situacao))
+
+
+def varre_plano(no, encontrados):
+    """ Acumula as tabelas lidas sequencialmente em um plano do EXPLAIN (format json) """
+
+    if no.get('Node Type') in ('Seq Scan', 'Parallel Seq Scan'):
+        encontrados.append(no.get('Relation Name'))
+    for filho in no.get('Plans', []):
+        varre_plano(filho, encontrados)
+
+
+def leituras_sequenciais_log(caminho, tabelas):
+    """ Lê o log de consultas lentas e devolve as leituras sequenciais das tabelas:
+        {(rota, sql): {'tabelas': set, 'ocorrencias': n, 'maior_ms': ms}} """
+
+    encontradas = {}
+    with open(caminho, encoding='utf-8') as f:
+        for line in f:
+            try:
+                registro = json.loads(line)
+            except ValueError:
+                continue
+            plano = registro.get('plano')
+            if not isinstance(plano, list):
+                continue
+
+            lidas = []
+            for item in plano:
+                varre_plano(item.get('Plan', {}), lidas)
+            lidas = set(lidas) & set(tabelas)
+            if not lidas:
+                continue
+
+            chave = (registro.get('rota'), registro.get('sql'))
+            achado = encontradas.setdefault(chave, {'tabelas': set(), 'ocorrencias': 0, 'maior_ms': 0})
+            achado['tabelas'] |= lidas
+            achado['ocorrencias'] += 1
+            achado['maior_ms'] = max(achado['maior_ms'], registro.get('duracao_ms', 0))
+    return encontradas
+
+
+def saude(connection, log=None, saida=print):
+    """ Verifica os índices esperados e as leituras sequenciais das tabelas de jogadas; devolve a quantidade de problemas """
+
+    problemas = 0
+    tabelas = sorted(set(tabela for tabela, colunas in INDICES_ESPERADOS) | set(TABELAS_QUENTES))
+    cursor = connection.cursor()
+
+    cursor.execute(bloco_indices, (tabelas,))
+    indices = cursor.fetchall()
+    saida('índices')
+    for tabela, colunas in INDICES_ESPERADOS:
+        atendem = [line[1] for line in indices if line[0] == tabela and line[2] and line[3][:len(colunas)] == colunas]
+        if atendem:
+            saida('  ok        %s (%s): %s' % (tabela, ', '.join(colunas), ', '.join(atendem)))
+        else:
+            saida('  FALTANDO  %s (%s)' % (tabela, ', '.join(colunas)))
+            problemas += 1
+    for line in indices:
+        if not line[2]:
+            saida('  INVALIDO  %s: %s' % (line[0], line[1]))
+            problemas += 1
+
+    # Contadores acumulados desde o último reset das estatísticas do banco
+    cursor.execute(bloco_leituras, (tabelas,))
+    saida('leituras (pg_stat_user_tables)')
+    for tabela, seq_scan, seq_tup_read, idx_scan, linhas in cursor.fetchall():
+        saida('  %-10s seq_scan %d  linhas lidas em seq_scan %d  idx_scan %d  linhas %d' % (
+            tabela, seq_scan, seq_tup_read, idx_scan, linhas))
+    cursor.close()
+    connection.commit()
+
+    if log is None:
+        return problemas
+    if not os.path.exists(log):
+        saida('log de consultas lentas ' + log + ' não encontrado')
+        return problemas
+
+    encontradas = leituras_sequenciais_log(log, TABELAS_QUENTES)
+    saida('leituras sequenciais em consultas lentas (' + log + ')')
+    if not encontradas:
+        saida('  nenhuma')
+    for (rota, sql), achado in sorted(encontradas.items(), key=lambda item: -item[1]['maior_ms']):
+        saida('  %s: %s  (%d ocorrências, até %.1f ms)' % (rota, ', '.join(sorted(achado['tabelas'])),
+                                                          achado['ocorrencias'], achado['maior_ms']))
+        saida('    ' + sql)
+        problemas += 1
+    return problemas
+
+
+def conecta(config):
+    return psycopg2.connect(host=config['DATABASE_HOST'], database=config['DATABASE_NAME'],
+                            user=config['DATABASE_USER'], password=config['DATABASE_PASSWORD'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('comando', choices=['aplicar', 'marcar', 'status', 'saude'])
+    parser.add_argument('migracoes', nargs='*', help='scripts registrados sem execução por marcar')
+    parser.add_argument('--config', default='apibadminton.json')
+    parser.add_argument('--log', default=None, help='log de consultas lentas lido por saude (padrão: SLOW_QUERY_LOG)')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    valida(validador_config, config)
+
+    connection = conecta(config)
+    try:
+        if args.comando == 'aplicar':
+            feitas = aplica(connection)
+            print(str(len(feitas)) + ' migrações aplicadas')
+        elif args.comando == 'marcar':
+            if not args.migracoes:
+                parser.error('marcar: informe os scripts já executados no banco')
+            feitas = marca(connection, args.migracoes)
+            print(str(len(feitas)) + ' migrações marcadas como aplicadas')
+        elif args.comando == 'status':
+            status(connection)
+        else:
+            log = args.log
+            if log is None and config.get('SLOW_QUERY_MS') is not None:
+                log = config.get('SLOW_QUERY_LOG', 'consultas_lentas.log')
+            if saude(connection, log):
+                sys.exit(1)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+-- Placar de cada set (acertos e erros), mantido pela inserção de jogadas na mesma
+-- transação, para que post_jogada não precise recontar todas as jogadas do set.
+
+create table if not exists placar_set (
+    set_id integer primary key references set (id) on delete cascade,
+    acertos integer not null default 0,
+    erros integer not null default 0,
+    atualizado_em timestamp not null
+);
+
+-- Carga inicial a partir das jogadas já gravadas. O bloqueio impede a gravação de jogadas até o
+-- commit da migração: sem ele, o placar recalculado sobrescreveria os incrementos das jogadas
+-- gravadas durante a carga. Com ele, o script pode ser executado de novo para recalcular a tabela
+lock table jogada in share mode;
+
+insert into placar_set (set_id, acertos, erros, atualizado_em)
+    select jogada.set_id, count(*) filter (where jogada.acerto), count(*) filter (where not jogada.acerto), now()
+    from jogada
+    group by jogada.set_id
+on conflict (set_id) do update
+    set acertos = excluded.acertos, erros = excluded.erros, atualizado_em = excluded.atualizado_em;
@@ -0,0 +1,9 @@
+-- Versão de cada partida, incrementada a cada alteração dos seus sets ou jogadas
+-- (na mesma transação da alteração). Os relatórios guardados em cache pelos
+-- workers são reaproveitados enquanto a versão da partida não mudar.
+
+create table if not exists versao_partida (
+    partida_id integer primary key references partida (id) on delete cascade,
+    versao bigint not null default 0,
+    atualizado_em timestamp not null
+);
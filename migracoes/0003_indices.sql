@@ -0,0 +1,14 @@
+-- migracao: sem transacao
+-- Índices das colunas filtradas pelos relatórios, pelo placar e pela listagem de partidas.
+-- Criados com CONCURRENTLY para não bloquear as gravações em um banco em uso; por isso o
+-- script é executado fora de transação, um comando por vez (migracao.py).
+--
+-- O índice de jogada começa por set_id e também atende as consultas que filtram apenas
+-- por set_id; um índice só de set_id seria redundante e encareceria cada jogada gravada.
+-- O de partida inclui o id para atender a ordenação e o cursor da paginação de get_partidas.
+
+create index concurrently if not exists jogada_set_golpe_quadrante_idx on jogada (set_id, golpe_id, quadrante_id);
+
+create index concurrently if not exists set_partida_id_idx on set (partida_id);
+
+create index concurrently if not exists partida_data_partida_idx on partida (data_partida, id);
@@ -0,0 +1,19 @@
+-- Nome do jogador único, garantido pelo banco: post_jogador e post_jogadores inserem com
+-- ON CONFLICT (nome_jogador) DO NOTHING em vez de pesquisar o nome antes de inserir.
+-- Nomes já duplicados precisam ser corrigidos manualmente antes desta migração (as partidas
+-- apontam para os ids dos jogadores); a migração falha listando os nomes repetidos.
+
+do $$
+declare
+    repetidos text;
+begin
+    select string_agg(nome_jogador, ', ') into repetidos
+    from (select nome_jogador from jogador group by nome_jogador having count(*) > 1) as duplicados;
+
+    if repetidos is not null then
+        raise exception 'jogadores com nome repetido: %', repetidos;
+    end if;
+end
+$$;
+
+create unique index if not exists jogador_nome_jogador_key on jogador (nome_jogador);
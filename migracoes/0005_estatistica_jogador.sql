@@ -0,0 +1,36 @@
+-- Estatísticas de carreira de cada jogador (acertos e erros por golpe, quadrante e tipo de erro),
+-- mantidas por grava_jogadas na mesma transação da inserção das jogadas, para que a rota
+-- get_jogador_estatisticas não precise varrer a tabela jogada.
+--
+-- A jogada não identifica o jogador: ela é atribuída ao lado avaliado da partida, ou seja, a
+-- jogador_1 e, nas duplas, também a jogador_2 (os adversários não são avaliados). Acertos são
+-- guardados com tipo_erro_id = 0, assim como os erros sem tipo informado.
+
+create table if not exists estatistica_jogador (
+    jogador_id integer not null references jogador (id) on delete cascade,
+    golpe_id integer not null,
+    quadrante_id integer not null,
+    tipo_erro_id integer not null default 0,
+    acertos integer not null default 0,
+    erros integer not null default 0,
+    atualizado_em timestamp not null,
+    primary key (jogador_id, golpe_id, quadrante_id, tipo_erro_id)
+);
+
+-- Carga inicial a partir das jogadas já gravadas. O bloqueio impede a gravação de jogadas até o
+-- commit da migração, para que nenhuma fique de fora; o script pode ser executado de novo para
+-- recalcular a tabela
+lock table jogada in share mode;
+
+insert into estatistica_jogador (jogador_id, golpe_id, quadrante_id, tipo_erro_id, acertos, erros, atualizado_em)
+    select jogador.id, jogada.golpe_id, jogada.quadrante_id,
+        case when jogada.acerto then 0 else coalesce(jogada.tipo_erro_id, 0) end,
+        count(*) filter (where jogada.acerto), count(*) filter (where not jogada.acerto), now()
+    from jogada
+    inner join set on (set.id = jogada.set_id)
+    inner join partida on (partida.id = set.partida_id)
+    cross join lateral (values (partida.jogador_1_id), (nullif(partida.jogador_2_id, partida.jogador_1_id))) as jogador (id)
+    where jogador.id is not null
+    group by 1, 2, 3, 4
+on conflict (jogador_id, golpe_id, quadrante_id, tipo_erro_id) do update
+    set acertos = excluded.acertos, erros = excluded.erros, atualizado_em = excluded.atualizado_em;
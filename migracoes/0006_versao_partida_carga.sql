@@ -0,0 +1,10 @@
+-- Carga inicial de versao_partida (0002_versao_partida.sql) para as partidas que ainda não têm
+-- versão: data da última alteração de cada partida a partir dos sets e jogadas já gravados.
+-- As partidas alteradas desde a 0002 já têm versão e são mantidas.
+
+insert into versao_partida (partida_id, versao, atualizado_em)
+    select set.partida_id, 0, max(greatest(set.atualizado_em, jogada.atualizado_em))
+    from set
+    left join jogada on (jogada.set_id = set.id)
+    group by set.partida_id
+on conflict (partida_id) do nothing;
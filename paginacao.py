@@ -0,0 +1,58 @@
+""" Paginação por chave (keyset) das rotas de listagem
+
+O cursor devolvido em 'proximo' é a chave de ordenação do último registro da
+página, codificada em base64. Ele deve ser enviado de volta no parâmetro
+'after' para obter a página seguinte.
+"""
+
+import base64
+import json
+
+
+LIMITE_MAXIMO = 500
+
+
+def codifica_cursor(chave):
+    """ Codifica a chave de ordenação (lista de valores JSON) em um cursor opaco """
+
+    texto = json.dumps(chave, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii')
+
+
+def decodifica_cursor(cursor, tamanho):
+    """ Devolve a lista de valores do cursor ou levanta ValueError se ele for inválido """
+
+    try:
+        chave = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError('request.args[after] inválido')
+
+    if not isinstance(chave, list) or len(chave) != tamanho:
+        raise ValueError('request.args[after] inválido')
+    return chave
+
+
+def le_limite(args):
+    """ Devolve o parâmetro 'limit' como inteiro (ou None se ausente); levanta ValueError se inválido """
+
+    limite = args.get('limit')
+    if not limite:
+        return None
+
+    if not limite.isdigit() or int(limite) < 1:
+        raise ValueError('request.args[limit] deve ser numerico')
+    return min(int(limite), LIMITE_MAXIMO)
+
+
+def le_lista_ids(args, nome):
+    """ Devolve a lista de ids (inteiros) do parâmetro separado por vírgulas; levanta ValueError se inválido """
+
+    lista = args.get(nome)
+    if not lista:
+        return None
+
+    lista = lista.replace(" ", "").split(',')
+    for item in lista:
+        if not item.isdigit():
+            raise ValueError('request.args[' + nome + '] deve ser numerico')
+    return [int(item) for item in lista]
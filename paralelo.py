@@ -0,0 +1,53 @@
+""" Execução concorrente de consultas independentes de uma mesma requisição
+
+A primeira consulta é executada na conexão da requisição e as demais em
+conexões emprestadas do pool, em threads de um executor compartilhado pelo
+worker. Se o pool não tiver conexão livre no momento, a consulta é executada
+em sequência na conexão da requisição, para que requisições simultâneas não
+fiquem bloqueadas umas esperando pelas conexões das outras.
+"""
+
+from db import get_pool, PoolEsgotado
+from executores import ExecutorPorProcesso
+from instrumentacao import associa
+
+
+THREADS_CONSULTA = 8
+
+_executor = ExecutorPorProcesso(THREADS_CONSULTA, 'consulta')
+
+
+def _executa_emprestada(pool, connection, tarefa):
+    cursor = connection.cursor()
+    try:
+        return tarefa(cursor)
+    finally:
+        cursor.close()
+        associa(connection, None)
+        pool.devolve(connection)
+
+
+def consultas_paralelas(cursor, *tarefas):
+    """ Executa as tarefas (funções que recebem um cursor) concorrentemente e devolve os resultados na
+        mesma ordem; a primeira usa `cursor` (da conexão da requisição) """
+
+    pool = get_pool()
+    pendentes = []
+    for tarefa in tarefas[1:]:
+        try:
+            connection = pool.obtem(espera=0)
+        except PoolEsgotado:
+            pendentes.append((None, tarefa))
+            continue
+
+        # Os comandos executados na conexão emprestada contam para a requisição
+        associa(connection, getattr(cursor.connection, 'medicao', None))
+        pendentes.append((_executor.submit(_executa_emprestada, pool, connection, tarefa), tarefa))
+
+    resultados = [tarefas[0](cursor)]
+    for futuro, tarefa in pendentes:
+        if futuro is None:
+            resultados.append(tarefa(cursor))
+        else:
+            resultados.append(futuro.result())
+    return resultados
@@ -0,0 +1,60 @@
+""" Regras de pontuação de um set de badminton """
+
+
+def status_set(acertos, erros):
+    """ Devolve 'parar' quando o set terminou (21 pontos com 2 de vantagem ou 30 pontos) ou 'continuar' """
+
+    if (erros >= 21 or acertos >= 21):
+        if abs(erros - acertos) >= 2:
+            return 'parar'
+        if (erros >= 30 or acertos >= 30):
+            return 'parar'
+    return 'continuar'
+
+
+def resultado_set(acertos, erros):
+    """ Devolve 'ganhou', 'perdeu' ou 'empate' conforme a pontuação do set """
+
+    if erros > acertos:
+        return 'perdeu'
+    elif erros < acertos:
+        return 'ganhou'
+    return 'empate'
+
+
+def placar_set(acertos, erros):
+    """ Devolve resultado, status e pontuação do set no formato usado pelas rotas de consulta """
+
+    return {
+        'resultado_set': resultado_set(acertos, erros),
+        'status': status_set(acertos, erros),
+        'erros': erros,
+        'acertos': acertos,
+    }
+
+
+def pontuacao_set(set_id, ordem, acertos, erros):
+    """ Devolve a pontuação parcial do set no formato da rota post_jogada """
+
+    andamento = {'ganhou': 'ganhando', 'perdeu': 'perdendo', 'empate': 'empatando'}
+
+    return {
+        'set_id': set_id,
+        'ordem_set': ordem,
+        'resultado_set': andamento[resultado_set(acertos, erros)],
+        'status': status_set(acertos, erros),
+        'erros': erros,
+        'acertos': acertos,
+    }
+
+
+def partida_encerrada(placares):
+    """ Indica se a partida terminou: todos os sets (acertos, erros) encerrados e um dos lados com dois sets vencidos """
+
+    resultados = []
+    for acertos, erros in placares:
+        if status_set(acertos, erros) != 'parar':
+            return False
+        resultados.append(resultado_set(acertos, erros))
+
+    return resultados.count('ganhou') >= 2 or resultados.count('perdeu') >= 2
@@ -0,0 +1,142 @@
+""" Cache em memória das tabelas de referência (golpe, tipoerro e quadrante)
+
+Os catálogos são carregados do banco na inicialização do worker e servidos da
+memória até expirar o TTL ou até serem invalidados explicitamente. As respostas
+das rotas de catálogo também são guardadas já codificadas em JSON.
+
+Cada worker tem o seu cache: invalida() descarta apenas o do processo atual.
+"""
+
+import threading
+import time
+
+from flask import has_app_context
+
+from db import get_conexao, conexao_avulsa
+from respostas import codifica
+
+
+# Ids procurados e não encontrados guardados por carga do cache (sem nova leitura do banco até a próxima carga)
+MAX_AUSENTES = 1024
+
+
+class CacheReferencias:
+    """ Guarda golpes, tipos de erro e quadrantes, recarregando-os após `ttl` segundos """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._dados = None
+        self._carregado_em = 0
+
+    def _pesquisa(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute(" select golpe.id, golpe.descricao_golpe from golpe order by golpe.id ")
+            golpes = cursor.fetchall()
+
+            cursor.execute(" select tipoerro.id, tipoerro.descricao_erro from tipoerro order by tipoerro.id ")
+            tipos_erro = cursor.fetchall()
+
+            cursor.execute(" select quadrante.id, quadrante.descricao_quadrante, quadrante.lado \
+                                from quadrante order by quadrante.id ")
+            quadrantes = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        return {
+            'golpes': golpes,
+            'tipos_erro': tipos_erro,
+            'quadrantes': quadrantes,
+            'golpe': {line[0]: line[1] for line in golpes},
+            'tipo_erro': {line[0]: line[1] for line in tipos_erro},
+            'quadrante': {line[0]: (line[1], line[2]) for line in quadrantes},
+            'respostas': {},
+            'ausentes': set(),
+        }
+
+    def carrega(self):
+        """ Recarrega os catálogos do banco de dados """
+
+        # Dentro de uma requisição usa a conexão da própria requisição
+        if has_app_context():
+            dados = self._pesquisa(get_conexao())
+        else:
+            with conexao_avulsa() as connection:
+                dados = self._pesquisa(connection)
+
+        with self._lock:
+            self._dados = dados
+            self._carregado_em = time.monotonic()
+        return dados
+
+    def carregado(self):
+        return self._dados is not None
+
+    def invalida(self):
+        """ Descarta os catálogos em memória; a próxima consulta recarrega do banco """
+
+        with self._lock:
+            self._dados = None
+
+    def dados(self):
+        dados = self._dados
+        if dados is None or time.monotonic() - self._carregado_em > self.ttl:
+            dados = self.carrega()
+        return dados
+
+    def _busca(self, tabela, id_registro):
+        # Um id desconhecido pode ser registro novo no banco: recarrega uma vez antes de desistir. Se continuar
+        # ausente, fica registrado como tal até a próxima carga (TTL ou invalidação), sem novas leituras
+        dados = self.dados()
+        if id_registro in dados[tabela] or (tabela, id_registro) in dados['ausentes']:
+            return dados[tabela].get(id_registro)
+
+        dados = self.carrega()
+        if id_registro not in dados[tabela] and len(dados['ausentes']) < MAX_AUSENTES:
+            dados['ausentes'].add((tabela, id_registro))
+        return dados[tabela].get(id_registro)
+
+    def codificada(self, nome, monta):
+        """ Devolve a resposta `nome` em JSON (bytes), montada com monta() uma única vez a cada carga do cache """
+
+        respostas = self.dados()['respostas']
+        corpo = respostas.get(nome)
+        if corpo is None:
+            corpo = codifica(monta())
+            respostas[nome] = corpo
+        return corpo
+
+    def golpes(self):
+        """ Lista de golpes no formato da rota get_golpes """
+
+        return [{'id': line[0], 'descricao': line[1]} for line in self.dados()['golpes']]
+
+    def tipos_erro(self):
+        """ Lista de tipos de erro no formato das rotas get_golpes e get_tipoerro """
+
+        return [{'id_erro': line[0], 'descricao': line[1]} for line in self.dados()['tipos_erro']]
+
+    def quadrantes(self):
+        """ Lista de quadrantes no formato da rota get_quadrantes """
+
+        return [{'id': line[0], 'descricao': line[1], 'lado': line[2]} for line in self.dados()['quadrantes']]
+
+    def descricao_golpe(self, id_golpe):
+        return self._busca('golpe', id_golpe)
+
+    def descricao_tipo_erro(self, id_tipo_erro):
+        return self._busca('tipo_erro', id_tipo_erro)
+
+    def descricao_quadrante(self, id_quadrante):
+        """ Descrição do quadrante acrescida do lado, quando houver (ex.: 'Q 01 esquerdo') """
+
+        quadrante = self._busca('quadrante', id_quadrante)
+        if quadrante is None:
+            return None
+        if quadrante[1]:
+            return quadrante[0] + ' ' + quadrante[1]
+        return quadrante[0]
+
+
+referencias = CacheReferencias()
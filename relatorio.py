@@ -0,0 +1,384 @@
+""" Montagem do relatório de desempenho da partida (formato das rotas v2 e v3)
+
+Os dados agregados da partida são organizados em dicionários indexados por
+set, (set, golpe) e (set, golpe, quadrante); a árvore de resposta é montada
+percorrendo cada nível uma única vez. O mesmo conteúdo pode ser devolvido no
+formato colunar (format=columnar), descrito em docs/formato_colunar.md.
+"""
+
+from collections import Counter
+
+from referencias import referencias
+from paralelo import consultas_paralelas
+
+
+# Sets da partida, com os dados da partida e do jogador avaliado
+bloco_sets_partida = " select set.id, set.ordem, partida.id, partida.data_partida, partida.tipo_jogo, partida.modalidade, \
+                partida.nome, jogador.nome_jogador from set \
+                inner join partida on (partida.id = set.partida_id) \
+                inner join jogador on (partida.jogador_1_id = jogador.id) \
+                where set.partida_id = any(%s) order by set.id "
+
+# Jogadas da partida, sem agregação: os totais são calculados em memória por agrupa_jogadas
+bloco_jogadas_partida = " select jogada.set_id, jogada.golpe_id, jogada.quadrante_id, jogada.acerto, jogada.tipo_erro_id \
+                from jogada inner join set on (set.id = jogada.set_id) \
+                where set.partida_id = any(%s) "
+
+
+# Consulta única do relatório v4: os níveis set, golpe, quadrante e tipo de erro são
+# calculados na mesma varredura de jogada com GROUPING SETS
+bloco_relatorio_v4 = " select grouping(jogada.golpe_id), grouping(jogada.quadrante_id), grouping(jogada.tipo_erro_id), \
+                set.id, set.ordem, partida.id, partida.data_partida, partida.tipo_jogo, partida.modalidade, \
+                partida.nome, jogador.nome_jogador, jogada.golpe_id, golpe.descricao_golpe, \
+                jogada.quadrante_id, quadrante.descricao_quadrante, quadrante.lado, jogada.acerto, \
+                jogada.tipo_erro_id, tipoerro.descricao_erro, count(jogada.id) \
+                from set \
+                inner join partida on (partida.id = set.partida_id) \
+                inner join jogador on (partida.jogador_1_id = jogador.id) \
+                left join (jogada \
+                    inner join golpe on (golpe.id = jogada.golpe_id) \
+                    inner join quadrante on (quadrante.id = jogada.quadrante_id) \
+                    left join tipoerro on (tipoerro.id = jogada.tipo_erro_id)) on (jogada.set_id = set.id) \
+                where set.partida_id = %s \
+                group by grouping sets ( \
+                    (set.id, set.ordem, partida.id, partida.data_partida, partida.tipo_jogo, partida.modalidade, \
+                        partida.nome, jogador.nome_jogador), \
+                    (set.id, jogada.golpe_id, golpe.descricao_golpe), \
+                    (set.id, jogada.golpe_id, jogada.quadrante_id, quadrante.descricao_quadrante, quadrante.lado, \
+                        jogada.acerto), \
+                    (set.id, jogada.golpe_id, jogada.quadrante_id, jogada.acerto, jogada.tipo_erro_id, \
+                        tipoerro.descricao_erro)) \
+                order by set.id, jogada.golpe_id, jogada.quadrante_id, jogada.tipo_erro_id, jogada.acerto "
+
+
+def dados_relatorio():
+    """ Estrutura intermediária do relatório, preenchida pelas consultas e lida por monta_relatorio
+
+        cabecalho: (partida_id, data_partida, tipo_jogo, modalidade, nome, nome_jogador)
+        sets: [(set_id, ordem)]
+        golpes: {set_id: [(golpe_id, descricao, total)]}
+        quadrantes: {(set_id, golpe_id): [(quadrante_id, descricao, acerto, total)]}
+        tipos_erro: {(set_id, golpe_id, quadrante_id): [(tipo_erro_id, descricao, total)]}
+    """
+
+    return {
+        'cabecalho': None,
+        'sets': [],
+        'golpes': {},
+        'quadrantes': {},
+        'tipos_erro': {},
+    }
+
+
+def agrupa_v4(linhas):
+    """ Distribui as linhas da consulta com GROUPING SETS (bloco_relatorio_v4) entre os níveis do relatório """
+
+    dados = dados_relatorio()
+    for line in linhas:
+        sem_golpe, sem_quadrante, sem_tipo_erro = line[0], line[1], line[2]
+        set_id = line[3]
+
+        if sem_golpe:
+            # Nível do set: dados da partida e do set
+            dados['cabecalho'] = (line[5], line[6], line[7], line[8], line[9], line[10])
+            dados['sets'].append((set_id, line[4]))
+
+        elif line[11] is None:
+            # Set sem jogadas (linha vinda do left join)
+            continue
+
+        elif sem_quadrante:
+            dados['golpes'].setdefault(set_id, []).append((line[11], line[12], line[19]))
+
+        elif sem_tipo_erro:
+            descricao = line[14]
+            if line[15]:
+                descricao = descricao + ' ' + line[15]
+            dados['quadrantes'].setdefault((set_id, line[11]), []).append((line[13], descricao, line[16], line[19]))
+
+        elif line[17] is not None:
+            dados['tipos_erro'].setdefault((set_id, line[11], line[13]), []).append((line[17], line[18], line[19]))
+
+    return dados
+
+
+def _ordem_acerto(acerto):
+    # Mesma ordem do banco: false, true e nulos por último
+    return (acerto is None, bool(acerto))
+
+
+def agrupa_jogadas(sets_data, jogadas_data):
+    """ Agrega as jogadas (set_id, golpe_id, quadrante_id, acerto, tipo_erro_id) em uma única passagem,
+        contando-as por chave, e distribui os totais entre os níveis do relatório """
+
+    contagem = Counter(jogadas_data)
+
+    total_golpe = Counter()
+    total_quadrante = Counter()
+    total_tipo_erro = Counter()
+    for (set_id, golpe_id, quadrante_id, acerto, tipo_erro_id), quantidade in contagem.items():
+        total_golpe[(set_id, golpe_id)] += quantidade
+        total_quadrante[(set_id, golpe_id, quadrante_id, acerto)] += quantidade
+        if tipo_erro_id is not None:
+            total_tipo_erro[(set_id, golpe_id, quadrante_id, acerto, tipo_erro_id)] += quantidade
+
+    dados = dados_relatorio()
+    for line in sets_data:
+        dados['cabecalho'] = (line[2], line[3], line[4], line[5], line[6], line[7])
+        dados['sets'].append((line[0], line[1]))
+
+    for (set_id, golpe_id), quantidade in sorted(total_golpe.items()):
+        dados['golpes'].setdefault(set_id, []).append((golpe_id, referencias.descricao_golpe(golpe_id), quantidade))
+
+    for chave, quantidade in sorted(total_quadrante.items(), key=lambda item: item[0][:3] + (_ordem_acerto(item[0][3]),)):
+        set_id, golpe_id, quadrante_id, acerto = chave
+        dados['quadrantes'].setdefault((set_id, golpe_id), []).append(
+            (quadrante_id, referencias.descricao_quadrante(quadrante_id), acerto, quantidade))
+
+    for chave, quantidade in sorted(total_tipo_erro.items(), key=lambda item: item[0][:3] + (item[0][4], _ordem_acerto(item[0][3]))):
+        set_id, golpe_id, quadrante_id, acerto, tipo_erro_id = chave
+        dados['tipos_erro'].setdefault((set_id, golpe_id, quadrante_id), []).append(
+            (tipo_erro_id, referencias.descricao_tipo_erro(tipo_erro_id), quantidade))
+
+    return dados
+
+
+def _pesquisa(bloco, ids_partida):
+    def tarefa(cursor):
+        cursor.execute(bloco, (ids_partida,))
+        return cursor.fetchall()
+    return tarefa
+
+
+def carrega_relatorio(cursor, ids_partida):
+    """ Pesquisa os sets e as jogadas das partidas informadas (duas consultas executadas ao mesmo tempo)
+        e devolve os dados agregados """
+
+    sets_data, jogadas_data = consultas_paralelas(cursor,
+                                                  _pesquisa(bloco_sets_partida, ids_partida),
+                                                  _pesquisa(bloco_jogadas_partida, ids_partida))
+
+    return agrupa_jogadas(sets_data, jogadas_data)
+
+
+FORMATO_COLUNAR = 'columnar'
+
+
+def le_formato(args):
+    """ Devolve o parâmetro 'format' (None para o formato padrão); levanta ValueError se inválido """
+
+    formato = args.get('format')
+    if not formato:
+        return None
+
+    if formato != FORMATO_COLUNAR:
+        raise ValueError('request.args[format] deve ser ' + FORMATO_COLUNAR)
+    return formato
+
+
+def _totais(dados):
+    """ Devolve os totais (jogadas, acertos, erros) de cada set e (acertos, erros) de cada golpe,
+        somados a partir dos quadrantes """
+
+    totais_set = {}
+    totais_golpe = {}
+    for set_id, ordem in dados['sets']:
+        jogadas_set = 0
+        acertos_set = 0
+        erros_set = 0
+        for golpe_id, golpe, quantidade_jogada in dados['golpes'].get(set_id, []):
+            jogadas_set = jogadas_set + quantidade_jogada
+            acertos_golpe = 0
+            erros_golpe = 0
+            for quadrante in dados['quadrantes'].get((set_id, golpe_id), []):
+                if quadrante[2]:
+                    acertos_golpe = acertos_golpe + quadrante[3]
+                else:
+                    erros_golpe = erros_golpe + quadrante[3]
+            totais_golpe[(set_id, golpe_id)] = (acertos_golpe, erros_golpe)
+            acertos_set = acertos_set + acertos_golpe
+            erros_set = erros_set + erros_golpe
+        totais_set[set_id] = (jogadas_set, acertos_set, erros_set)
+
+    return totais_set, totais_golpe
+
+
+def monta_relatorio(dados, com_tipos_erro=True):
+    """ Monta a lista 'relatorio_partida' no formato das rotas v2 (com_tipos_erro=False) e v3 """
+
+    output_partida = []
+    if not dados['sets']:
+        return output_partida
+
+    totais_set, totais_golpe = _totais(dados)
+
+    jogadas_partida = sum(total[0] for total in totais_set.values())
+    acertos_partida = sum(total[1] for total in totais_set.values())
+    erros_partida = sum(total[2] for total in totais_set.values())
+
+    if jogadas_partida == 0:
+        return output_partida
+
+    # Dados da partida
+    cabecalho = dados['cabecalho']
+    lineout_partida = {}
+    lineout_partida['L_set_resultado'] = []
+    lineout_partida['A_partida_id'] = cabecalho[0]
+    lineout_partida['B_data'] = cabecalho[1]
+    lineout_partida['C_tipo_jogo'] = cabecalho[2]
+    lineout_partida['D_modalidade'] = cabecalho[3]
+    lineout_partida['E_nome'] = cabecalho[4]
+    lineout_partida['F_jogador'] = cabecalho[5]
+
+    # Resultados da partida
+    lineout_partida['G_partida_total'] = jogadas_partida
+    lineout_partida['H_partida_acertos'] = acertos_partida
+    lineout_partida['I_partida_acertos_%'] = round(((acertos_partida / jogadas_partida)*100), 2)
+    lineout_partida['J_partida_erros'] = erros_partida
+    lineout_partida['K_partida_erros_%'] = round(((erros_partida / jogadas_partida)*100), 2)
+
+    for set_id, ordem in dados['sets']:
+        jogadas_set, acertos_set, erros_set = totais_set[set_id]
+
+        # Sets sem jogadas aparecem como objeto vazio, como nas versões anteriores
+        set_resultado = {}
+        if jogadas_set > 0:
+            set_resultado['A_set_id'] = set_id
+            set_resultado['B_set_ordem'] = ordem
+
+            # Resultados individual do set
+            set_resultado['C_set_total'] = jogadas_set
+            set_resultado['E_set_acertos'] = acertos_set
+            set_resultado['G_set_acertos_relacao_set'] = round(((acertos_set / jogadas_set)*100), 2)
+            set_resultado['H_set_erros'] = erros_set
+            set_resultado['J_set_erros_relacao_set'] = round(((erros_set / jogadas_set)*100), 2)
+            set_resultado['D_set_total_relacao_partida'] = round(((jogadas_set / jogadas_partida)*100), 2)
+            set_resultado['F_set_acertos_relacao_partida'] = round(((acertos_set / jogadas_partida)*100), 2)
+            set_resultado['I_set_erros_relacao_partida'] = round(((erros_set / jogadas_partida)*100), 2)
+
+            set_resultado['K_jogadas'] = []
+            for golpe_id, golpe, quantidade_jogada in dados['golpes'].get(set_id, []):
+                acertos_golpe, erros_golpe = totais_golpe[(set_id, golpe_id)]
+                quadrantes = dados['quadrantes'].get((set_id, golpe_id), [])
+
+                jogada = {}
+                jogada['A_golpe_id'] = golpe_id
+                jogada['B_golpe'] = golpe
+                jogada['C_golpe_total'] = quantidade_jogada
+                jogada['D_golpe_total_relacao_set'] = round(((quantidade_jogada / jogadas_set)*100), 2)
+                jogada['I_quadrantes_acerto'] = []
+                jogada['J_quadrantes_erro'] = []
+
+                # Quantidade de linhas (acerto/erro) de cada quadrante do golpe
+                linhas_quadrante = {}
+                for quadrante_id, descricao, acerto, quantidade in quadrantes:
+                    linhas_quadrante[quadrante_id] = linhas_quadrante.get(quadrante_id, 0) + 1
+
+                for quadrante_id, descricao, acerto, quantidade in quadrantes:
+                    quadrante = {}
+                    quadrante['A_quadrante_id'] = quadrante_id
+                    quadrante['B_quadrante'] = descricao
+                    quadrante['C_quadrante_total'] = quantidade
+                    quadrante['D_quadrante_relacao_golpe'] = round(((quantidade / quantidade_jogada)*100), 2)
+
+                    if acerto:
+                        jogada['I_quadrantes_acerto'].append(quadrante)
+                        continue
+
+                    if com_tipos_erro:
+                        # A v3 lista os tipos de erro do quadrante uma vez para cada linha
+                        # (acerto/erro) do quadrante; a repetição é mantida por compatibilidade
+                        quadrante['E_tipo_erro'] = []
+                        tipos_erro = dados['tipos_erro'].get((set_id, golpe_id, quadrante_id), [])
+                        for repeticao in range(linhas_quadrante[quadrante_id]):
+                            for tipo_erro_id, descricao_erro, quantidade_erro in tipos_erro:
+                                tipo_erro = {}
+                                tipo_erro['A_id'] = tipo_erro_id
+                                tipo_erro['B_tipo_erro'] = descricao_erro
+                                tipo_erro['C_quantidade'] = quantidade_erro
+                                quadrante['E_tipo_erro'].append(tipo_erro)
+
+                    jogada['J_quadrantes_erro'].append(quadrante)
+
+                jogada['E_golpe_acertos'] = acertos_golpe
+                jogada['F_golpe_acertos_porc'] = round(((acertos_golpe/quantidade_jogada)*100), 2)
+                jogada['G_golpe_erros'] = erros_golpe
+                jogada['H_golpe_erros_porc'] = round(((erros_golpe/quantidade_jogada)*100), 2)
+                set_resultado['K_jogadas'].append(jogada)
+
+        lineout_partida['L_set_resultado'].append(set_resultado)
+
+    output_partida.append(lineout_partida)
+    return output_partida
+
+
+def monta_relatorio_colunar(dados, com_tipos_erro=True):
+    """ Monta o relatório no formato colunar: cada nível é um objeto {'colunas', 'valores'} com um vetor
+        por coluna, e as linhas de um nível apontam para a linha do nível superior pela posição """
+
+    if not dados['sets']:
+        return []
+
+    totais_set, totais_golpe = _totais(dados)
+    if sum(total[0] for total in totais_set.values()) == 0:
+        return []
+
+    sets = [[], [], [], [], []]
+    golpes = [[], [], [], [], []]
+    quadrantes = [[], [], [], []]
+    tipos_erro = [[], [], []]
+    descricoes_golpe = {}
+    descricoes_quadrante = {}
+    descricoes_tipo_erro = {}
+
+    for set_id, ordem in dados['sets']:
+        jogadas_set, acertos_set, erros_set = totais_set[set_id]
+        linha_set = len(sets[0])
+        for coluna, valor in zip(sets, (set_id, ordem, jogadas_set, acertos_set, erros_set)):
+            coluna.append(valor)
+
+        for golpe_id, golpe, quantidade_jogada in dados['golpes'].get(set_id, []):
+            acertos_golpe, erros_golpe = totais_golpe[(set_id, golpe_id)]
+            descricoes_golpe[golpe_id] = golpe
+            linha_golpe = len(golpes[0])
+            for coluna, valor in zip(golpes, (linha_set, golpe_id, quantidade_jogada, acertos_golpe, erros_golpe)):
+                coluna.append(valor)
+
+            for quadrante_id, descricao, acerto, quantidade in dados['quadrantes'].get((set_id, golpe_id), []):
+                descricoes_quadrante[quadrante_id] = descricao
+                linha_quadrante = len(quadrantes[0])
+                for coluna, valor in zip(quadrantes, (linha_golpe, quadrante_id, 1 if acerto else 0, quantidade)):
+                    coluna.append(valor)
+
+                if acerto or not com_tipos_erro:
+                    continue
+
+                for tipo_erro_id, descricao_erro, quantidade_erro in dados['tipos_erro'].get((set_id, golpe_id, quadrante_id), []):
+                    descricoes_tipo_erro[tipo_erro_id] = descricao_erro
+                    for coluna, valor in zip(tipos_erro, (linha_quadrante, tipo_erro_id, quantidade_erro)):
+                        coluna.append(valor)
+
+    def dicionario(descricoes):
+        ids = sorted(descricoes)
+        return {'colunas': ['id', 'descricao'], 'valores': [ids, [descricoes[chave] for chave in ids]]}
+
+    cabecalho = dados['cabecalho']
+    output_partida = {}
+    output_partida['formato'] = FORMATO_COLUNAR
+    output_partida['versao'] = 1
+    output_partida['partida'] = {
+        'colunas': ['partida_id', 'data', 'tipo_jogo', 'modalidade', 'nome', 'jogador'],
+        'valores': [[valor] for valor in cabecalho],
+    }
+    output_partida['sets'] = {'colunas': ['set_id', 'ordem', 'total', 'acertos', 'erros'], 'valores': sets}
+    output_partida['golpes'] = {'colunas': ['set', 'golpe_id', 'total', 'acertos', 'erros'], 'valores': golpes}
+    output_partida['quadrantes'] = {'colunas': ['golpe', 'quadrante_id', 'acerto', 'total'], 'valores': quadrantes}
+    output_partida['dicionarios'] = {
+        'golpe': dicionario(descricoes_golpe),
+        'quadrante': dicionario(descricoes_quadrante),
+    }
+    if com_tipos_erro:
+        output_partida['tipos_erro'] = {'colunas': ['quadrante', 'tipo_erro_id', 'quantidade'], 'valores': tipos_erro}
+        output_partida['dicionarios']['tipo_erro'] = dicionario(descricoes_tipo_erro)
+
+    return output_partida
@@ -0,0 +1,108 @@
+""" Formatos de resposta da API
+
+As respostas JSON são codificadas com orjson, quando instalado, ou com o
+módulo json da biblioteca padrão. Datas são sempre devolvidas no formato
+dd-mm-aaaa, de modo que as rotas podem repassar os valores do banco sem
+formatá-los registro a registro.
+"""
+
+import datetime
+import json
+import time
+import uuid
+
+from flask import Response, current_app, request, stream_with_context
+
+from db import get_conexao
+from instrumentacao import medicao_atual
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+NDJSON = 'application/x-ndjson'
+
+# Quantidade de linhas trazidas do cursor do servidor a cada ida ao banco
+LINHAS_POR_LOTE = 200
+
+
+def _padrao(obj):
+    if isinstance(obj, datetime.date):
+        return obj.strftime('%d-%m-%Y')
+    raise TypeError('Objeto do tipo ' + type(obj).__name__ + ' não é serializável em JSON')
+
+
+if orjson is not None:
+    _opcoes_orjson = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def _codifica(obj):
+        return orjson.dumps(obj, default=_padrao, option=_opcoes_orjson)
+
+else:
+    def _codifica(obj):
+        return json.dumps(obj, default=_padrao, sort_keys=True, separators=(',', ':'),
+                          ensure_ascii=False).encode('utf-8')
+
+
+def codifica(obj):
+    """ Devolve obj codificado em JSON (bytes UTF-8, chaves ordenadas) """
+
+    inicio = time.perf_counter()
+    corpo = _codifica(obj)
+
+    medicao = medicao_atual()
+    if medicao is not None:
+        medicao.tempo_serializacao += time.perf_counter() - inicio
+    return corpo
+
+
+def resposta_json(corpo, status=200):
+    """ Devolve uma resposta com um corpo JSON já codificado (bytes de `codifica`) """
+
+    return current_app.response_class(corpo + b'\n', status=status, mimetype='application/json')
+
+
+def jsonify(*args, **kwargs):
+    """ Substitui flask.jsonify usando o codificador da API """
+
+    if args and kwargs:
+        raise TypeError('jsonify() aceita argumentos posicionais ou nomeados, não ambos')
+    if len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+
+    return resposta_json(codifica(data))
+
+
+def quer_ndjson():
+    """ Indica se o cliente pediu a resposta em NDJSON (cabeçalho Accept: application/x-ndjson) """
+
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def resposta_ndjson(bloco, tupla, monta):
+    """ Executa a consulta em um cursor nomeado (do lado do servidor) e devolve uma resposta em
+        streaming com um objeto JSON por linha, montando os registros lote a lote com `monta(cursor, linhas)` """
+
+    connection = get_conexao()
+    cursor_servidor = connection.cursor(name='ndjson_' + uuid.uuid4().hex)
+    cursor_servidor.execute(bloco, tupla)
+
+    def gera():
+        cursor = connection.cursor()
+        try:
+            while True:
+                linhas = cursor_servidor.fetchmany(LINHAS_POR_LOTE)
+                if not linhas:
+                    break
+
+                for registro in monta(cursor, linhas):
+                    yield codifica(registro) + b'\n'
+        finally:
+            cursor.close()
+            cursor_servidor.close()
+
+    return Response(stream_with_context(gera()), mimetype=NDJSON)
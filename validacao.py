@@ -0,0 +1,259 @@
+""" Schemas JSON dos corpos das requisições e do arquivo de configuração
+
+Cada schema é verificado e compilado em um validador uma única vez, na
+importação do módulo, e o mesmo validador é reutilizado por todas as
+requisições (jsonschema.validate verifica o schema e cria um validador a cada
+chamada).
+"""
+
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+
+def compila(schema):
+    """ Verifica o schema e devolve um validador reutilizável (da mesma versão que jsonschema.validate usaria) """
+
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
+def valida(validador, data):
+    """ Levanta ValidationError (o mesmo erro que jsonschema.validate levantaria) se data não for válido """
+
+    erro = best_match(validador.iter_errors(data))
+    if erro is not None:
+        raise erro
+
+
+schema_jogador = {
+    "type": "object",
+    "required": [ "nome", "data_nascimento", "telefone", "email", "lateralidade", "foto"],
+    "properties": {
+        "nome": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 200
+        },
+        "data_nascimento": {
+            "type": "string",
+            "format": "date"
+        },
+        "telefone": {
+            "type": "string",
+            "minLength": 0,
+            "maxLength": 12
+        },
+        "email": {
+            "type": "string",
+            "minLength": 0,
+            "maxLength": 100
+        },
+        "lateralidade": {
+            "type": "string",
+            "enum": ["naoinformado", "destro", "canhoto", "ambidestro"]
+        },
+        "foto": {
+            "type": "string",
+            "minLength": 0,
+        }
+    }
+}
+
+
+
+schema_jogadores = {
+    "type": "array",
+    "minItems": 1,
+    "maxItems": 2000,
+    "items": schema_jogador
+}
+
+schema_partida = {
+    "type": "object",
+    "required": ["nome", "data", "tipo_jogo", "modalidade", "jogador_1", "jogador_2", "jogador_adversario_1",  "jogador_adversario_2"],
+    "properties": {
+        "nome": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 200
+        },
+        "data": {
+            "type": "string",
+            "format": "date"
+        },
+        "tipo_jogo": {
+            "type": "string",
+            "enum": ["simples", "dupla"]
+        },
+        "modalidade": {
+            "type": "string",
+            "enum": ["misto", "feminino", "masculino"]
+        },
+        "jogador_1": {
+            "type": "integer",
+            "minimum": 1,
+            "exclusiveMaximum": 999999999
+        },
+        "jogador_2": {
+            "type": "integer",
+        },
+        "jogador_adversario_1": {
+            "type": "integer",
+            "minimum": 1,
+            "exclusiveMaximum": 999999999
+        },
+        "jogador_adversario_2": {
+            "type": "integer",
+        }
+    }
+}
+
+
+schema_jogada = {
+    "type": "object",
+    "required": ["set", "golpe", "quadrante", "acerto"],
+    "properties": {
+        "set": {
+            "type": "integer",
+            "minimum": 1,
+            "exclusiveMaximum": 999999999
+        },
+        "golpe": {
+            "type": "integer",
+            "minimum": 1,
+            "exclusiveMaximum": 999999999
+        },
+        "quadrante": {
+            "type": "integer",
+            "minimum": 1,
+            "exclusiveMaximum": 999999999
+        },
+        "tipoerro": {
+            "type": "integer",
+            "minimum": 0,
+            "exclusiveMaximum": 999999999
+        },
+        "acerto": {
+            "type": "boolean",
+        }
+    }
+}
+
+
+schema_jogadas = {
+    "type": "array",
+    "minItems": 1,
+    "maxItems": 5000,
+    "items": schema_jogada
+}
+
+
+schema_config = {
+    "title": "config",
+    "type": "object",
+    "required": [ "SECRET_KEY", "DATABASE_HOST", "DATABASE_NAME", "DATABASE_USER", "DATABASE_PASSWORD", "URLMEDIA", "UPLOAD_URL", "UPLOAD_PATH"],
+    "properties": {
+        "SECRET_KEY": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 50
+        },
+        "DATABASE_HOST": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 200
+        },
+        "DATABASE_NAME": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 200
+        },
+        "DATABASE_USER": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 100
+        },
+        "DATABASE_PASSWORD": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 200
+        },
+        "URLMEDIA": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 100
+        },
+        "UPLOAD_URL": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 100
+        },
+        "UPLOAD_PATH": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 100
+        },
+        "UPLOAD_MAX_MB": {
+            "type": "number",
+            "exclusiveMinimum": 0
+        },
+        "UPLOAD_MINIATURAS": {
+            "type": "array",
+            "items": {
+                "type": "integer",
+                "minimum": 16,
+                "maximum": 4096
+            },
+            "maxItems": 8
+        },
+        "DATABASE_POOL_MAX": {
+            "type": "integer",
+            "minimum": 1
+        },
+        "DATABASE_POOL_TIMEOUT": {
+            "type": "number",
+            "minimum": 0
+        },
+        "CACHE_REFERENCIAS_TTL": {
+            "type": "number",
+            "minimum": 0
+        },
+        "CACHE_RELATORIOS_MAX": {
+            "type": "integer",
+            "minimum": 0
+        },
+        "SLOW_QUERY_MS": {
+            "type": "number",
+            "minimum": 0
+        },
+        "SLOW_QUERY_LOG": {
+            "type": "string",
+            "minLength": 1
+        },
+        "SLOW_QUERY_EXPLAIN_AMOSTRA": {
+            "type": "number",
+            "minimum": 0,
+            "maximum": 1
+        },
+        "GROUP_COMMIT": {
+            "type": "boolean"
+        },
+        "GROUP_COMMIT_MAX_LOTE": {
+            "type": "integer",
+            "minimum": 1
+        },
+        "GROUP_COMMIT_MAX_ESPERA_MS": {
+            "type": "number",
+            "minimum": 0
+        },
+    }
+}
+
+
+validador_jogador = compila(schema_jogador)
+validador_jogadores = compila(schema_jogadores)
+validador_partida = compila(schema_partida)
+validador_jogada = compila(schema_jogada)
+validador_jogadas = compila(schema_jogadas)
+validador_config = compila(schema_config)